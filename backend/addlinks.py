@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import re
+from typing import Iterable, List, Set, Tuple
+from urllib.parse import quote, urlsplit, urlunsplit
+
+# Anything JD's crawler can take as a single link; trailing punctuation from prose is dropped
+_LINK_RE = re.compile(r"""(?:https?|ftp)://[^\s<>"'`]+|magnet:\?[^\s<>"'`]+""", re.IGNORECASE)
+_TRAILING = ".,;:!?)]}>'\""
+_BRACKETS = {")": "(", "]": "[", "}": "{"}
+_DEFAULT_PORTS = {"http": 80, "https": 443, "ftp": 21}
+
+# One addLinks call per chunk: bounded by count and by the encoded size, since the
+# Local API receives the links inside a GET query string.
+CHUNK_MAX_LINKS = 100
+CHUNK_MAX_CHARS = 4000
+
+def parse_links(text: str) -> Tuple[List[str], int]:
+    """Entries to send to JD, in paste order, and how many of them are plain lines.
+
+    Recognizable URLs are taken out of their line (dropping the prose around them).
+    A non-empty line without one is passed through as it is: JD's crawler also
+    understands scheme-less hoster links, ``www.`` links, other schemes and text.
+    """
+    entries: List[str] = []
+    plain = 0
+    for line in (text or "").splitlines():
+        found = [_strip_trailing(m.group(0)) for m in _LINK_RE.finditer(line)]
+        if found:
+            entries.extend(found)
+        elif line.strip():
+            entries.append(line.strip())
+            plain += 1
+    return entries, plain
+
+def _strip_trailing(link: str) -> str:
+    """Drop punctuation that ends the sentence around a link. A closing bracket is
+    only dropped when the link has no opener for it, so ``.../Foo_(bar)`` stays whole."""
+    while link and link[-1] in _TRAILING:
+        opener = _BRACKETS.get(link[-1])
+        if opener is not None and link.count(opener) >= link.count(link[-1]):
+            break
+        link = link[:-1]
+    return link
+
+def normalize(link: str) -> str:
+    """Dedup key: scheme and host lower-cased and the default port dropped. Path,
+    query and fragment are kept as they are: hosters put file ids and keys there."""
+    link = link.strip()
+    if link[:7].lower() == "magnet:":
+        return link
+    try:
+        parts = urlsplit(link)
+        host = (parts.hostname or "").lower()
+        port = parts.port
+    except ValueError:
+        return link
+    if not host:
+        return link
+    scheme = parts.scheme.lower()
+    userinfo, at, _ = parts.netloc.rpartition("@")
+    if ":" in host:
+        host = f"[{host}]"  # IPv6 literal
+    netloc = host if port is None or _DEFAULT_PORTS.get(scheme) == port else f"{host}:{port}"
+    return urlunsplit((scheme, userinfo + at + netloc, parts.path, parts.query, parts.fragment))
+
+def dedup(links: Iterable[str], known: Set[str]) -> Tuple[List[str], int, int]:
+    """Drop repeats within ``links`` and links whose key is in ``known``.
+
+    Returns (kept, repeated_in_paste, already_known).
+    """
+    kept: List[str] = []
+    seen: Set[str] = set()
+    repeated = existing = 0
+    for link in links:
+        key = normalize(link)
+        if key in seen:
+            repeated += 1
+        elif key in known:
+            existing += 1
+            seen.add(key)
+        else:
+            seen.add(key)
+            kept.append(link)
+    return kept, repeated, existing
+
+def chunk(links: List[str], max_links: int = CHUNK_MAX_LINKS, max_chars: int = CHUNK_MAX_CHARS) -> List[List[str]]:
+    chunks: List[List[str]] = []
+    current: List[str] = []
+    used = 0
+    for link in links:
+        cost = len(quote(link, safe="")) + 3  # url-encoded "\n" separator
+        if current and (len(current) >= max_links or used + cost > max_chars):
+            chunks.append(current)
+            current, used = [], 0
+        current.append(link)
+        used += cost
+    if current:
+        chunks.append(current)
+    return chunks
@@ -1,14 +1,35 @@
 from __future__ import annotations
 
+import atexit
+import fnmatch
+import functools
+import hashlib
+import hmac
+import json
 import os
+import threading
 import time
-from typing import List, Optional
+from typing import Callable, Dict, List, Optional, Tuple
 
-import requests
-from flask import Flask, flash, g, jsonify, redirect, render_template, request, session, url_for
+from flask import (
+    Flask, Response, abort, before_render_template, flash, g, jsonify, make_response, redirect, render_template, request,
+    send_from_directory, session, template_rendered, url_for,
+)
 
-from .config_manager import ConfigManager
+from .archive import PackageArchive
+from .assets import AssetManifest
+from .cache import TTLCache
+from .commands import ACTIONS, CommandQueue, Job
+from . import addlinks, discovery, fanout, metrics, timing, wire
+from . import health as health_mod
+from .config_manager import ConfigManager, thaw
+from .events import CrawlWatch, Event, EventEngine
+from .history import PackageHistory
 from .providers.local_api import LocalProvider
+from .providers.registry import ProviderRegistry
+from .shared import SharedSlot
+from .snapshot import Snapshot, SnapshotPoller, diff_rows
+from .webhooks import WebhookDispatcher
 
 _ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 app = Flask(
@@ -18,76 +39,474 @@ app = Flask(
 )
 app.secret_key = os.environ.get("FLASK_SECRET", "change-me")
 
+# Fingerprinted static URLs (see assets.py); templates link files with asset_url()
+assets = AssetManifest(app.static_folder)
+app.jinja_env.globals["asset_url"] = assets.url
+ASSET_MAX_AGE = 365 * 24 * 3600
+# What the service worker stores on install: everything base.html loads
+SHELL_ASSETS = (
+    "vendor/bootstrap-5.3.3/bootstrap.min.css",
+    "app.css",
+    "vendor/bootstrap-5.3.3/bootstrap.bundle.min.js",
+)
+
 cfg_mgr = ConfigManager()
+cfg_mgr.check_writable()
+providers = ProviderRegistry()
 
-def _get_active_local_provider():
-    res = g.cfg
-    inst = cfg_mgr.get_active_instance(res.config)
+def _get_instance(instance_id: Optional[str] = None):
+    """The instance with ``instance_id``, or the active one when not given."""
+    if instance_id:
+        for inst in g.cfg.config.get("instances") or []:
+            if inst.get("id") == instance_id:
+                return inst
+        raise RuntimeError(f"Unknown instance '{instance_id}'.")
+    inst = cfg_mgr.get_active_instance(g.cfg.config)
     if not inst:
         raise RuntimeError("No active instance configured.")
+    return inst
+
+def _get_active_local_provider(instance_id: Optional[str] = None) -> LocalProvider:
+    inst = _get_instance(instance_id)
     p = inst.get("providers", {}).get("primary", {})
     if (p.get("type") or "").lower() != "local":
         raise RuntimeError("Primary provider is not local (only local is supported in v0.1).")
-    base_url = p.get("base_url") or ""
-    timeout_ms = int(p.get("timeout_ms") or 800)
-    return LocalProvider(base_url=base_url, timeout_ms=timeout_ms)
+    behavior = g.cfg.config.get("behavior", {})
+    health_interval = int(behavior.get("health_interval_ms") or 10000) / 1000.0
+    return providers.get(inst, health_interval=health_interval, failover=bool(behavior.get("failover_on_unreachable")))
 
-def _test_jd_help(base_url: str, timeout_ms: int = 800) -> tuple[bool, str]:
-    base_url = (base_url or "").strip().rstrip("/")
-    if not base_url:
-        return False, "Base URL is empty."
+# One poller per (instance, query), shared by every client (see snapshot.py).
+_POLLED_QUERIES = {
+    "packages": "get_packages",
+    "linkgrabber": "get_linkgrabber_links",
+}
+_pollers: Dict[Tuple[str, str], Tuple[tuple, SnapshotPoller]] = {}
+_pollers_lock = threading.Lock()
+# With several worker processes (gunicorn -w N), one of them polls JD per snapshot
+# and the others read what it publishes (see shared.py)
+_shared_dir: Optional[str] = None
+if int(os.environ.get("JD_MOBILE_WORKERS") or 1) > 1:
+    _shared_dir = str(cfg_mgr.path.parent / "shared")
     try:
-        r = requests.get(f"{base_url}/help", timeout=max(0.1, timeout_ms / 1000.0))
-        if r.status_code != 200:
-            return False, f"HTTP {r.status_code} from {base_url}/help"
-        # Light validation
-        body = r.text.lower()
-        if "jdownloader" not in body and "downloads" not in body and "linkgrabber" not in body:
-            return True, "Connected (help endpoint reachable), but response did not contain expected keywords."
-        return True, "Connected."
-    except Exception as e:
-        return False, str(e)
+        os.makedirs(_shared_dir, exist_ok=True)
+    except OSError as e:
+        app.logger.warning("shared snapshots disabled (%s): %s", _shared_dir, e)
+        _shared_dir = None
+# Smoothed speed/ETA and sparklines, folded into every package snapshot (see history.py)
+package_history = PackageHistory()
+# Finished and removed packages, searchable after JD forgets them (see archive.py)
+package_archive = PackageArchive(str(cfg_mgr.path.parent / "history.sqlite3"))
+atexit.register(package_archive.flush)
+# Package/LinkGrabber events for webhooks and in-process subscribers (see events.py)
+event_engine = EventEngine()
+crawl_watch = CrawlWatch(event_engine)
+webhooks = WebhookDispatcher(str(cfg_mgr.path.parent / "webhooks-dead-letter.jsonl"))
+metrics.Gauge("jdmobile_webhook_queue", "Webhook deliveries waiting or being sent.", fn=webhooks.pending)
+
+def _packages_with_history(provider, inst_id: str):
+    rows = provider.get_packages()
+    package_archive.observe(inst_id, rows)
+    return package_history.annotate(inst_id, rows)
+
+# JD actions are queued and sent in merged batches, in order per instance (see commands.py)
+commands = CommandQueue()
+# Snapshots an action changes, refreshed once its upstream call is done
+_ACTION_SNAPSHOTS = {
+    "remove_packages": ("packages",),
+    "cleanup_packages": ("packages",),
+    "start_links": ("packages", "linkgrabber"),
+    "remove_links": ("linkgrabber",),
+}
+# Jobs remembered per browser session, so failures can be reported on the next page
+SESSION_JOBS_MAX = 50
+
+def _enqueue(action: str, ids: List[int], extra: Optional[List[int]] = None, instance_id: Optional[str] = None) -> Job:
+    inst_id = _get_instance(instance_id).get("id") or "primary"
+    pollers = [_get_poller(kind, instance_id) for kind in _ACTION_SNAPSHOTS[action]]
+
+    def refresh():
+        for poller in pollers:
+            poller.invalidate()
+
+    job = commands.submit(inst_id, action, _get_active_local_provider(instance_id), ids, extra, on_done=refresh)
+    session["jobs"] = (session.get("jobs") or [])[-(SESSION_JOBS_MAX - 1):] + [job.id]
+    return job
+
+def _flash_failed_jobs() -> None:
+    """Report queued actions of this session that failed; forget the finished ones."""
+    job_ids = session.get("jobs") or []
+    if not job_ids:
+        return
+    keep = []
+    for job in commands.get(job_ids):
+        if job.status == "failed":
+            flash(f"Failed to {job.action.replace('_', ' ')} ({len(job.ids)}): {job.error}", "danger")
+        elif job.status != "done":
+            keep.append(job.id)
+    session["jobs"] = keep
+
+def _get_poller(kind: str, instance_id: Optional[str] = None) -> SnapshotPoller:
+    inst = _get_instance(instance_id)
+    interval = int(g.cfg.config.get("behavior", {}).get("poll_interval_ms") or 2000) / 1000.0
+    provider = _get_active_local_provider(inst.get("id"))
+    key = (id(provider), interval)
+    inst_id = inst.get("id") or "primary"
+    with _pollers_lock:
+        entry = _pollers.get((inst_id, kind))
+        if entry is not None and entry[0] == key:
+            return entry[1]
+        if kind == "packages":
+            fetch = functools.partial(_packages_with_history, provider, inst_id)
+        else:
+            fetch = getattr(provider, _POLLED_QUERIES[kind])
+        shared = SharedSlot(_shared_dir, f"{inst_id}-{kind}") if _shared_dir else None
+        poller = SnapshotPoller(fetch, interval=interval, name=f"{kind}-{inst_id}", shared=shared)
+        if entry is not None:
+            entry[1].stop()
+        _pollers[(inst_id, kind)] = (key, poller)
+        return poller
+
+# While anything listens for events, every enabled instance's package and LinkGrabber
+# pollers stay subscribed (and so keep polling) and each new snapshot is diffed.
+# With several worker processes only the one fetching a snapshot emits its events.
+_event_watch: Dict[Tuple[str, str], Tuple[SnapshotPoller, Callable[[], None]]] = {}
+_event_versions: Dict[Tuple[str, str], Tuple[int, int]] = {}
+_event_watch_lock = threading.Lock()
+_event_watch_cfg = None
+_webhook_hooks: List[dict] = []
+_webhook_unsubscribe: Optional[Callable[[], None]] = None
+
+def _send_webhooks(event: Event) -> None:
+    webhooks.deliver(event, _webhook_hooks)
+
+def _on_snapshot(inst_id: str, kind: str, poller: SnapshotPoller) -> None:
+    snap = poller.snapshot
+    if snap.data is None or _event_versions.get((inst_id, kind)) == (id(poller), snap.version):
+        return
+    _event_versions[(inst_id, kind)] = (id(poller), snap.version)
+    if kind == "packages":
+        event_engine.observe_packages(inst_id, snap.data, emit=poller.leading)
+    else:
+        event_engine.observe_links(inst_id, snap.data, emit=poller.leading)
+
+def _sync_event_watch(force: bool = False) -> None:
+    """Match the watched pollers to the config; cheap when the config is unchanged."""
+    global _event_watch_cfg, _webhook_unsubscribe
+    if g.cfg is _event_watch_cfg and not force:
+        return
+    with _event_watch_lock:
+        _webhook_hooks[:] = thaw(g.cfg.config.get("webhooks") or [])
+        if _webhook_hooks and _webhook_unsubscribe is None:
+            _webhook_unsubscribe = event_engine.subscribe(_send_webhooks)
+        elif not _webhook_hooks and _webhook_unsubscribe is not None:
+            _webhook_unsubscribe()
+            _webhook_unsubscribe = None
+        wanted = {}
+        if event_engine.subscribed and not g.cfg.needs_setup:
+            for inst in g.cfg.config.get("instances") or []:
+                if not inst.get("enabled"):
+                    continue
+                for kind in _POLLED_QUERIES:
+                    try:
+                        wanted[(inst.get("id"), kind)] = _get_poller(kind, inst.get("id"))
+                    except RuntimeError as e:
+                        app.logger.warning("events: not watching %s %s: %s", inst.get("id"), kind, e)
+        for key, (poller, unsubscribe) in list(_event_watch.items()):
+            if wanted.get(key) is not poller:
+                unsubscribe()
+                del _event_watch[key]
+        for key, poller in wanted.items():
+            if key not in _event_watch:
+                _event_watch[key] = (poller, poller.subscribe(functools.partial(_on_snapshot, key[0], key[1], poller)))
+        _event_watch_cfg = g.cfg
+
+def _resync_event_watch() -> None:
+    with app.app_context():
+        g.cfg = cfg_mgr.load()
+        _sync_event_watch(force=True)
+
+def subscribe_events(fn: Callable[[Event], None], types: Optional[List[str]] = None) -> Callable[[], None]:
+    """In-process event subscription: ``fn(event)`` runs on a poller thread for each
+    event (keep it short). Returns the unsubscribe function."""
+    unsubscribe = event_engine.subscribe(fn, types)
+    _resync_event_watch()
+
+    def stop() -> None:
+        unsubscribe()
+        _resync_event_watch()
+    return stop
+
+def _raise(msg: str):
+    raise RuntimeError(msg)
+
+def _snapshot_data(poller: SnapshotPoller):
+    snap = poller.get()
+    if snap.error and snap.data is None:
+        raise RuntimeError(snap.error)
+    return {"rows": snap.data or [], "stale": snap.error, "version": snap.version}
+
+def _all_packages():
+    """Package lists from every enabled instance, queried concurrently.
+
+    Rows are tagged with ``instance`` (and ``key`` = "instance:uuid"); failed or
+    slow instances are reported in the status list instead of failing the page,
+    with their last-known rows marked stale when their poller has any.
+    """
+    calls = []
+    pollers: Dict[str, SnapshotPoller] = {}
+    for inst in g.cfg.config.get("instances") or []:
+        if not inst.get("enabled"):
+            continue
+        inst_id = inst.get("id")
+        name = inst.get("name") or inst_id
+        deadline = int(((inst.get("providers") or {}).get("primary") or {}).get("timeout_ms") or 800) / 1000.0 + 0.25
+        try:
+            poller = _get_poller("packages", inst_id)
+            # One upstream round trip (at the instance's current adaptive timeout) plus a little slack
+            deadline = _get_active_local_provider(inst_id).timeout_for("downloadsV2/queryPackages") + 0.25
+        except Exception as e:
+            calls.append((inst_id, name, deadline, functools.partial(_raise, str(e))))
+            continue
+        pollers[inst_id] = poller
+        calls.append((inst_id, name, deadline, functools.partial(_snapshot_data, poller)))
+
+    results = fanout.fan_out(calls)
+    rows = []
+    statuses = []
+    for res in results:
+        st = res.status()
+        poller = pollers.get(res.instance_id)
+        if not res.ok and poller is not None and poller.snapshot.data is not None:
+            # Missed the deadline (the refresh may still be retrying) or failed: show
+            # what the poller last had rather than dropping the instance's rows
+            snap = poller.snapshot
+            res.ok = True
+            res.data = {"rows": snap.data, "stale": res.error or snap.error or "Timed out", "version": snap.version}
+            st["age"] = round(snap.age or 0.0, 3)
+        if res.ok:
+            # An unreachable instance still contributes its last-known rows, marked stale
+            st["stale"] = bool(res.data["stale"])
+            st["version"] = res.data["version"]
+            if res.data["stale"]:
+                st["ok"] = False
+                st["error"] = res.data["stale"]
+            for p in res.data["rows"]:
+                rows.append({**p, "instance": res.instance_id, "key": f"{res.instance_id}:{p.get('uuid', '')}"})
+        statuses.append(st)
+    return rows, statuses
+
+def _encode_rows(rows: List[Dict]) -> object:
+    """Rows in the wire format the client asked for (``?fields=a,b`` and ``?format=columnar``)."""
+    return wire.encode_rows(rows, wire.parse_fields(request.args.get("fields")), request.args.get("format", ""))
+
+def _snapshot_response(poller: SnapshotPoller, snap: Snapshot, list_key: str):
+    """JSON response for a list snapshot with ETag/304 and ``?since=<version>`` deltas."""
+    etag = str(snap.version)
+    # Weak match: compressed responses carry the version as a weak ETag
+    if request.if_none_match.contains_weak(etag):
+        resp = Response(status=304)
+        resp.set_etag(etag)
+        return resp
+    body: Dict[str, object] = {"ok": True, "version": snap.version, "age": round(snap.age or 0.0, 3)}
+    if snap.error:
+        # Upstream is failing: serve the last-known data, flagged as stale
+        body["stale"] = True
+        body["error"] = snap.error
+    since = request.args.get("since", "")
+    base = poller.data_at(int(since)) if since.isdigit() else None
+    fields = wire.parse_fields(request.args.get("fields"))
+    if base is not None:
+        body["delta"] = wire.encode_delta(diff_rows(base, snap.data or []), fields, request.args.get("format", ""))
+    else:
+        body[list_key] = _encode_rows(snap.data or [])
+    resp = jsonify(body)
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+# Route metrics. Registered before load_config so setup redirects are timed too.
+_route_seconds = metrics.Histogram(
+    "jdmobile_http_request_seconds",
+    "Time to produce a response (headers, for streams) by route, method and status.",
+    ("route", "method", "status"),
+)
+_in_flight = metrics.Gauge("jdmobile_http_requests_in_flight", "Requests being handled right now (busy gthread workers).")
+metrics.Gauge("jdmobile_threads", "Live Python threads in this worker process.", fn=threading.active_count)
+
+@app.before_request
+def _metrics_start():
+    g.started = time.perf_counter()
+    _in_flight.inc()
+
+@app.after_request
+def _metrics_observe(resp: Response):
+    rule = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    _route_seconds.observe(time.perf_counter() - g.started, route=rule, method=request.method, status=str(resp.status_code))
+    return resp
+
+@app.teardown_request
+def _metrics_done(exc=None):
+    if "started" in g:
+        _in_flight.dec()
+
+# Opt-in phase timing (see timing.py): behavior.server_timing adds a Server-Timing
+# header, behavior.slow_request_ms logs slow requests with their phases, and
+# ?profile=1 (admin only) answers with a cProfile report instead of the page.
+def _is_admin() -> bool:
+    token = os.environ.get("JD_MOBILE_ADMIN_TOKEN", "")
+    # Header only: a query parameter would end up in access logs and browser history
+    given = request.headers.get("X-Admin-Token", "")
+    return bool(token) and hmac.compare_digest(given.encode(), token.encode())
+
+def _start_timing(behavior, cfg_seconds: float):
+    profile = request.args.get("profile") == "1"
+    if not (profile or behavior.get("server_timing") or behavior.get("slow_request_ms")):
+        return None
+    if profile and not _is_admin():
+        return jsonify({"ok": False, "error": "Profiling needs the admin token (JD_MOBILE_ADMIN_TOKEN)."}), 403
+    g.timer, g.timer_token = timing.start()
+    g.timer.add("cfg", cfg_seconds)
+    if profile and not g.timer.start_profile():
+        return jsonify({"ok": False, "error": "Another request is being profiled."}), 409
+    return None
+
+@before_render_template.connect_via(app)
+def _render_started(sender, template, context, **extra):
+    if timing.current() is not None:
+        g.render_started = time.perf_counter()
+
+@template_rendered.connect_via(app)
+def _render_done(sender, template, context, **extra):
+    if "render_started" in g:
+        timing.record("render", time.perf_counter() - g.pop("render_started"), template.name or "")
+
+@app.after_request
+def _timing_done(resp: Response):
+    timer = g.get("timer")
+    if timer is None:
+        return resp
+    report = timer.stop_profile()
+    if report is not None:
+        resp = Response(report, mimetype="text/plain")
+    behavior = g.cfg.config.get("behavior", {})
+    if report is not None or behavior.get("server_timing"):
+        resp.headers["Server-Timing"] = timer.header()
+    slow_ms = behavior.get("slow_request_ms") or 0
+    total = time.perf_counter() - timer.started
+    if slow_ms and total * 1000 >= slow_ms:
+        app.logger.warning(
+            "slow request: %s %s -> %s in %.0fms (%s)",
+            request.method, request.path, resp.status_code, total * 1000, timer.summary(),
+        )
+    return resp
+
+@app.teardown_request
+def _timing_reset(exc=None):
+    timer = g.get("timer")
+    if timer is not None:
+        timing.stop(timer, g.timer_token)
+
+# Registered after the metrics and timing hooks so it runs first and its time is counted
+@app.after_request
+def _compress(resp: Response):
+    with timing.span("compress"):
+        return wire.compress(resp, request.accept_encodings)
 
 @app.before_request
 def load_config():
+    # Scrapes must work before setup and never depend on the config file
+    if request.endpoint == "metrics":
+        return None
+    started = time.perf_counter()
     g.cfg = cfg_mgr.load()
-    # Ensure /app/config is writable (common misconfig)
-    config_dir = os.path.dirname(g.cfg.path)
-    try:
-        os.makedirs(config_dir, exist_ok=True)
-        test_path = os.path.join(config_dir, ".write_test")
-        with open(test_path, "w", encoding="utf-8") as f:
-            f.write(str(time.time()))
-        os.remove(test_path)
-        g.config_writable = True
-    except Exception:
-        g.config_writable = False
-
-    if g.cfg.needs_setup and not request.path.startswith("/setup") and not request.path.startswith("/static"):
+    _sync_event_watch()
+    timed = _start_timing(g.cfg.config.get("behavior", {}), time.perf_counter() - started)
+    if timed is not None:
+        return timed
+    # Writability of /app/config (common misconfig) is probed at startup and after failed saves
+    g.config_writable = bool(cfg_mgr.writable)
+
+    if g.cfg.needs_setup and not request.path.startswith(("/setup", "/static", "/assets/", "/sw.js")):
         return redirect(url_for("setup"))
 
+@app.get("/assets/<path:name>")
+def asset(name: str):
+    found = assets.resolve(name)
+    if found is None:
+        abort(404)
+    path, current = found
+    if not current:
+        # A page from before a deploy: serve today's file, but don't let it be cached as the old one
+        return send_from_directory(app.static_folder, path, max_age=0)
+    resp = send_from_directory(app.static_folder, path, max_age=ASSET_MAX_AGE)
+    resp.cache_control.public = True
+    resp.cache_control.immutable = True
+    return resp
+
+@app.get("/sw.js")
+def service_worker():
+    """Served from the root so its scope covers every page; never cached by the browser,
+    so a deploy (new asset hashes, new cache name) is picked up on the next visit."""
+    resp = make_response(render_template(
+        "sw.js",
+        cache_version=assets.version(SHELL_ASSETS),
+        shell_assets=[assets.url(p) for p in SHELL_ASSETS],
+    ))
+    resp.mimetype = "application/javascript"
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
 @app.get("/setup")
 def setup():
     # v0.1: manual setup only. Auto-detect comes in v0.2.
+    if not g.config_writable:
+        # Re-probe so a fixed mount is picked up without a restart (only while broken)
+        g.config_writable = cfg_mgr.check_writable()
     return render_template(
         "setup.html",
         title=g.cfg.config.get("ui", {}).get("title", "JD-Mobile"),
         cfg=g.cfg,
         config_writable=g.config_writable,
+        default_cidr=discovery.default_cidr(),
+        default_port=discovery.DEFAULT_PORT,
     )
 
+@app.get("/setup/scan")
+def setup_scan():
+    """Stream discovered JD instances as NDJSON lines while the scan runs."""
+    if request.args.get("confirm") != "1":
+        return jsonify({"ok": False, "error": "Scanning requires explicit confirmation."}), 400
+    port = request.args.get("port", discovery.DEFAULT_PORT, type=int)
+    cidrs = [c for c in (request.args.get("cidr") or "").replace(",", " ").split() if c]
+    seeds = [h for h in (request.args.get("seeds") or "").replace(",", " ").split() if h]
+    targets, errors = discovery.expand_targets(cidrs, seeds, port=port)
+    if not targets:
+        return jsonify({"ok": False, "error": "; ".join(errors) or "Nothing to scan."}), 400
+
+    def lines():
+        started = time.monotonic()
+        yield json.dumps({"type": "start", "targets": len(targets), "errors": errors}) + "\n"
+        found = 0
+        for res in discovery.scan(targets):
+            found += 1
+            yield json.dumps({"type": "found", **res.to_dict()}) + "\n"
+        elapsed_ms = int((time.monotonic() - started) * 1000)
+        yield json.dumps({"type": "done", "found": found, "elapsed_ms": elapsed_ms}) + "\n"
+
+    return Response(lines(), mimetype="application/x-ndjson", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.post("/setup/manual")
 def setup_manual():
     base_url = (request.form.get("base_url") or "").strip().rstrip("/")
     timeout_ms = int(request.form.get("timeout_ms") or 800)
     name = (request.form.get("name") or "Primary").strip() or "Primary"
 
-    ok, msg = _test_jd_help(base_url, timeout_ms=timeout_ms)
+    ok, msg = health_mod.probe_help(base_url, timeout_ms=timeout_ms)
     if not ok:
         flash(f"Connection test failed: {msg}", "danger")
         return redirect(url_for("setup"))
 
-    cfg = g.cfg.config
+    cfg = thaw(g.cfg.config)
     # Ensure single instance exists
     if not cfg.get("instances"):
         cfg["instances"] = []
@@ -110,6 +529,7 @@ def setup_manual():
         cfg["active_instance_id"] = inst.get("id", "primary")
 
     saved, errors = cfg_mgr.save(cfg)
+    providers.invalidate()
     if not saved:
         flash("Failed to save config: " + "; ".join(errors), "danger")
         return redirect(url_for("setup"))
@@ -119,17 +539,46 @@ def setup_manual():
 
 @app.get("/")
 def index():
-    provider = _get_active_local_provider()
-    try:
-        packages = provider.get_packages()
-    except Exception as e:
-        packages = []
-        flash(f"Failed to query packages: {e}", "danger")
-    return render_template(
+    _flash_failed_jobs()
+    active = cfg_mgr.get_active_instance(g.cfg.config) or {}
+    instances = [{"id": i.get("id"), "name": i.get("name") or i.get("id")} for i in g.cfg.config.get("instances") or [] if i.get("enabled")]
+    current = request.args.get("instance") or active.get("id") or "primary"
+    instance_status = []
+    version = None
+    if current == "all":
+        packages, instance_status = _all_packages()
+        for st in instance_status:
+            if not st["ok"]:
+                flash(f"{st['name']}: {st['error']}", "warning")
+    else:
+        try:
+            snap = _get_poller("packages", current).get()
+        except RuntimeError as e:
+            flash(str(e), "danger")
+            return redirect(url_for("index"))
+        packages = snap.data or []
+        version = snap.version
+        if snap.error and snap.data is None:
+            version = None
+            flash(f"Failed to query packages: {snap.error}", "danger")
+        elif snap.error:
+            flash(f"JDownloader is not answering; showing the list from {int(snap.age or 0)}s ago. ({snap.error})", "warning")
+    # Flashed messages are one-off, so the service worker only keeps pages without any
+    shell = "_flashes" not in session
+    resp = make_response(render_template(
         "index.html",
         title=g.cfg.config.get("ui", {}).get("title", "JD-Mobile"),
         packages=packages,
-    )
+        snapshot_version=version,
+        instances=instances,
+        instance_names={i["id"]: i["name"] for i in instances},
+        instance_status=instance_status,
+        current_instance=current,
+        stream_updates=current == active.get("id") and bool(g.cfg.config.get("behavior", {}).get("stream_updates")),
+    ))
+    if shell:
+        resp.headers["X-App-Shell"] = "1"
+    return resp
 
 @app.get("/add")
 def add_form():
@@ -138,101 +587,235 @@ def add_form():
         title=g.cfg.config.get("ui", {}).get("title", "JD-Mobile"),
     )
 
+# Crawl jobs remembered per browser session (from the last add)
+CRAWL_JOBS_MAX = 50
+# The download list's URLs, for dedup only: reused across adds instead of paging
+# through every link JD has on each submit. A link that reached the download list
+# in the meantime may slip through; JD then shows it twice, nothing worse.
+_download_urls = TTLCache(ttl=60.0, max_entries=16, name="download_urls")
+
 @app.post("/add")
 def add_submit():
-    links = (request.form.get("links") or "").strip()
+    text = (request.form.get("links") or "").strip()
     package = (request.form.get("package") or "Mobile").strip()
     dest = (request.form.get("dest") or "").strip() or None
     autostart = (request.form.get("autostart") == "on")
     select_files = (request.form.get("select_files") == "on")
 
+    links, plain = addlinks.parse_links(text)
     if not links:
         flash("Paste one or more links.", "warning")
         return redirect(url_for("add_form"))
 
     provider = _get_active_local_provider()
+    # Skip links JD already has; a failed lookup only costs the dedup, not the add
+    known = set()
     try:
-        # When the user wants to select files, never autostart so links stay in LinkGrabber
-        effective_autostart = autostart and not select_files
-        provider.add_links(links=links, package=package, dest=dest, autostart=effective_autostart)
-        if select_files:
-            flash("Links sent to LinkGrabber. Select the files you want to download below.", "info")
-            return redirect(url_for("links_select"))
-        flash("Links submitted to LinkGrabber.", "success")
+        known.update(addlinks.normalize(l["url"]) for l in _snapshot_data(_get_poller("linkgrabber"))["rows"] if l.get("url"))
+        known.update(_download_urls.get_or_load(id(provider), lambda: {addlinks.normalize(u) for u in provider.get_download_urls()}))
+    except Exception as e:
+        app.logger.warning("add_submit: dedup lookup failed: %s", e)
+    links, repeated, existing = addlinks.dedup(links, known)
+    note = f" Skipped {repeated + existing} duplicate(s)." if repeated + existing else ""
+    if plain and plain < len(links) + repeated + existing:
+        # Mixed paste: say which part JD gets to interpret on its own
+        note += f" {plain} line(s) without a recognized URL were passed on as plain text."
+    if not links:
+        flash(f"Nothing to add: every link is already in JDownloader.{note}", "warning")
+        return redirect(url_for("add_form"))
+
+    # When the user wants to select files, never autostart so links stay in LinkGrabber
+    effective_autostart = autostart and not select_files
+    chunks = addlinks.chunk(links)
+    jobs: List[int] = []
+    sent = 0
+    try:
+        for part in chunks:
+            res = provider.add_links(links="\n".join(part), package=package, dest=dest, autostart=effective_autostart)
+            sent += len(part)
+            data = res.get("data") if isinstance(res, dict) else None
+            if isinstance(data, dict) and data.get("id") is not None:
+                jobs.append(int(data["id"]))
     except Exception as e:
-        flash(f"Failed to add links: {e}", "danger")
+        flash(f"Failed to add links after {sent} of {len(links)}: {e}", "danger")
+        if not sent:
+            return redirect(url_for("add_form"))
+    finally:
+        _get_poller("packages").invalidate()
+        _get_poller("linkgrabber").invalidate()
+    # The select page watches these crawl jobs instead of polling blindly
+    session["crawl_jobs"] = jobs[-CRAWL_JOBS_MAX:]
+    if jobs and event_engine.subscribed:
+        crawl_watch.watch(_get_instance().get("id") or "primary", provider, jobs)
 
+    if select_files:
+        flash(f"{sent} link(s) sent to LinkGrabber.{note} Select the files you want to download below.", "info")
+        return redirect(url_for("links_select"))
+    flash(f"{sent} link(s) submitted to LinkGrabber.{note}", "success")
     return redirect(url_for("index"))
 
+@app.get("/api/linkgrabber/jobs")
+def api_crawl_jobs():
+    """State of the crawl jobs started by this session's last add; ``done`` once JD
+    has finished crawling and checking all of them."""
+    job_ids = [int(j) for j in session.get("crawl_jobs") or []]
+    if not job_ids:
+        return jsonify({"ok": True, "jobs": [], "done": True})
+    try:
+        jobs = _get_active_local_provider().get_crawl_jobs(job_ids)
+    except Exception as e:
+        app.logger.error("api_crawl_jobs error: %s", e)
+        return jsonify({"ok": False, "error": "Failed to fetch crawl jobs", "jobs": []}), 502
+    done = all(not j.get("crawling") and not j.get("checking") for j in jobs)
+    if done:
+        # Finished jobs are gone for good; new links have landed in LinkGrabber
+        session.pop("crawl_jobs", None)
+        _get_poller("linkgrabber").invalidate()
+    return jsonify({"ok": True, "jobs": jobs, "done": done})
+
+
+LINK_SELECT_PAGE = 100
+# Selections are kept in the (cookie) session only while they are small enough to fit
+SESSION_SELECTION_MAX = 200
+
+def _int_ids(values) -> set:
+    ids = set()
+    for i in values:
+        try:
+            ids.add(int(i))
+        except (ValueError, TypeError):
+            pass
+    return ids
+
+def _filter_links(links, q: str = "", host: str = "", availability: str = "", pattern: str = ""):
+    q = q.strip().lower()
+    host = host.strip().lower()
+    availability = availability.strip().upper()
+    pattern = pattern.strip().lower()
+    out = []
+    for l in links:
+        name = str(l.get("name") or l.get("url") or "").lower()
+        if q and q not in name:
+            continue
+        if host and str(l.get("host") or "").lower() != host:
+            continue
+        if availability and str(l.get("availability") or "").upper() != availability:
+            continue
+        if pattern and not fnmatch.fnmatchcase(name, pattern):
+            continue
+        out.append(l)
+    return out
+
+def _links_at(poller: SnapshotPoller, version: str):
+    """The link list the client was looking at (by snapshot version), or None when it
+    is no longer known. Selections are never applied to a list the user didn't see."""
+    if not version.isdigit():
+        return None
+    data = poller.data_at(int(version))
+    if data is None:
+        snap = poller.get()
+        if snap.error and snap.data is None:
+            raise RuntimeError(snap.error)
+        if snap.version == int(version):
+            data = snap.data or []
+    return data
+
+LIST_CHANGED = "The LinkGrabber list changed since this page loaded. Please review your selection."
 
 @app.get("/links/select")
 def links_select():
-    provider = _get_active_local_provider()
-    try:
-        links = provider.get_linkgrabber_links()
-    except Exception as e:
-        links = []
-        flash(f"Failed to query LinkGrabber links: {e}", "danger")
+    _flash_failed_jobs()
+    snap = _get_poller("linkgrabber").get()
+    links = snap.data or []
+    if snap.error:
+        flash(f"Failed to query LinkGrabber links: {snap.error}", "danger" if snap.data is None else "warning")
     # Restore any previously saved selection (set by links_start on error)
-    selected_ids = session.pop("selected_link_ids", None)
+    selection = session.pop("link_selection", None)
     return render_template(
         "select.html",
         title=g.cfg.config.get("ui", {}).get("title", "JD-Mobile"),
-        links=links,
-        selected_ids=selected_ids,
+        page_size=LINK_SELECT_PAGE,
+        has_links=bool(links),
+        selection=selection,
+        crawling=bool(session.get("crawl_jobs")),
     )
 
 
 @app.get("/api/linkgrabber/links")
 def api_linkgrabber_links():
-    provider = _get_active_local_provider()
-    try:
-        links = provider.get_linkgrabber_links()
-    except Exception as e:
-        app.logger.error("api_linkgrabber_links error: %s", e)
+    poller = _get_poller("linkgrabber")
+    snap = poller.get()
+    if snap.error and snap.data is None:
+        app.logger.error("api_linkgrabber_links error: %s", snap.error)
         return jsonify({"ok": False, "error": "Failed to fetch links", "links": []}), 502
-    return jsonify({"ok": True, "links": links})
+    args = request.args
+    if "limit" not in args and "ids_only" not in args:
+        return _snapshot_response(poller, snap, "links")
+
+    # Paged / filtered view for large crawls
+    links = snap.data or []
+    matched = _filter_links(
+        links,
+        q=args.get("q", ""),
+        host=args.get("host", ""),
+        availability=args.get("availability", ""),
+        pattern=args.get("pattern", ""),
+    )
+    if args.get("ids_only"):
+        return jsonify({"ok": True, "version": snap.version, "ids": [l.get("uuid") for l in matched]})
+    offset = max(0, args.get("offset", 0, type=int))
+    limit = min(500, max(1, args.get("limit", LINK_SELECT_PAGE, type=int)))
+    return jsonify({
+        "ok": True,
+        "version": snap.version,
+        "total": len(matched),
+        "all_total": len(links),
+        "offset": offset,
+        "limit": limit,
+        "links": _encode_rows(matched[offset:offset + limit]),
+        "hosts": sorted({str(l.get("host")) for l in links if l.get("host")}),
+    })
 
 
 @app.post("/links/start")
 def links_start():
-    selected_ids = request.form.getlist("link_id")
-    all_ids = request.form.getlist("all_link_id")
-
-    if not selected_ids:
-        flash("No files selected.", "warning")
+    # The selection arrives as a set relative to the list the client saw:
+    # mode=include -> link_id lists the chosen files, mode=exclude -> the unchosen ones.
+    mode = request.form.get("mode") or "include"
+    marked = _int_ids(request.form.getlist("link_id"))
+    poller = _get_poller("linkgrabber")
+    try:
+        seen = _links_at(poller, request.form.get("version") or "")
+    except Exception as e:
+        flash(f"Failed to query LinkGrabber links: {e}", "danger")
+        return redirect(url_for("links_select"))
+    if seen is None:
+        if len(marked) <= SESSION_SELECTION_MAX:
+            session["link_selection"] = {"mode": mode, "ids": [str(i) for i in sorted(marked)]}
+        flash(LIST_CHANGED, "warning")
         return redirect(url_for("links_select"))
+    all_ids = _int_ids(l.get("uuid") for l in seen)
 
-    link_ids: List[int] = []
-    for i in selected_ids:
-        try:
-            link_ids.append(int(i))
-        except (ValueError, TypeError):
-            pass
+    if mode == "exclude":
+        selected = all_ids - marked
+    else:
+        selected = all_ids & marked
+    unselected = all_ids - selected
 
-    if not link_ids:
-        flash("No valid file IDs found.", "danger")
+    if not selected:
+        flash("No files selected.", "warning")
         return redirect(url_for("links_select"))
 
-    # Determine which links were NOT selected so we can discard them
-    all_link_ids: List[int] = []
-    for i in all_ids:
-        try:
-            all_link_ids.append(int(i))
-        except (ValueError, TypeError):
-            pass
-    unselected_ids = [i for i in all_link_ids if i not in link_ids]
-
-    provider = _get_active_local_provider()
     try:
-        # Remove unselected links from the LinkGrabber queue first
-        if unselected_ids:
-            provider.remove_linkgrabber_links(link_ids=unselected_ids)
-        provider.start_linkgrabber_downloads(link_ids=link_ids)
-        flash(f"Started downloading {len(link_ids)} file(s).", "success")
+        # Unselected links leave the LinkGrabber queue first (the queue keeps the order)
+        if unselected:
+            _enqueue("remove_links", sorted(unselected))
+        _enqueue("start_links", sorted(selected))
+        flash(f"Starting {len(selected)} file(s).", "success")
     except Exception as e:
         # Preserve the user's selection so the page can restore it
-        session["selected_link_ids"] = [str(i) for i in link_ids]
+        if len(marked) <= SESSION_SELECTION_MAX:
+            session["link_selection"] = {"mode": mode, "ids": [str(i) for i in sorted(marked)]}
         flash(f"Failed to start downloads: {e}", "danger")
         return redirect(url_for("links_select"))
 
@@ -241,18 +824,20 @@ def links_start():
 
 @app.post("/links/cancel")
 def links_cancel():
-    all_link_ids = request.form.getlist("all_link_id")
-    link_ids: List[int] = []
-    for i in all_link_ids:
-        try:
-            link_ids.append(int(i))
-        except (ValueError, TypeError):
-            pass
+    poller = _get_poller("linkgrabber")
+    try:
+        seen = _links_at(poller, request.form.get("version") or "")
+    except Exception as e:
+        flash(f"Failed to cancel links: {e}", "danger")
+        return redirect(url_for("links_select"))
+    if seen is None:
+        flash(LIST_CHANGED, "warning")
+        return redirect(url_for("links_select"))
+    link_ids = _int_ids(l.get("uuid") for l in seen)
 
     if link_ids:
-        provider = _get_active_local_provider()
         try:
-            provider.remove_linkgrabber_links(link_ids=link_ids)
+            _enqueue("remove_links", sorted(link_ids))
         except Exception as e:
             flash(f"Failed to cancel links: {e}", "danger")
             return redirect(url_for("links_select"))
@@ -263,45 +848,401 @@ def links_cancel():
 @app.post("/remove")
 def remove_package():
     pkg_id = request.form.get("package_id")
+    instance_id = request.form.get("instance_id") or None
     delete_files = request.form.get("delete_files") == "true"
     if not pkg_id:
         flash("No package specified.", "warning")
-        return redirect(url_for("index"))
+        return _back_to_index()
     try:
         pkg_id_int = int(pkg_id)
     except (ValueError, TypeError):
         flash("Invalid package ID.", "danger")
-        return redirect(url_for("index"))
+        return _back_to_index()
 
-    provider = _get_active_local_provider()
     try:
         if delete_files:
-            provider.cleanup_packages([pkg_id_int])
-            flash("Package removed and files deleted.", "success")
+            _enqueue("cleanup_packages", [pkg_id_int], instance_id=instance_id)
+            flash("Removing package and deleting its files.", "success")
         else:
-            provider.remove_packages([pkg_id_int])
-            flash("Package removed (files kept on disk).", "success")
+            _enqueue("remove_packages", [pkg_id_int], instance_id=instance_id)
+            flash("Removing package (files kept on disk).", "success")
     except Exception as e:
         flash(f"Failed to remove package: {e}", "danger")
 
-    return redirect(url_for("index"))
+    return _back_to_index()
+
+def _package_status(p) -> str:
+    if p.get("running"):
+        return "running"
+    if p.get("finished"):
+        return "finished"
+    return "idle"
+
+def _select_packages(packages, selector: str, ids: List[str], q: str = "", status: str = "") -> List[int]:
+    """Resolve a bulk selection against the package snapshot.
+
+    ``selected`` keeps the given ids that still exist, ``finished`` picks every
+    finished package and ``filter`` matches a case-insensitive name substring
+    and/or a status (running/finished/idle).
+    """
+    if selector == "finished":
+        return [int(p["uuid"]) for p in packages if "uuid" in p and _package_status(p) == "finished"]
+    if selector == "filter":
+        q = q.strip().lower()
+        status = status.strip().lower()
+        if not q and not status:
+            return []
+        return [
+            int(p["uuid"]) for p in packages
+            if "uuid" in p
+            and (not q or q in str(p.get("name") or "").lower())
+            and (not status or _package_status(p) == status)
+        ]
+    wanted = set()
+    for i in ids:
+        try:
+            wanted.add(int(i))
+        except (ValueError, TypeError):
+            pass
+    return [int(p["uuid"]) for p in packages if "uuid" in p and int(p["uuid"]) in wanted]
+
+def _bulk_remove(selector: str, ids: List[str], q: str, status: str, delete_files: bool, instance_id: Optional[str] = None) -> Tuple[List[int], List[Job]]:
+    """Queue removal of the selected packages; returns their ids and the queued jobs.
+
+    With ``instance_id="all"`` the selection is applied to every enabled instance
+    and ``ids`` are "instance:uuid" keys as shown in the all-instances view.
+    """
+    if instance_id == "all":
+        removed: List[int] = []
+        jobs: List[Job] = []
+        for inst in g.cfg.config.get("instances") or []:
+            if not inst.get("enabled"):
+                continue
+            prefix = f"{inst.get('id')}:"
+            inst_ids = [i[len(prefix):] for i in ids if i.startswith(prefix)]
+            if selector == "selected" and not inst_ids:
+                continue
+            inst_removed, inst_jobs = _bulk_remove(selector, inst_ids, q, status, delete_files, inst.get("id"))
+            removed += inst_removed
+            jobs += inst_jobs
+        return removed, jobs
+
+    poller = _get_poller("packages", instance_id)
+    snap = poller.get()
+    if snap.error:
+        raise RuntimeError(snap.error)
+    pkg_ids = _select_packages(snap.data or [], selector, ids, q=q, status=status)
+    if not pkg_ids:
+        return [], []
+    return pkg_ids, [_enqueue("cleanup_packages" if delete_files else "remove_packages", pkg_ids, instance_id=instance_id)]
+
+def _back_to_index():
+    view = request.form.get("view") or ""
+    return redirect(url_for("index", instance=view) if view else url_for("index"))
+
+@app.post("/remove/bulk")
+def remove_packages_bulk():
+    selector = request.form.get("selector") or "selected"
+    delete_files = request.form.get("delete_files") == "true"
+    try:
+        removed, _ = _bulk_remove(
+            selector,
+            request.form.getlist("package_id"),
+            request.form.get("q") or "",
+            request.form.get("status") or "",
+            delete_files,
+            request.form.get("instance_id") or None,
+        )
+    except Exception as e:
+        flash(f"Failed to remove packages: {e}", "danger")
+        return _back_to_index()
+
+    if not removed:
+        flash("No packages matched the selection.", "warning")
+    elif delete_files:
+        flash(f"Removing {len(removed)} package(s) and deleting their files.", "success")
+    else:
+        flash(f"Removing {len(removed)} package(s) (files kept on disk).", "success")
+    return _back_to_index()
+
+@app.post("/api/packages/remove")
+def api_packages_remove():
+    body = request.get_json(silent=True) or {}
+    selector = str(body.get("selector") or "selected")
+    if selector not in ("selected", "finished", "filter"):
+        return jsonify({"ok": False, "error": "selector must be selected, finished or filter"}), 400
+    ids = [str(i) for i in (body.get("package_ids") or [])]
+    try:
+        removed, jobs = _bulk_remove(
+            selector,
+            ids,
+            str(body.get("q") or ""),
+            str(body.get("status") or ""),
+            bool(body.get("delete_files")),
+            str(body.get("instance_id") or "") or None,
+        )
+    except Exception as e:
+        app.logger.error("api_packages_remove error: %s", e)
+        return jsonify({"ok": False, "error": "Failed to remove packages"}), 502
+    return jsonify({"ok": True, "removed": removed, "jobs": [j.id for j in jobs]}), 202
+
+@app.post("/api/commands")
+def api_commands():
+    """Queue a JD action: ``{"action", "ids", "extra"?, "instance_id"?}``. Answers 202
+    with the job; follow it with ``/api/jobs``."""
+    body = request.get_json(silent=True) or {}
+    action = str(body.get("action") or "")
+    if action not in ACTIONS:
+        return jsonify({"ok": False, "error": "action must be one of " + ", ".join(ACTIONS)}), 400
+    try:
+        ids = [int(i) for i in body.get("ids") or []]
+        extra = [int(i) for i in body.get("extra") or []]
+    except (TypeError, ValueError):
+        return jsonify({"ok": False, "error": "ids must be integers"}), 400
+    if not ids and not extra:
+        return jsonify({"ok": False, "error": "No ids given"}), 400
+    try:
+        job = _enqueue(action, ids, extra, str(body.get("instance_id") or "") or None)
+    except RuntimeError as e:
+        return jsonify({"ok": False, "error": str(e)}), 404
+    return jsonify({"ok": True, "job": job.to_dict()}), 202
+
+JOB_WAIT_MAX_S = 10.0
+
+@app.get("/api/jobs")
+def api_jobs():
+    """Status of queued actions: ``?ids=1,2`` (default: this session's). With ``?wait=<s>``
+    the answer is held until they have all finished, up to 10 s."""
+    raw = request.args.get("ids")
+    job_ids = _int_ids(raw.split(",")) if raw else set(session.get("jobs") or [])
+    wait = min(JOB_WAIT_MAX_S, max(0.0, request.args.get("wait", 0.0, type=float)))
+    jobs = commands.wait(sorted(job_ids), wait) if wait else commands.get(sorted(job_ids))
+    return jsonify({
+        "ok": True,
+        "jobs": [j.to_dict() for j in jobs],
+        "done": all(j.status in ("done", "failed") for j in jobs),
+    })
 
 @app.get("/api/packages")
 def api_packages():
-    provider = _get_active_local_provider()
+    instance_id = request.args.get("instance") or None
+    if instance_id == "all":
+        rows, statuses = _all_packages()
+        ok = any(st["ok"] or st.get("stale") for st in statuses)
+        # One ETag for the merged list: it changes with any instance's snapshot or state
+        state = [(st["id"], st.get("version"), st["ok"], st["error"]) for st in statuses]
+        etag = hashlib.sha1(json.dumps(state).encode()).hexdigest()[:16]
+        if ok and request.if_none_match.contains_weak(etag):
+            resp = Response(status=304)
+            resp.set_etag(etag)
+            return resp
+        resp = jsonify({"ok": ok, "packages": _encode_rows(rows), "instances": statuses})
+        if not ok:
+            resp.status_code = 502
+            return resp
+        resp.set_etag(etag)
+        resp.headers["Cache-Control"] = "no-cache"
+        return resp
     try:
-        packages = provider.get_packages()
-    except Exception as e:
-        app.logger.error("api_packages error: %s", e)
+        poller = _get_poller("packages", instance_id)
+    except RuntimeError as e:
+        return jsonify({"ok": False, "error": str(e), "packages": []}), 404
+    snap = poller.get()
+    if snap.error and snap.data is None:
+        app.logger.error("api_packages error: %s", snap.error)
         return jsonify({"ok": False, "error": "Failed to fetch packages", "packages": []}), 502
-    return jsonify({"ok": True, "packages": packages})
+    return _snapshot_response(poller, snap, "packages")
+
+# Each SSE subscriber served here holds one server thread for as long as it is
+# connected (gunicorn runs 8 per worker), so this route takes at most
+# STREAM_THREADS_MAX of them whatever behavior.max_streams says. The async server
+# (asgi.py) holds a task instead and honours max_streams. Refused clients get a 204
+# and fall back to polling.
+STREAM_HEARTBEAT_S = 15.0
+STREAM_LIFETIME_S = 300.0
+STREAM_THREADS_MAX = 2
+_active_streams = 0
+_streams_lock = threading.Lock()
+metrics.Gauge("jdmobile_sse_streams", "Open /api/packages/stream connections.", fn=lambda: _active_streams)
+
+# Per-package link pages, cached briefly so collapsing/expanding a package is free.
+LINK_PAGE_MAX = 200
+_link_pages = TTLCache(ttl=5.0, max_entries=512, name="package_links")
+
+@app.get("/api/packages/<int:package_id>/links")
+def api_package_links(package_id: int):
+    start = max(0, request.args.get("start", 0, type=int))
+    limit = min(LINK_PAGE_MAX, max(1, request.args.get("limit", 50, type=int)))
+    try:
+        provider = _get_active_local_provider(request.args.get("instance") or None)
+    except RuntimeError as e:
+        return jsonify({"ok": False, "error": str(e), "links": []}), 404
+    try:
+        links = _link_pages.get_or_load(
+            (id(provider), package_id, start, limit),
+            lambda: provider.get_package_links(package_id, start=start, limit=limit),
+        )
+    except Exception as e:
+        app.logger.error("api_package_links error: %s", e)
+        return jsonify({"ok": False, "error": "Failed to fetch links", "links": []}), 502
+    return jsonify({"ok": True, "links": links, "start": start, "limit": limit, "more": len(links) >= limit})
+
+def acquire_stream(limit: int) -> bool:
+    """Take one of ``limit`` subscriber slots."""
+    global _active_streams
+    with _streams_lock:
+        if _active_streams >= limit:
+            return False
+        _active_streams += 1
+        return True
+
+def release_stream() -> None:
+    global _active_streams
+    with _streams_lock:
+        _active_streams -= 1
+
+_last_event: Tuple[Optional[Snapshot], str] = (None, "")
+
+def stream_event(snap: Snapshot) -> str:
+    """One SSE message for a package snapshot (shared with the ASGI stream). Encoded
+    once per snapshot, not once per subscriber."""
+    global _last_event
+    cached = _last_event
+    if cached[0] is snap:
+        return cached[1]
+    if snap.error:
+        payload = {"ok": False, "error": "Failed to fetch packages"}
+        return f"event: error\ndata: {json.dumps(payload)}\n\n"
+    payload = {"ok": True, "packages": snap.data or [], "age": round(snap.age or 0.0, 3)}
+    text = f"id: {snap.version}\ndata: {json.dumps(payload)}\n\n"
+    _last_event = (snap, text)
+    return text
+
+@app.get("/api/packages/stream")
+def api_packages_stream():
+    behavior = g.cfg.config.get("behavior", {})
+    if not behavior.get("stream_updates"):
+        return jsonify({"ok": False, "error": "Streaming is disabled"}), 404
+    try:
+        poller = _get_poller("packages")
+    except RuntimeError as e:
+        return jsonify({"ok": False, "error": str(e)}), 404
+    if not acquire_stream(min(int(behavior.get("max_streams") or 0), STREAM_THREADS_MAX)):
+        return "", 204
+
+    last_id = request.headers.get("Last-Event-ID", "")
+    last_version = int(last_id) if last_id.isdigit() else -1
+
+    def events():
+        yield "retry: 3000\n\n"
+        sent = (last_version, None)
+        snap = poller.get()
+        deadline = time.monotonic() + STREAM_LIFETIME_S
+        while True:
+            state = (snap.version, snap.error)
+            if state != sent:
+                yield stream_event(snap)
+                sent = state
+            else:
+                yield ": keepalive\n\n"
+            if time.monotonic() >= deadline:
+                break
+            snap = poller.wait(lambda s: (s.version, s.error) != sent, timeout=STREAM_HEARTBEAT_S)
+
+    resp = Response(events(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    resp.call_on_close(release_stream)
+    return resp
+
+HISTORY_PAGE = 50
+
+def _history_query() -> Tuple[List[Dict], Optional[int]]:
+    args = request.args
+    before = args.get("before", type=int)
+    limit = min(200, max(1, args.get("limit", HISTORY_PAGE, type=int)))
+    return package_archive.search(
+        q=args.get("q", ""),
+        event=args.get("event", ""),
+        instance=args.get("instance", ""),
+        before=before,
+        limit=limit,
+    )
+
+@app.get("/history")
+def history_page():
+    items, cursor = _history_query()
+    for item in items:
+        item["when"] = time.strftime("%Y-%m-%d %H:%M", time.localtime(item["ts"]))
+    return render_template(
+        "history.html",
+        title="History",
+        items=items,
+        cursor=cursor,
+        q=request.args.get("q", ""),
+        event=request.args.get("event", ""),
+        enabled=package_archive.enabled,
+    )
+
+@app.get("/api/history")
+def api_history():
+    """Finished/removed packages, newest first. ``?q=`` full-text searches names; page
+    with ``?before=<next>`` from the previous response."""
+    try:
+        items, cursor = _history_query()
+    except Exception as e:
+        app.logger.error("api_history error: %s", e)
+        return jsonify({"ok": False, "error": "Failed to search history", "items": []}), 500
+    return jsonify({"ok": True, "items": items, "next": cursor})
+
+@app.get("/api/webhooks")
+def api_webhooks():
+    """Configured webhooks (without secrets), queued deliveries and recent dead letters."""
+    return jsonify({
+        "ok": True,
+        "hooks": [{"url": h["url"], "events": h["events"]} for h in _webhook_hooks],
+        "pending": webhooks.pending(),
+        "dead_letters": webhooks.dead_letters(),
+    })
+
+@app.post("/api/webhooks/test")
+def api_webhooks_test():
+    """Send a ``ping`` event to every configured webhook."""
+    if not _webhook_hooks:
+        return jsonify({"ok": False, "error": "No webhooks configured."}), 400
+    event = Event("ping", _get_instance().get("id") or "primary", {"message": "Test delivery from JD-Mobile"})
+    return jsonify({"ok": True, "event": event.id, "queued": webhooks.deliver(event, _webhook_hooks)}), 202
 
 @app.get("/health")
 def health():
+    """Answers from the background prober's cached result; never blocks on JD."""
     if g.cfg.needs_setup:
         return {"ok": False, "needs_setup": True, "config_path": g.cfg.path, "writable": g.config_writable}, 503
     inst = cfg_mgr.get_active_instance(g.cfg.config) or {}
     p = (inst.get("providers") or {}).get("primary") or {}
     base_url = p.get("base_url") or ""
-    ok, msg = _test_jd_help(base_url, timeout_ms=int(p.get("timeout_ms") or 800))
-    return {"ok": ok, "message": msg, "base_url": base_url, "config_path": g.cfg.path, "writable": g.config_writable}, (200 if ok else 502)
+    provider = _get_active_local_provider()
+    prober = providers.prober(inst.get("id") or "primary")
+    state = prober.state if prober is not None else None
+    if state is None or state.checked_at <= 0:
+        # First request after start-up: the prober has not reported yet
+        state = prober.check_now() if prober is not None else health_mod.HealthState(False, "No prober.", 0.0)
+    return {
+        "ok": state.ok,
+        "message": state.message,
+        "age": round(state.age or 0.0, 3),
+        "latency_ms": state.latency_ms,
+        "circuit": provider.breaker.state,
+        # "myjd" while a failover-enabled instance is being served via MyJDownloader
+        "provider": getattr(provider, "active", "local"),
+        "base_url": base_url,
+        "config_path": g.cfg.path,
+        "writable": g.config_writable,
+    }, (200 if state.ok else 502)
+
+@app.get("/metrics", endpoint="metrics")
+def metrics_endpoint():
+    """Prometheus text format. Served from in-process counters only; never calls JD."""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+# Webhooks have to fire after a restart even if nobody opens the UI
+if cfg_mgr.load().config.get("webhooks"):
+    _resync_event_watch()
@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    instance TEXT NOT NULL,
+    uuid INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    bytes_total INTEGER NOT NULL DEFAULT 0,
+    event TEXT NOT NULL,
+    ts REAL NOT NULL,
+    UNIQUE (instance, uuid, event)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS events_fts USING fts5(name, content='events', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS events_ai AFTER INSERT ON events BEGIN
+    INSERT INTO events_fts(rowid, name) VALUES (new.id, new.name);
+END;
+CREATE TRIGGER IF NOT EXISTS events_ad AFTER DELETE ON events BEGIN
+    INSERT INTO events_fts(events_fts, rowid, name) VALUES ('delete', old.id, old.name);
+END;
+"""
+
+EVENTS = ("finished", "removed")
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+def fts_query(text: str) -> str:
+    """User search text -> FTS5 query: every word must match, as a prefix."""
+    return " ".join(f'"{t}"*' for t in _TERM_RE.findall(text or ""))
+
+class PackageArchive:
+    """Completed and removed packages, kept in SQLite after JD forgets them.
+
+    ``observe`` is fed every fresh package list. It compares it with the previous
+    one of the same instance (kept here as a compact uuid -> (name, size, finished)
+    map) and queues a ``finished`` event for packages that completed and a
+    ``removed`` event for packages that disappeared. A writer thread stores queued
+    events in one transaction every ``flush_interval`` seconds, or sooner once
+    ``batch_size`` are waiting. Names are full-text indexed (FTS5) for ``search``.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 2.0, batch_size: int = 500):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._last: Dict[str, Dict[Any, Tuple[str, int, bool]]] = {}
+        self._pending: List[Tuple[str, int, str, int, str, float]] = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._local = threading.local()
+        self._thread: Optional[threading.Thread] = None
+        self.enabled = True
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            conn = self._conn()
+            conn.executescript(_SCHEMA)
+        except sqlite3.Error as e:
+            log.warning("package archive disabled (%s): %s", path, e)
+            self.enabled = False
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread; WAL lets searches run while the writer commits
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def observe(self, instance: str, rows: List[Dict[str, Any]], now: Optional[float] = None) -> None:
+        if not self.enabled:
+            return
+        now = time.time() if now is None else now
+        current = {
+            p.get("uuid"): (str(p.get("name") or ""), int(p.get("bytesTotal") or 0), bool(p.get("finished")))
+            for p in rows if p.get("uuid") is not None
+        }
+        events = []
+        with self._lock:
+            # The first list after startup only records what is already finished
+            # (already-stored events are ignored by the unique key)
+            prev = self._last.get(instance, {})
+            for uuid, (name, size, finished) in current.items():
+                if finished and not (prev.get(uuid) or ("", 0, False))[2]:
+                    events.append((instance, uuid, name, size, "finished", now))
+            for uuid, (name, size, _) in prev.items():
+                if uuid not in current:
+                    events.append((instance, uuid, name, size, "removed", now))
+            self._last[instance] = current
+            if not events:
+                return
+            self._pending.extend(events)
+            full = len(self._pending) >= self.batch_size
+        self._ensure_thread()
+        if full:
+            self._wake.set()
+
+    def flush(self) -> int:
+        """Write the queued events in one transaction; returns how many were queued."""
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return 0
+        conn = self._conn()
+        try:
+            conn.execute("BEGIN")
+            conn.executemany(
+                "INSERT OR IGNORE INTO events (instance, uuid, name, bytes_total, event, ts) VALUES (?, ?, ?, ?, ?, ?)",
+                batch,
+            )
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            log.error("package archive: dropped %d events: %s", len(batch), e)
+        return len(batch)
+
+    def search(
+        self,
+        q: str = "",
+        event: str = "",
+        instance: str = "",
+        before: Optional[int] = None,
+        limit: int = 50,
+    ) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """Newest first, keyset-paginated: pass the returned cursor as ``before`` for
+        the next page (None when there is none)."""
+        if not self.enabled:
+            return [], None
+        where, args = [], []
+        cols = "e.id, e.instance, e.uuid, e.name, e.bytes_total, e.event, e.ts"
+        match = fts_query(q)
+        if match:
+            # Driving the scan from the index in rowid order lets LIMIT stop it early
+            sql = f"SELECT {cols} FROM events_fts f JOIN events e ON e.id = f.rowid"
+            order = "f.rowid"
+            where.append("events_fts MATCH ?")
+            args.append(match)
+        else:
+            sql = f"SELECT {cols} FROM events e"
+            order = "e.id"
+        if event in EVENTS:
+            where.append("e.event = ?")
+            args.append(event)
+        if instance:
+            where.append("e.instance = ?")
+            args.append(instance)
+        if before is not None:
+            where.append(f"{order} < ?")
+            args.append(before)
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {order} DESC LIMIT ?"
+        args.append(limit + 1)
+        rows = [dict(r) for r in self._conn().execute(sql, args)]
+        more = len(rows) > limit
+        rows = rows[:limit]
+        return rows, (rows[-1]["id"] if more else None)
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="package-archive", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
@@ -0,0 +1,158 @@
+"""Async entry point (``JD_MOBILE_SERVER=asgi``): ``uvicorn backend.asgi:app``.
+
+The routes that hold a connection open are served natively on the event loop:
+``/api/packages/stream`` waits on the package poller without a thread per
+subscriber, and ``/api/packages/<id>/links`` awaits JD through the provider's
+async client. Everything else goes to the Flask app unchanged, on a worker thread.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import re
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgi
+from flask import g
+
+from . import app as web
+
+_wsgi = WsgiToAsgi(web.app)
+_LINKS_PATH = re.compile(r"^/api/packages/(\d+)/links$")
+
+async def _send_json(send, status: int, body: Dict[str, Any], headers: Optional[List[Tuple[bytes, bytes]]] = None) -> None:
+    data = json.dumps(body).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(data)).encode())] + (headers or []),
+    })
+    await send({"type": "http.response.body", "body": data})
+
+def _header(scope, name: bytes) -> str:
+    for k, v in scope.get("headers") or []:
+        if k.lower() == name:
+            return v.decode("latin-1")
+    return ""
+
+async def _package_links(scope, receive, send, package_id: int) -> None:
+    args = parse_qs(scope.get("query_string", b"").decode())
+
+    def arg_int(name: str, default: int) -> int:
+        try:
+            return int((args.get(name) or [default])[0])
+        except ValueError:
+            return default
+
+    start = max(0, arg_int("start", 0))
+    limit = min(web.LINK_PAGE_MAX, max(1, arg_int("limit", 50)))
+    with web.app.app_context():
+        g.cfg = web.cfg_mgr.load()
+        try:
+            provider = web._get_active_local_provider((args.get("instance") or [""])[0] or None)
+        except RuntimeError as e:
+            return await _send_json(send, 404, {"ok": False, "error": str(e), "links": []})
+    key = (id(provider), package_id, start, limit)
+    links = web._link_pages.get(key)
+    if links is None:
+        try:
+            links = await provider.aget_package_links(package_id, start=start, limit=limit)
+        except Exception as e:
+            web.app.logger.error("api_package_links error: %s", e)
+            return await _send_json(send, 502, {"ok": False, "error": "Failed to fetch links", "links": []})
+        web._link_pages.put(key, links)
+    await _send_json(send, 200, {"ok": True, "links": links, "start": start, "limit": limit, "more": len(links) >= limit})
+
+async def _packages_stream(scope, receive, send) -> None:
+    with web.app.app_context():
+        g.cfg = web.cfg_mgr.load()
+        behavior = g.cfg.config.get("behavior", {})
+        if not behavior.get("stream_updates"):
+            return await _send_json(send, 404, {"ok": False, "error": "Streaming is disabled"})
+        try:
+            poller = web._get_poller("packages")
+        except RuntimeError as e:
+            return await _send_json(send, 404, {"ok": False, "error": str(e)})
+    if not web.acquire_stream(int(behavior.get("max_streams") or 0)):
+        # EventSource gives up on a 204, and the page polls instead
+        await send({"type": "http.response.start", "status": 204, "headers": []})
+        return await send({"type": "http.response.body", "body": b""})
+
+    loop = asyncio.get_running_loop()
+    changed = asyncio.Event()
+    unsubscribe = poller.subscribe(lambda: loop.call_soon_threadsafe(changed.set))
+    disconnected = asyncio.ensure_future(_wait_disconnect(receive))
+    last_id = _header(scope, b"last-event-id")
+    sent = (int(last_id) if last_id.isdigit() else -1, None)
+    try:
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"text/event-stream; charset=utf-8"), (b"cache-control", b"no-cache"), (b"x-accel-buffering", b"no")],
+        })
+        await send({"type": "http.response.body", "body": b"retry: 3000\n\n", "more_body": True})
+        snap = poller.snapshot
+        if snap.fetched_at <= 0:
+            snap = await asyncio.to_thread(poller.get)
+        deadline = time.monotonic() + web.STREAM_LIFETIME_S
+        while True:
+            state = (snap.version, snap.error)
+            if state != sent:
+                chunk = web.stream_event(snap)
+                sent = state
+            else:
+                chunk = ": keepalive\n\n"
+            await send({"type": "http.response.body", "body": chunk.encode(), "more_body": True})
+            if time.monotonic() >= deadline:
+                break
+            snap = await _next_change(poller, changed, disconnected, sent, web.STREAM_HEARTBEAT_S)
+            if snap is None:
+                return
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        disconnected.cancel()
+        unsubscribe()
+        web.release_stream()
+
+async def _next_change(poller, changed: asyncio.Event, disconnected: asyncio.Future, sent: tuple, timeout: float):
+    """The poller's snapshot once its (version, error) differs from ``sent``, or as it
+    is after ``timeout``; None if the client went away. Refreshes that change nothing
+    wake the loop but send nothing."""
+    loop = asyncio.get_running_loop()
+    until = loop.time() + timeout
+    while True:
+        changed.clear()
+        snap = poller.snapshot
+        remaining = until - loop.time()
+        if (snap.version, snap.error) != sent or remaining <= 0:
+            return snap
+        waiter = asyncio.ensure_future(changed.wait())
+        await asyncio.wait({waiter, disconnected}, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+        waiter.cancel()
+        if disconnected.done():
+            return None
+
+async def _wait_disconnect(receive) -> None:
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+async def app(scope, receive, send) -> None:
+    if scope["type"] == "lifespan":
+        while True:
+            msg = await receive()
+            if msg["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif msg["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    if scope["type"] == "http" and scope["method"] == "GET":
+        path = scope["path"]
+        m = _LINKS_PATH.match(path)
+        # Before setup, Flask's redirect answers these too
+        if (m or path == "/api/packages/stream") and not web.cfg_mgr.load().needs_setup:
+            if m:
+                return await _package_links(scope, receive, send, int(m.group(1)))
+            return await _packages_stream(scope, receive, send)
+    await _wsgi(scope, receive, send)
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import stat
+import threading
+from typing import Dict, Iterable, Optional, Tuple
+
+from werkzeug.security import safe_join
+
+# Static files are linked as /assets/<name>.<hash>.<ext>: the URL changes whenever the
+# content does, so browsers may cache them for a year without ever revalidating.
+HASH_LEN = 12
+PREFIX = "/assets/"
+
+class AssetManifest:
+    """Content hashes of the files under ``root``, recomputed when a file's size or
+    mtime changes (so edits show up without a restart)."""
+
+    def __init__(self, root: str):
+        self.root = root
+        self._lock = threading.Lock()
+        self._hashes: Dict[str, Tuple[tuple, str]] = {}  # path -> (stat key, hash)
+
+    def digest(self, path: str) -> Optional[str]:
+        full = safe_join(self.root, path)
+        if full is None:
+            return None
+        try:
+            st = os.stat(full)
+        except OSError:
+            return None
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        key = (st.st_mtime_ns, st.st_size)
+        entry = self._hashes.get(path)
+        if entry is not None and entry[0] == key:
+            return entry[1]
+        h = hashlib.sha256()
+        with open(full, "rb") as f:
+            for block in iter(lambda: f.read(65536), b""):
+                h.update(block)
+        digest = h.hexdigest()[:HASH_LEN]
+        with self._lock:
+            self._hashes[path] = (key, digest)
+        return digest
+
+    def url(self, path: str) -> str:
+        """``app.css`` -> ``/assets/app.<hash>.css`` (the plain /static URL if it is missing)."""
+        digest = self.digest(path)
+        if digest is None:
+            return "/static/" + path
+        stem, ext = os.path.splitext(path)
+        return f"{PREFIX}{stem}.{digest}{ext}"
+
+    def resolve(self, name: str) -> Optional[Tuple[str, bool]]:
+        """``app.<hash>.css`` -> ("app.css", whether the hash is the current one);
+        None if it does not name an existing file."""
+        stem, ext = os.path.splitext(name)
+        stem, _, digest = stem.rpartition(".")
+        if not stem or len(digest) != HASH_LEN:
+            return None
+        path = stem + ext
+        current = self.digest(path)
+        if current is None:
+            return None
+        return path, digest == current
+
+    def version(self, paths: Iterable[str]) -> str:
+        """One hash over several files, e.g. to name a cache that holds all of them."""
+        h = hashlib.sha256()
+        for path in paths:
+            h.update(f"{path}:{self.digest(path)}\n".encode())
+        return h.hexdigest()[:HASH_LEN]
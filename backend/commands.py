@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import itertools
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from . import metrics
+
+# Queueable actions -> Provider method. Each takes (ids, extra_ids) and applies to all
+# of them, so consecutive jobs of one action can be sent as a single call.
+ACTIONS = {
+    "remove_packages": "remove_packages",
+    "cleanup_packages": "cleanup_packages",
+    "start_links": "start_linkgrabber_downloads",
+    "remove_links": "remove_linkgrabber_links",
+}
+
+_jobs_total = metrics.Counter("jdmobile_commands_total", "Queued commands by action and result.", ("action", "result"))
+_batches_total = metrics.Counter("jdmobile_command_batches_total", "Upstream calls made for queued commands, by action.", ("action",))
+
+@dataclass
+class Job:
+    id: int
+    instance: str
+    action: str
+    ids: List[int]
+    extra: List[int]
+    provider: Any = field(repr=False)
+    on_done: Optional[Callable[[], None]] = field(default=None, repr=False)
+    status: str = "queued"       # queued -> running -> done | failed
+    error: Optional[str] = None
+    merged: int = 1              # jobs sent together in this job's upstream call
+    created: float = field(default_factory=time.time)
+    finished: Optional[float] = None
+    queued_at: float = field(default_factory=time.monotonic, repr=False)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "instance": self.instance,
+            "action": self.action,
+            "count": len(self.ids),
+            "status": self.status,
+            "error": self.error,
+            "merged": self.merged,
+            "created": self.created,
+            "finished": self.finished,
+        }
+
+class CommandQueue:
+    """Accepts JD actions without waiting for them and runs them in order, per instance.
+
+    Each instance gets a worker thread. After a submit it waits until no new job
+    has arrived for ``window`` seconds, but never more than ``max_delay`` seconds
+    after the oldest queued job. It then sends the leading run of jobs that share an
+    action and provider as one upstream call, with their ids merged. Jobs are never
+    reordered, so "remove these, then start those" stays in that order.
+    """
+
+    def __init__(self, window: float = 0.3, max_delay: float = 1.0, keep: int = 1000, idle_timeout: float = 60.0):
+        self.window = window
+        self.max_delay = max_delay
+        self.keep = keep
+        self.idle_timeout = idle_timeout
+        self._ids = itertools.count(1)
+        self._cond = threading.Condition()
+        self._queues: Dict[str, Deque[Job]] = {}
+        self._last_submit: Dict[str, float] = {}
+        self._workers: Dict[str, threading.Thread] = {}
+        self._jobs: "OrderedDict[int, Job]" = OrderedDict()
+
+    def submit(
+        self,
+        instance: str,
+        action: str,
+        provider: Any,
+        ids: List[int],
+        extra: Optional[List[int]] = None,
+        on_done: Optional[Callable[[], None]] = None,
+    ) -> Job:
+        """Queue ``action`` on ``ids`` for ``instance``; ``on_done`` runs after the upstream
+        call (success or not), e.g. to invalidate a snapshot."""
+        if action not in ACTIONS:
+            raise ValueError(f"Unknown action '{action}'.")
+        job = Job(next(self._ids), instance, action, list(ids), list(extra or []), provider, on_done)
+        with self._cond:
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.keep:
+                oldest = next(iter(self._jobs.values()))
+                if oldest.status in ("queued", "running"):
+                    break
+                self._jobs.popitem(last=False)
+            self._queues.setdefault(instance, deque()).append(job)
+            self._last_submit[instance] = time.monotonic()
+            worker = self._workers.get(instance)
+            if worker is None or not worker.is_alive():
+                worker = self._workers[instance] = threading.Thread(
+                    target=self._run, args=(instance,), name=f"commands-{instance}", daemon=True
+                )
+                worker.start()
+            self._cond.notify_all()
+        return job
+
+    def get(self, job_ids: List[int]) -> List[Job]:
+        with self._cond:
+            return [self._jobs[i] for i in job_ids if i in self._jobs]
+
+    def wait(self, job_ids: List[int], timeout: float) -> List[Job]:
+        """The jobs, once all of them have finished or ``timeout`` expires."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                jobs = [self._jobs[i] for i in job_ids if i in self._jobs]
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or all(j.status in ("done", "failed") for j in jobs):
+                    return jobs
+                self._cond.wait(remaining)
+
+    def pending(self, instance: Optional[str] = None) -> int:
+        with self._cond:
+            return sum(len(q) for k, q in self._queues.items() if instance is None or k == instance)
+
+    def _take_batch(self, instance: str) -> Optional[List[Job]]:
+        """Block until a batch is due (None when idle for ``idle_timeout``)."""
+        with self._cond:
+            queue = self._queues[instance]
+            idle_until = time.monotonic() + self.idle_timeout
+            while True:
+                now = time.monotonic()
+                if queue:
+                    due = min(self._last_submit[instance] + self.window, queue[0].queued_at + self.max_delay)
+                    if now >= due:
+                        break
+                    self._cond.wait(due - now)
+                    continue
+                if now >= idle_until:
+                    del self._workers[instance]
+                    return None
+                self._cond.wait(idle_until - now)
+            first = queue.popleft()
+            batch = [first]
+            while queue and queue[0].action == first.action and queue[0].provider is first.provider:
+                batch.append(queue.popleft())
+            for job in batch:
+                job.status = "running"
+            return batch
+
+    def _run(self, instance: str) -> None:
+        while True:
+            batch = self._take_batch(instance)
+            if batch is None:
+                return
+            first = batch[0]
+            ids = list(dict.fromkeys(i for job in batch for i in job.ids))
+            extra = list(dict.fromkeys(i for job in batch for i in job.extra)) or None
+            error = None
+            try:
+                _batches_total.inc(action=first.action)
+                getattr(first.provider, ACTIONS[first.action])(ids, extra)
+            except Exception as e:
+                error = str(e)
+            for job in batch:
+                if job.on_done is not None:
+                    try:
+                        job.on_done()
+                    except Exception:
+                        pass
+            with self._cond:
+                for job in batch:
+                    job.status = "failed" if error else "done"
+                    job.error = error
+                    job.merged = len(batch)
+                    job.finished = time.time()
+                    _jobs_total.inc(action=job.action, result=job.status)
+                self._cond.notify_all()
@@ -1,14 +1,22 @@
 from __future__ import annotations
 
+import copy
 import json
 import os
 import re
 import tempfile
+import threading
+import time
+from collections.abc import Mapping
 from dataclasses import dataclass
 from pathlib import Path
+from types import MappingProxyType
 from typing import Any, Dict, List, Optional, Tuple
 from urllib.parse import urlparse
 
+from . import metrics
+from .events import EVENT_TYPES
+
 DEFAULT_CONFIG: Dict[str, Any] = {
     "schema_version": 1,
     "ui": {
@@ -24,7 +32,10 @@ DEFAULT_CONFIG: Dict[str, Any] = {
                 "primary": {
                     "type": "local",
                     "base_url": "",        # set during setup
-                    "timeout_ms": 800,
+                    "timeout_ms": 800,     # starting timeout until latency has been observed
+                    "min_timeout_ms": 200,
+                    "max_timeout_ms": 10000,
+                    "pool_size": 4,
                 },
                 "fallback": {
                     "type": "myjd",
@@ -32,6 +43,8 @@ DEFAULT_CONFIG: Dict[str, Any] = {
                     "email": "",
                     "password": "",
                     "device_name": "",
+                    "api_url": "https://api.jdownloader.org",
+                    "timeout_ms": 5000,
                 },
             },
         }
@@ -40,19 +53,42 @@ DEFAULT_CONFIG: Dict[str, Any] = {
     "behavior": {
         "prefer_primary": True,
         "failover_on_unreachable": False,
+        "poll_interval_ms": 2000,
+        "stream_updates": False,
+        "max_streams": 4,
+        "health_interval_ms": 10000,
+        "server_timing": False,   # Server-Timing header with per-phase durations
+        "slow_request_ms": 0,     # log requests slower than this (0 = off)
     },
+    # [{"url": "http://host/hook", "events": ["package.finished"], "secret": ""}]; no events = all
+    "webhooks": [],
 }
 
 ID_RE = re.compile(r"^[a-z0-9][a-z0-9\-]{0,63}$")
 
-@dataclass
+@dataclass(frozen=True)
 class ConfigLoadResult:
     ok: bool
-    config: Dict[str, Any]
-    errors: List[str]
+    config: Mapping[str, Any]   # read-only view; use thaw() to get an editable copy
+    errors: Tuple[str, ...]
     needs_setup: bool
     path: str
 
+def _freeze(v: Any) -> Any:
+    if isinstance(v, Mapping):
+        return MappingProxyType({k: _freeze(x) for k, x in v.items()})
+    if isinstance(v, (list, tuple)):
+        return tuple(_freeze(x) for x in v)
+    return v
+
+def thaw(v: Any) -> Any:
+    """Return a plain, mutable deep copy of a (possibly frozen) config value."""
+    if isinstance(v, Mapping):
+        return {k: thaw(x) for k, x in v.items()}
+    if isinstance(v, (list, tuple)):
+        return [thaw(x) for x in v]
+    return v
+
 def _deep_merge(dst: Dict[str, Any], src: Dict[str, Any]) -> Dict[str, Any]:
     for k, v in src.items():
         if isinstance(v, dict) and isinstance(dst.get(k), dict):
@@ -78,10 +114,49 @@ class ConfigManager:
     def __init__(self, config_path: Optional[str] = None):
         env_path = os.environ.get("JD_MOBILE_CONFIG_PATH", "").strip()
         self.path = Path(config_path or env_path or "/app/config/config.json")
+        self.writable: Optional[bool] = None
+        self._lock = threading.Lock()
+        self._cache: Optional[Tuple[Optional[tuple], ConfigLoadResult]] = None
+
+    def _stat_key(self) -> Optional[tuple]:
+        try:
+            st = self.path.stat()
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
 
     def load(self) -> ConfigLoadResult:
+        """Return the validated config, re-reading the file only when it changed on disk."""
+        started = time.perf_counter()
+        key = self._stat_key()
+        cached = self._cache
+        if cached is None or cached[0] != key:
+            with self._lock:
+                cached = self._cache
+                if cached is None or cached[0] != key:
+                    cached = self._cache = (key, self._read())
+                    metrics.cache_requests.inc(cache="config", result="miss")
+                    metrics.config_load_seconds.observe(time.perf_counter() - started, source="disk")
+                    return cached[1]
+        metrics.cache_requests.inc(cache="config", result="hit")
+        metrics.config_load_seconds.observe(time.perf_counter() - started, source="cache")
+        return cached[1]
+
+    def check_writable(self) -> bool:
+        """Probe whether the config directory accepts writes (startup and after failed saves)."""
+        config_dir = self.path.parent
+        try:
+            config_dir.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=str(config_dir), prefix=".write_test"):
+                pass
+            self.writable = True
+        except Exception:
+            self.writable = False
+        return self.writable
+
+    def _read(self) -> ConfigLoadResult:
         errors: List[str] = []
-        cfg: Dict[str, Any] = json.loads(json.dumps(DEFAULT_CONFIG))  # deep copy
+        cfg: Dict[str, Any] = copy.deepcopy(DEFAULT_CONFIG)
 
         if self.path.exists():
             try:
@@ -103,9 +178,10 @@ class ConfigManager:
 
         ok = (not needs_setup) and (len([e for e in errors if not e.lower().startswith("config file not found")]) == 0)
 
-        return ConfigLoadResult(ok=ok, config=cfg, errors=errors, needs_setup=needs_setup, path=str(self.path))
+        return ConfigLoadResult(ok=ok, config=_freeze(cfg), errors=tuple(errors), needs_setup=needs_setup, path=str(self.path))
 
-    def save(self, cfg: Dict[str, Any]) -> Tuple[bool, List[str]]:
+    def save(self, cfg: Mapping[str, Any]) -> Tuple[bool, List[str]]:
+        cfg = thaw(cfg)
         errors, needs_setup = self._normalize_and_validate(cfg)
         if needs_setup:
             errors.append("Refusing to save: config still requires setup (missing required fields).")
@@ -120,14 +196,18 @@ class ConfigManager:
                 os.fsync(tf.fileno())
                 tmp_name = tf.name
             os.replace(tmp_name, self.path)
-            return True, []
         except Exception as e:
+            self.check_writable()
             return False, [f"Failed to save config: {e}"]
+        self.writable = True
+        with self._lock:
+            self._cache = None
+        return True, []
 
-    def get_active_instance(self, cfg: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    def get_active_instance(self, cfg: Mapping[str, Any]) -> Optional[Mapping[str, Any]]:
         inst_id = str(cfg.get("active_instance_id") or "").strip()
         for inst in (cfg.get("instances") or []):
-            if isinstance(inst, dict) and inst.get("id") == inst_id:
+            if isinstance(inst, Mapping) and inst.get("id") == inst_id:
                 return inst
         return None
 
@@ -144,20 +224,56 @@ class ConfigManager:
         # ui defaults
         if not isinstance(cfg.get("ui"), dict):
             cfg["ui"] = {}
-        cfg["ui"] = _deep_merge(json.loads(json.dumps(DEFAULT_CONFIG["ui"])), cfg["ui"])
+        cfg["ui"] = _deep_merge(copy.deepcopy(DEFAULT_CONFIG["ui"]), cfg["ui"])
         if not cfg["ui"].get("title"):
             cfg["ui"]["title"] = "JD-Mobile"
 
         # behavior defaults
         if not isinstance(cfg.get("behavior"), dict):
             cfg["behavior"] = {}
-        cfg["behavior"] = _deep_merge(json.loads(json.dumps(DEFAULT_CONFIG["behavior"])), cfg["behavior"])
+        cfg["behavior"] = _deep_merge(copy.deepcopy(DEFAULT_CONFIG["behavior"]), cfg["behavior"])
+        poll = cfg["behavior"].get("poll_interval_ms")
+        if not isinstance(poll, int) or poll < 250 or poll > 60000:
+            errors.append("behavior.poll_interval_ms must be 250..60000.")
+            cfg["behavior"]["poll_interval_ms"] = DEFAULT_CONFIG["behavior"]["poll_interval_ms"]
+        if not isinstance(cfg["behavior"].get("stream_updates"), bool):
+            cfg["behavior"]["stream_updates"] = False
+        streams = cfg["behavior"].get("max_streams")
+        # Only the async server goes this high: under gthread a stream holds a thread,
+        # and app.py serves at most STREAM_THREADS_MAX of them there
+        if not isinstance(streams, int) or streams < 0 or streams > 1000:
+            errors.append("behavior.max_streams must be 0..1000.")
+            cfg["behavior"]["max_streams"] = DEFAULT_CONFIG["behavior"]["max_streams"]
+        health = cfg["behavior"].get("health_interval_ms")
+        if not isinstance(health, int) or health < 1000 or health > 600000:
+            errors.append("behavior.health_interval_ms must be 1000..600000.")
+            cfg["behavior"]["health_interval_ms"] = DEFAULT_CONFIG["behavior"]["health_interval_ms"]
+        if not isinstance(cfg["behavior"].get("server_timing"), bool):
+            cfg["behavior"]["server_timing"] = False
+        slow = cfg["behavior"].get("slow_request_ms")
+        if not isinstance(slow, int) or slow < 0 or slow > 600000:
+            errors.append("behavior.slow_request_ms must be 0..600000.")
+            cfg["behavior"]["slow_request_ms"] = DEFAULT_CONFIG["behavior"]["slow_request_ms"]
+
+        # webhooks (invalid entries are dropped, not fatal)
+        hooks = []
+        for idx, hook in enumerate(cfg.get("webhooks") if isinstance(cfg.get("webhooks"), list) else []):
+            if not isinstance(hook, dict) or not _is_valid_http_url(str(hook.get("url") or "")):
+                errors.append(f"webhooks[{idx}].url must be an http(s) URL.")
+                continue
+            events = hook.get("events") or []
+            unknown = [e for e in events if e not in EVENT_TYPES] if isinstance(events, list) else [events]
+            if unknown:
+                errors.append(f"webhooks[{idx}].events: unknown event(s) {', '.join(map(str, unknown))}.")
+                continue
+            hooks.append({"url": hook["url"], "events": events, "secret": str(hook.get("secret") or "")})
+        cfg["webhooks"] = hooks
 
         # instances
         instances = cfg.get("instances")
         if not isinstance(instances, list) or len(instances) == 0:
             errors.append("instances must be a non-empty array.")
-            cfg["instances"] = json.loads(json.dumps(DEFAULT_CONFIG["instances"]))
+            cfg["instances"] = copy.deepcopy(DEFAULT_CONFIG["instances"])
             instances = cfg["instances"]
             needs_setup = True
 
@@ -189,11 +305,11 @@ class ConfigManager:
 
             if not isinstance(inst.get("providers"), dict):
                 inst["providers"] = {}
-            inst["providers"] = _deep_merge(json.loads(json.dumps(DEFAULT_CONFIG["instances"][0]["providers"])), inst["providers"])
+            inst["providers"] = _deep_merge(copy.deepcopy(DEFAULT_CONFIG["instances"][0]["providers"]), inst["providers"])
 
             primary = inst["providers"].get("primary", {})
             if not isinstance(primary, dict):
-                inst["providers"]["primary"] = json.loads(json.dumps(DEFAULT_CONFIG["instances"][0]["providers"]["primary"]))
+                inst["providers"]["primary"] = copy.deepcopy(DEFAULT_CONFIG["instances"][0]["providers"]["primary"])
                 primary = inst["providers"]["primary"]
 
             ptype = str(primary.get("type") or "").strip().lower()
@@ -217,9 +333,22 @@ class ConfigManager:
                     errors.append(f"instances[{idx}].providers.primary.timeout_ms must be 100..60000.")
                     primary["timeout_ms"] = 800
 
+                # Adaptive timeouts stay within these bounds
+                lo = primary.get("min_timeout_ms", 200)
+                hi = primary.get("max_timeout_ms", 10000)
+                if not isinstance(lo, int) or not isinstance(hi, int) or not 100 <= lo <= hi <= 60000:
+                    errors.append(f"instances[{idx}].providers.primary.min_timeout_ms/max_timeout_ms must satisfy 100 <= min <= max <= 60000.")
+                    primary["min_timeout_ms"] = 200
+                    primary["max_timeout_ms"] = 10000
+
+                pool = primary.get("pool_size", 4)
+                if not isinstance(pool, int) or pool < 1 or pool > 64:
+                    errors.append(f"instances[{idx}].providers.primary.pool_size must be 1..64.")
+                    primary["pool_size"] = 4
+
             fallback = inst["providers"].get("fallback", {})
             if not isinstance(fallback, dict):
-                inst["providers"]["fallback"] = json.loads(json.dumps(DEFAULT_CONFIG["instances"][0]["providers"]["fallback"]))
+                inst["providers"]["fallback"] = copy.deepcopy(DEFAULT_CONFIG["instances"][0]["providers"]["fallback"])
                 fallback = inst["providers"]["fallback"]
 
             ftype = str(fallback.get("type") or "").strip().lower()
@@ -228,6 +357,19 @@ class ConfigManager:
                 fallback["type"] = "myjd"
             if not isinstance(fallback.get("enabled"), bool):
                 fallback["enabled"] = False
+            if fallback["enabled"]:
+                if not fallback.get("email") or not fallback.get("password"):
+                    errors.append(f"instances[{idx}].providers.fallback needs email and password; fallback disabled.")
+                    fallback["enabled"] = False
+                api_url = _normalize_base_url(fallback.get("api_url") or "https://api.jdownloader.org")
+                if not _is_valid_http_url(api_url):
+                    errors.append(f"instances[{idx}].providers.fallback.api_url is not a valid http(s) URL: '{api_url}'")
+                    api_url = "https://api.jdownloader.org"
+                fallback["api_url"] = api_url
+                ftmo = fallback.get("timeout_ms", 5000)
+                if not isinstance(ftmo, int) or ftmo < 100 or ftmo > 60000:
+                    errors.append(f"instances[{idx}].providers.fallback.timeout_ms must be 100..60000.")
+                    fallback["timeout_ms"] = 5000
 
         active_id = str(cfg.get("active_instance_id") or "").strip()
         if not active_id:
@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import ipaddress
+import socket
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import requests
+
+DEFAULT_PORT = 3128
+MAX_HOSTS = 4096          # refuse scopes larger than a /20
+DEFAULT_WORKERS = 64
+
+@dataclass
+class DiscoveryResult:
+    host: str
+    port: int
+    base_url: str
+    message: str
+    elapsed_ms: int
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+def default_cidr() -> str:
+    """The /24 this host sits in (best effort; falls back to a common LAN range)."""
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.connect(("10.255.255.255", 1))  # no packet is sent for UDP connect
+            ip = s.getsockname()[0]
+        return str(ipaddress.ip_network(f"{ip}/24", strict=False))
+    except Exception:
+        return "192.168.1.0/24"
+
+def expand_targets(cidrs: List[str], seeds: List[str], port: int = DEFAULT_PORT) -> Tuple[List[Tuple[str, int]], List[str]]:
+    """Turn CIDR ranges and seed hosts ("host" or "host:port") into a de-duplicated
+    list of (host, port) targets. Returns (targets, errors)."""
+    targets: List[Tuple[str, int]] = []
+    errors: List[str] = []
+    seen = set()
+
+    def add(host: str, p: int) -> None:
+        if (host, p) not in seen:
+            seen.add((host, p))
+            targets.append((host, p))
+
+    for seed in seeds:
+        seed = seed.strip().split("://", 1)[-1].rstrip("/")
+        if not seed:
+            continue
+        host, _, p = seed.rpartition(":") if seed.count(":") == 1 else (seed, "", "")
+        try:
+            add(host or seed, int(p) if p else port)
+        except ValueError:
+            errors.append(f"Invalid seed host '{seed}'.")
+
+    for cidr in cidrs:
+        cidr = cidr.strip()
+        if not cidr:
+            continue
+        try:
+            net = ipaddress.ip_network(cidr, strict=False)
+        except ValueError:
+            errors.append(f"Invalid network '{cidr}'.")
+            continue
+        if net.num_addresses > MAX_HOSTS:
+            errors.append(f"Network '{cidr}' is too large (max {MAX_HOSTS} addresses).")
+            continue
+        hosts = list(net.hosts()) or [net.network_address]
+        for ip in hosts:
+            add(str(ip), port)
+
+    if len(targets) > MAX_HOSTS:
+        errors.append(f"Too many targets; only the first {MAX_HOSTS} are scanned.")
+        targets = targets[:MAX_HOSTS]
+    return targets, errors
+
+def probe(host: str, port: int, connect_timeout: float = 0.3, http_timeout: float = 0.8) -> Optional[DiscoveryResult]:
+    """Check one host for a JDownloader Local API. A cheap TCP connect filters out
+    closed ports before the HTTP ``/help`` request is made."""
+    started = time.monotonic()
+    try:
+        with socket.create_connection((host, port), timeout=connect_timeout):
+            pass
+    except OSError:
+        return None
+
+    base_url = f"http://{host}:{port}"
+    try:
+        r = requests.get(f"{base_url}/help", timeout=http_timeout)
+    except requests.RequestException:
+        return None
+    if r.status_code != 200:
+        return None
+    body = r.text.lower()
+    if "jdownloader" not in body and "downloads" not in body and "linkgrabber" not in body:
+        return None
+    return DiscoveryResult(
+        host=host,
+        port=port,
+        base_url=base_url,
+        message="JDownloader API found.",
+        elapsed_ms=int((time.monotonic() - started) * 1000),
+    )
+
+def scan(
+    targets: List[Tuple[str, int]],
+    workers: int = DEFAULT_WORKERS,
+    connect_timeout: float = 0.3,
+    http_timeout: float = 0.8,
+    deadline_s: float = 15.0,
+) -> Iterator[DiscoveryResult]:
+    """Probe ``targets`` concurrently and yield hits as they arrive.
+
+    Each host is bounded by ``connect_timeout + http_timeout``; the whole scan
+    stops yielding after ``deadline_s`` (outstanding probes are abandoned).
+    """
+    if not targets:
+        return
+    deadline = time.monotonic() + deadline_s
+    pool = ThreadPoolExecutor(max_workers=max(1, min(workers, len(targets))), thread_name_prefix="discovery")
+    try:
+        pending = {pool.submit(probe, h, p, connect_timeout, http_timeout) for h, p in targets}
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for fut in done:
+                try:
+                    res = fut.result()
+                except Exception:
+                    res = None
+                if res is not None:
+                    yield res
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from . import metrics
+
+log = logging.getLogger(__name__)
+
+EVENT_TYPES = (
+    "package.added",
+    "package.progress",   # crossed one of MILESTONES (percent of bytes)
+    "package.finished",
+    "package.removed",
+    "link.offline",       # a LinkGrabber link JD reports as offline
+    "crawl.complete",     # a crawl job started by "Add links" finished
+    "ping",               # test delivery, sent on request only
+)
+MILESTONES = (25, 50, 75)
+
+_events_total = metrics.Counter("jdmobile_events_total", "Events emitted by type.", ("type",))
+
+@dataclass
+class Event:
+    type: str
+    instance: str
+    data: Dict[str, Any]
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    ts: float = field(default_factory=time.time)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"id": self.id, "type": self.type, "instance": self.instance, "ts": self.ts, "data": self.data}
+
+def _milestone(p: Dict[str, Any]) -> int:
+    total = p.get("bytesTotal") or 0
+    if total <= 0:
+        return 0
+    pct = (p.get("bytesLoaded") or 0) * 100 / total
+    return max((m for m in MILESTONES if pct >= m), default=0)
+
+class EventEngine:
+    """Turns successive package and LinkGrabber snapshots into typed events.
+
+    Each ``observe_*`` call is compared with the previous list of the same instance,
+    kept here in compact form. The first list of an instance is only recorded, since
+    there is nothing to compare it with. Events go to every subscriber on the
+    observing thread, so subscribers should hand slow work off (as the webhook
+    dispatcher does).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._packages: Dict[str, Dict[Any, Tuple[str, int, bool]]] = {}  # uuid -> (name, milestone, finished)
+        self._links: Dict[str, Dict[Any, str]] = {}  # uuid -> availability
+        self._subscribers: List[Tuple[Callable[[Event], None], Optional[frozenset]]] = []
+
+    def subscribe(self, fn: Callable[[Event], None], types: Optional[Iterable[str]] = None) -> Callable[[], None]:
+        """Call ``fn(event)`` for every event (or only those of ``types``). Returns the
+        unsubscribe function."""
+        entry = (fn, frozenset(types) if types else None)
+        with self._lock:
+            self._subscribers.append(entry)
+
+        def unsubscribe() -> None:
+            with self._lock:
+                if entry in self._subscribers:
+                    self._subscribers.remove(entry)
+        return unsubscribe
+
+    @property
+    def subscribed(self) -> bool:
+        return bool(self._subscribers)
+
+    def emit(self, type: str, instance: str, data: Dict[str, Any]) -> Event:
+        event = Event(type, instance, data)
+        _events_total.inc(type=type)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for fn, types in subscribers:
+            if types is not None and type not in types:
+                continue
+            try:
+                fn(event)
+            except Exception:
+                log.exception("event subscriber failed on %s", type)
+        return event
+
+    def observe_packages(self, instance: str, rows: List[Dict[str, Any]], emit: bool = True) -> List[Event]:
+        """Diff a package list against the previous one; ``emit=False`` only records it
+        (e.g. in a worker process that is not the one sending events)."""
+        current = {
+            p.get("uuid"): (str(p.get("name") or ""), _milestone(p), bool(p.get("finished")))
+            for p in rows if p.get("uuid") is not None
+        }
+        by_uuid = {p.get("uuid"): p for p in rows}
+        found: List[Tuple[str, Dict[str, Any]]] = []
+        with self._lock:
+            prev = self._packages.get(instance)
+            self._packages[instance] = current
+        if prev is None or not emit:
+            return []
+        for uuid_, (name, milestone, finished) in current.items():
+            p = by_uuid[uuid_]
+            info = {"uuid": uuid_, "name": name, "bytesLoaded": p.get("bytesLoaded") or 0, "bytesTotal": p.get("bytesTotal") or 0}
+            old = prev.get(uuid_)
+            if old is None:
+                found.append(("package.added", info))
+            elif milestone > old[1] and not finished:
+                found.append(("package.progress", {**info, "percent": milestone}))
+            if finished and (old is None or not old[2]):
+                found.append(("package.finished", info))
+        for uuid_, (name, _, _) in prev.items():
+            if uuid_ not in current:
+                found.append(("package.removed", {"uuid": uuid_, "name": name}))
+        return [self.emit(t, instance, data) for t, data in found]
+
+    def observe_links(self, instance: str, rows: List[Dict[str, Any]], emit: bool = True) -> List[Event]:
+        current = {l.get("uuid"): str(l.get("availability") or "") for l in rows if l.get("uuid") is not None}
+        with self._lock:
+            prev = self._links.get(instance)
+            self._links[instance] = current
+        if prev is None or not emit:
+            return []
+        found = []
+        for l in rows:
+            uuid_ = l.get("uuid")
+            if current.get(uuid_) == "OFFLINE" and prev.get(uuid_) != "OFFLINE":
+                found.append({k: l.get(k) for k in ("uuid", "name", "url", "host", "packageUUID")})
+        return [self.emit("link.offline", instance, data) for data in found]
+
+    def crawl_complete(self, instance: str, job: Dict[str, Any]) -> Event:
+        return self.emit("crawl.complete", instance, {"jobId": job.get("jobId"), "crawled": job.get("crawled")})
+
+class CrawlWatch:
+    """Polls the crawl jobs that "Add links" started until JD has finished them,
+    then emits ``crawl.complete`` for each. Runs only while jobs are pending."""
+
+    def __init__(self, engine: EventEngine, interval: float = 2.0, max_age: float = 3600.0):
+        self.engine = engine
+        self.interval = interval
+        self.max_age = max_age  # give up on jobs JD never reports as done
+        self._lock = threading.Lock()
+        self._jobs: Dict[Tuple[str, int], Tuple[Any, float]] = {}  # (instance, job id) -> (provider, since)
+        self._thread: Optional[threading.Thread] = None
+
+    def watch(self, instance: str, provider: Any, job_ids: Iterable[int]) -> None:
+        now = time.monotonic()
+        with self._lock:
+            for job_id in job_ids:
+                self._jobs[(instance, int(job_id))] = (provider, now)
+            if self._jobs and (self._thread is None or not self._thread.is_alive()):
+                self._thread = threading.Thread(target=self._run, name="crawl-watch", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._jobs:
+                    self._thread = None
+                    return
+                groups: Dict[Tuple[str, int], Tuple[Any, List[int]]] = {}
+                for (instance, job_id), (provider, since) in list(self._jobs.items()):
+                    if time.monotonic() - since > self.max_age:
+                        del self._jobs[(instance, job_id)]
+                        continue
+                    groups.setdefault((instance, id(provider)), (provider, []))[1].append(job_id)
+            for (instance, _), (provider, job_ids) in groups.items():
+                try:
+                    jobs = provider.get_crawl_jobs(job_ids)
+                except Exception as e:
+                    log.warning("crawl watch: %s", e)
+                    continue
+                # JD forgets finished jobs after a while: a job it no longer lists is done too
+                reported = {job.get("jobId"): job for job in jobs}
+                for job_id in job_ids:
+                    job = reported.get(job_id, {"jobId": job_id})
+                    if job.get("crawling") or job.get("checking"):
+                        continue
+                    with self._lock:
+                        known = self._jobs.pop((instance, job_id), None)
+                    if known is not None:
+                        self.engine.crawl_complete(instance, job)
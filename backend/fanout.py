@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Shared by all requests so a fan-out never pays thread start-up; a stuck call only
+# ever occupies one of these workers, never the request thread past its deadline.
+_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="fanout")
+
+@dataclass
+class InstanceResult:
+    instance_id: str
+    name: str
+    ok: bool
+    data: Any = None
+    error: Optional[str] = None
+    elapsed_ms: int = 0
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "id": self.instance_id,
+            "name": self.name,
+            "ok": self.ok,
+            "error": self.error,
+            "elapsed_ms": self.elapsed_ms,
+        }
+
+def _timed(fn: Callable[[], Any]) -> Tuple[Any, int]:
+    t0 = time.monotonic()
+    data = fn()
+    return data, int((time.monotonic() - t0) * 1000)
+
+def fan_out(calls: List[Tuple[str, str, float, Callable[[], Any]]]) -> List[InstanceResult]:
+    """Run one call per instance concurrently.
+
+    ``calls`` holds (instance_id, name, deadline_seconds, fn). Each instance is
+    given its own deadline measured from submission, so the whole fan-out takes
+    as long as the slowest instance that answers in time, not the sum of all.
+    Instances that raise or miss their deadline come back with ok=False.
+    """
+    started = time.monotonic()
+    submitted = [(inst_id, name, started + deadline, _pool.submit(_timed, fn)) for inst_id, name, deadline, fn in calls]
+    results: List[InstanceResult] = []
+    for inst_id, name, deadline, fut in submitted:
+        try:
+            data, elapsed_ms = fut.result(timeout=max(0.0, deadline - time.monotonic()))
+            res = InstanceResult(inst_id, name, ok=True, data=data, elapsed_ms=elapsed_ms)
+        except FutureTimeout:
+            fut.cancel()
+            res = InstanceResult(inst_id, name, ok=False, error="Timed out")
+            res.elapsed_ms = int((time.monotonic() - started) * 1000)
+        except Exception as e:
+            res = InstanceResult(inst_id, name, ok=False, error=str(e))
+            res.elapsed_ms = int((time.monotonic() - started) * 1000)
+        results.append(res)
+    return results
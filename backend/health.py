@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from .providers.base import Provider
+from .providers.local_api import probe_help  # noqa: F401  (re-exported for the setup wizard)
+
+@dataclass(frozen=True)
+class HealthState:
+    ok: bool
+    message: str
+    checked_at: float     # time.time() of the probe, 0 if never probed
+    latency_ms: int = 0
+
+    @property
+    def age(self) -> Optional[float]:
+        if self.checked_at <= 0:
+            return None
+        return max(0.0, time.time() - self.checked_at)
+
+class HealthProber:
+    """Probes one provider (``provider.probe()``) in the background and keeps the last result.
+
+    Results also drive the provider's circuit breaker, so a recovered JD closes
+    the circuit without waiting for a user request to act as the trial call.
+    """
+
+    def __init__(self, provider: Provider, interval: float = 10.0):
+        self.provider = provider
+        self.interval = max(1.0, interval)
+        self._state = HealthState(ok=False, message="Not checked yet.", checked_at=0.0)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"health-{provider.base_url}", daemon=True)
+        self._thread.start()
+
+    @property
+    def state(self) -> HealthState:
+        return self._state
+
+    def check_now(self) -> HealthState:
+        started = time.monotonic()
+        ok, msg = self.provider.probe()
+        if ok:
+            self.provider.breaker.record_success()
+        else:
+            self.provider.breaker.record_failure()
+        self._state = HealthState(ok=ok, message=msg, checked_at=time.time(), latency_ms=int((time.monotonic() - started) * 1000))
+        return self._state
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.check_now()
+            self._stop.wait(self.interval)
@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import math
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional
+
+class _Ring:
+    """Fixed-size (timestamp, bytesLoaded, speed) history of one package."""
+
+    __slots__ = ("ts", "loaded", "speed", "head", "count", "ewma", "last_ts", "last_sample", "spark")
+
+    def __init__(self, slots: int):
+        self.ts = array("d", bytes(8 * slots))
+        self.loaded = array("q", bytes(8 * slots))
+        self.speed = array("q", bytes(8 * slots))
+        self.head = 0        # next slot to write
+        self.count = 0
+        self.ewma: Optional[float] = None
+        self.last_ts = 0.0
+        self.last_sample = 0.0
+        self.spark = array("q")  # downsampled speeds, rebuilt only when a sample is added
+
+    def push(self, ts: float, loaded: int, speed: int) -> None:
+        n = len(self.ts)
+        self.ts[self.head] = ts
+        self.loaded[self.head] = loaded
+        self.speed[self.head] = speed
+        self.head = (self.head + 1) % n
+        self.count = min(self.count + 1, n)
+
+    def speeds(self) -> List[int]:
+        """Stored speeds, oldest first."""
+        if self.count < len(self.speed):
+            return self.speed[:self.count].tolist()
+        return (self.speed[self.head:] + self.speed[:self.head]).tolist()
+
+    def nbytes(self, spark_points: int) -> int:
+        return sum(a.buffer_info()[1] * a.itemsize for a in (self.ts, self.loaded, self.speed)) + 8 * spark_points
+
+class PackageHistory:
+    """Per-package speed/progress history behind the smoothed fields of ``/api/packages``.
+
+    ``annotate`` is called with every fresh package list. It samples each package
+    into its ring buffer (at most every ``sample_interval`` seconds, so a buffer
+    spans ``slots * sample_interval`` of history whatever the poll rate), updates
+    a time-weighted EWMA of the reported speed, and returns the rows with
+    ``speedAvg``, ``etaAvg`` (seconds, None when idle) and ``spark`` (speed series,
+    ``spark_points`` values in bytes/s) added.
+
+    Memory is fixed: rings are preallocated and the number of them is capped at
+    ``max_bytes``; packages that leave the list are dropped immediately, and the
+    least recently seen ones go first when the cap is reached.
+    """
+
+    def __init__(
+        self,
+        slots: int = 60,
+        sample_interval: float = 10.0,
+        tau: float = 20.0,
+        spark_points: int = 20,
+        max_bytes: int = 8 * 1024 * 1024,
+    ):
+        self.slots = max(2, slots)
+        self.sample_interval = sample_interval
+        self.tau = tau
+        self.spark_points = spark_points
+        self.max_rings = max(1, max_bytes // _Ring(self.slots).nbytes(spark_points))
+        self._lock = threading.Lock()
+        self._rings: "OrderedDict[Hashable, _Ring]" = OrderedDict()
+
+    def annotate(self, scope: str, rows: List[Dict[str, Any]], now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Record ``rows`` (one instance's full, freshly fetched package list) and add the
+        smoothed fields to them in place."""
+        now = time.time() if now is None else now
+        seen = set()
+        with self._lock:
+            for p in rows:
+                key = (scope, p.get("uuid"))
+                seen.add(key)
+                ring = self._rings.get(key)
+                if ring is None:
+                    ring = self._rings[key] = _Ring(self.slots)
+                else:
+                    self._rings.move_to_end(key)
+                p.update(self._update(ring, p, now))
+            # Packages that disappeared from this instance are gone for good
+            for key in [k for k in self._rings if k[0] == scope and k not in seen]:
+                del self._rings[key]
+            while len(self._rings) > self.max_rings:
+                self._rings.popitem(last=False)
+        return rows
+
+    def _update(self, ring: _Ring, p: Dict[str, Any], now: float) -> Dict[str, Any]:
+        speed = int(p.get("speed") or 0) if p.get("running") else 0
+        loaded = int(p.get("bytesLoaded") or 0)
+        if ring.ewma is None:
+            ring.ewma = float(speed)
+        else:
+            # Time-weighted so the smoothing is the same at any poll interval
+            alpha = 1.0 - math.exp(-max(0.0, now - ring.last_ts) / self.tau)
+            ring.ewma += alpha * (speed - ring.ewma)
+        ring.last_ts = now
+        if ring.count == 0 or now - ring.last_sample >= self.sample_interval:
+            ring.push(now, loaded, speed)
+            ring.last_sample = now
+            ring.spark = array("q", self._spark(ring))
+
+        remaining = max(0, int(p.get("bytesTotal") or 0) - loaded)
+        avg = int(ring.ewma)
+        return {
+            "speedAvg": avg,
+            "etaAvg": int(remaining / avg) if avg > 0 and remaining > 0 else None,
+            "spark": ring.spark.tolist(),
+        }
+
+    def _spark(self, ring: _Ring) -> List[int]:
+        speeds = ring.speeds()
+        if len(speeds) <= self.spark_points:
+            return speeds
+        # Average into spark_points buckets
+        step = len(speeds) / self.spark_points
+        return [
+            int(sum(speeds[int(i * step):int((i + 1) * step)]) / max(1, int((i + 1) * step) - int(i * step)))
+            for i in range(self.spark_points)
+        ]
+
+    def __len__(self) -> int:
+        return len(self._rings)
@@ -1,4 +1,5 @@
 from __future__ import annotations
+import asyncio
 from abc import ABC, abstractmethod
 from typing import Optional, List, Dict, Any
 
@@ -7,10 +8,27 @@ class Provider(ABC):
     def get_packages(self) -> List[Dict[str, Any]]:
         raise NotImplementedError
 
+    @abstractmethod
+    def get_package_links(self, package_id: int, start: int = 0, limit: int = 50) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def aget_package_links(self, package_id: int, start: int = 0, limit: int = 50) -> List[Dict[str, Any]]:
+        """``get_package_links`` for the async server; providers without an async
+        transport run the blocking call on a worker thread."""
+        return await asyncio.to_thread(self.get_package_links, package_id, start, limit)
+
     @abstractmethod
     def add_links(self, links: str, package: str, dest: Optional[str], autostart: bool) -> Dict[str, Any]:
         raise NotImplementedError
 
+    @abstractmethod
+    def get_crawl_jobs(self, job_ids: List[int]) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_download_urls(self) -> List[str]:
+        raise NotImplementedError
+
     @abstractmethod
     def remove_packages(self, package_ids: List[int], link_ids: Optional[List[int]] = None) -> Dict[str, Any]:
         raise NotImplementedError
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import requests
+
+from .base import Provider
+from .circuit import CircuitOpenError
+from .local_api import LocalProvider
+from .myjd_api import MyJDProvider
+
+# Reads may go to the fallback on any transport error. Writes only when the
+# local call certainly never reached JD, so an action is never applied twice.
+_READ_ERRORS = (CircuitOpenError, requests.RequestException)
+_WRITE_ERRORS = (CircuitOpenError, requests.ConnectTimeout)
+
+class FailoverProvider(Provider):
+    """Local API first, MyJDownloader when the local instance is unreachable
+    (``behavior.failover_on_unreachable``).
+
+    Health, timeouts and the circuit breaker are the local provider's: once its
+    circuit opens, calls go straight to the fallback until a probe closes it.
+    """
+
+    def __init__(self, primary: LocalProvider, fallback: MyJDProvider):
+        self.primary = primary
+        self.fallback = fallback
+        self.active = "local"
+
+    @property
+    def base_url(self) -> str:
+        return self.primary.base_url
+
+    @property
+    def breaker(self):
+        return self.primary.breaker
+
+    @property
+    def latency(self):
+        return self.primary.latency
+
+    def timeout_for(self, path: str) -> float:
+        return self.primary.timeout_for(path)
+
+    def probe(self) -> Tuple[bool, str]:
+        return self.primary.probe()
+
+    def close(self) -> None:
+        self.primary.close()
+        self.fallback.close()
+
+    def _run(self, errors: tuple, call: Callable[[Provider], Any]) -> Any:
+        try:
+            result = call(self.primary)
+            self.active = "local"
+            return result
+        except errors:
+            result = call(self.fallback)
+            self.active = "myjd"
+            return result
+
+    def get_packages(self) -> List[Dict[str, Any]]:
+        return self._run(_READ_ERRORS, lambda p: p.get_packages())
+
+    def get_package_links(self, package_id: int, start: int = 0, limit: int = 50) -> List[Dict[str, Any]]:
+        return self._run(_READ_ERRORS, lambda p: p.get_package_links(package_id, start, limit))
+
+    def add_links(self, links: str, package: str, dest: Optional[str], autostart: bool) -> Dict[str, Any]:
+        return self._run(_WRITE_ERRORS, lambda p: p.add_links(links, package, dest, autostart))
+
+    def get_crawl_jobs(self, job_ids: List[int]) -> List[Dict[str, Any]]:
+        return self._run(_READ_ERRORS, lambda p: p.get_crawl_jobs(job_ids))
+
+    def get_download_urls(self) -> List[str]:
+        return self._run(_READ_ERRORS, lambda p: p.get_download_urls())
+
+    def remove_packages(self, package_ids: List[int], link_ids: Optional[List[int]] = None) -> Dict[str, Any]:
+        return self._run(_WRITE_ERRORS, lambda p: p.remove_packages(package_ids, link_ids))
+
+    def cleanup_packages(self, package_ids: List[int], link_ids: Optional[List[int]] = None) -> Dict[str, Any]:
+        return self._run(_WRITE_ERRORS, lambda p: p.cleanup_packages(package_ids, link_ids))
+
+    def get_linkgrabber_links(self) -> List[Dict[str, Any]]:
+        return self._run(_READ_ERRORS, lambda p: p.get_linkgrabber_links())
+
+    def start_linkgrabber_downloads(self, link_ids: List[int], package_ids: Optional[List[int]] = None) -> Dict[str, Any]:
+        return self._run(_WRITE_ERRORS, lambda p: p.start_linkgrabber_downloads(link_ids, package_ids))
+
+    def remove_linkgrabber_links(self, link_ids: List[int], package_ids: Optional[List[int]] = None) -> Dict[str, Any]:
+        return self._run(_WRITE_ERRORS, lambda p: p.remove_linkgrabber_links(link_ids, package_ids))
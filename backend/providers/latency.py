@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import threading
+from collections import deque
+from typing import Deque, Dict, List
+
+class LatencyTracker:
+    """Rolling per-endpoint latency samples for one JD instance, used to size timeouts.
+
+    The timeout for an endpoint is its observed p99 times ``factor``, clamped to
+    [``floor``, ``ceiling``]. Until ``min_samples`` calls have been seen the
+    configured ``default`` is used. Only answered calls are samples: a timed-out
+    call says nothing about how long JD takes, and recording it at the timeout it
+    hit would make every run of timeouts raise the next timeout. A JD that really
+    got slower still moves it, through the retries' longer timeouts.
+
+    >>> t = LatencyTracker(0.8, floor=0.2, ceiling=10.0)
+    >>> for _ in range(50):
+    ...     t.record("queryPackages", 0.05)
+    >>> before = t.timeout_for("queryPackages")
+    >>> for _ in range(50):
+    ...     t.record_failure("queryPackages")
+    >>> t.timeout_for("queryPackages") <= before, t.failures("queryPackages")
+    (True, 50)
+    """
+
+    def __init__(
+        self,
+        default: float,
+        floor: float,
+        ceiling: float,
+        factor: float = 3.0,
+        window: int = 256,
+        min_samples: int = 20,
+    ):
+        self.floor = floor
+        self.ceiling = max(floor, ceiling)
+        self.default = min(max(default, self.floor), self.ceiling)
+        self.factor = factor
+        self.window = window
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._samples: Dict[str, Deque[float]] = {}
+        self._failures: Dict[str, int] = {}
+
+    def record(self, endpoint: str, seconds: float) -> None:
+        with self._lock:
+            samples = self._samples.get(endpoint)
+            if samples is None:
+                samples = self._samples[endpoint] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def record_failure(self, endpoint: str) -> None:
+        """Count a call that got no answer (timeout or probe failure); it does not affect the timeout."""
+        with self._lock:
+            self._failures[endpoint] = self._failures.get(endpoint, 0) + 1
+
+    def failures(self, endpoint: str) -> int:
+        with self._lock:
+            return self._failures.get(endpoint, 0)
+
+    def percentile(self, endpoint: str, q: float) -> float:
+        """The q-th percentile (0..100) of recent samples, 0.0 if there are none."""
+        with self._lock:
+            ordered = sorted(self._samples.get(endpoint) or ())
+        if not ordered:
+            return 0.0
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100.0))]
+
+    def timeout_for(self, endpoint: str) -> float:
+        with self._lock:
+            count = len(self._samples.get(endpoint) or ())
+        if count < self.min_samples:
+            return self.default
+        return min(max(self.percentile(endpoint, 99) * self.factor, self.floor), self.ceiling)
+
+    def endpoints(self) -> List[str]:
+        with self._lock:
+            return list(self._samples)
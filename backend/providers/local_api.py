@@ -1,26 +1,237 @@
 from __future__ import annotations
 
+import asyncio
 import json
-from typing import Any, Dict, List, Optional
+import random
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlencode
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
+try:  # only needed by the async server (JD_MOBILE_SERVER=asgi)
+    import httpx
+except ImportError:  # pragma: no cover - depends on the environment
+    httpx = None
+
+from .. import metrics, timing
 from .base import Provider
+from .circuit import CircuitBreaker, CircuitOpenError
+from .latency import LatencyTracker
+
+# Field selections shared with the MyJDownloader provider (same JD2 API, other transport)
+PACKAGE_QUERY = {
+    "name": True,
+    "uuid": True,
+    "bytesTotal": True,
+    "bytesLoaded": True,
+    "enabled": True,
+    "running": True,
+    "finished": True,
+    "eta": True,
+    "speed": True,
+}
+PACKAGE_LINK_FIELDS = {
+    "name": True,
+    "uuid": True,
+    "host": True,
+    "status": True,
+    "speed": True,
+    "bytesTotal": True,
+    "bytesLoaded": True,
+    "finished": True,
+    "running": True,
+}
+LINKGRABBER_QUERY = {
+    "name": True,
+    "uuid": True,
+    "packageUUID": True,
+    "url": True,
+    "bytesTotal": True,
+    "host": True,
+    "availability": True,
+}
+# Links per downloadsV2/queryLinks page when collecting the download list's URLs
+DOWNLOAD_URLS_PAGE = 1000
+CLEANUP_ARGS = {"action": "DELETE_ALL", "mode": "REMOVE_LINKS_AND_DELETE_FILES", "selectionType": "SELECTED"}
+
+def probe_help(base_url: str, timeout_ms: int = 800, session: Optional[requests.Session] = None) -> Tuple[bool, str]:
+    """Check that ``{base_url}/help`` answers like a JDownloader Local API."""
+    base_url = (base_url or "").strip().rstrip("/")
+    if not base_url:
+        return False, "Base URL is empty."
+    try:
+        r = (session or requests).get(f"{base_url}/help", timeout=max(0.1, timeout_ms / 1000.0))
+        if r.status_code != 200:
+            return False, f"HTTP {r.status_code} from {base_url}/help"
+        # Light validation
+        body = r.text.lower()
+        if "jdownloader" not in body and "downloads" not in body and "linkgrabber" not in body:
+            return True, "Connected (help endpoint reachable), but response did not contain expected keywords."
+        return True, "Connected."
+    except Exception as e:
+        return False, str(e)
 
 class LocalProvider(Provider):
-    def __init__(self, base_url: str, timeout_ms: int = 800):
+    # Actions are GETs with JSON-encoded id lists in the query string; keep each
+    # request URL well below common server/proxy limits (~8 KiB).
+    MAX_URL_LENGTH = 6000
+    # Idempotent queries get this many extra attempts, with full-jitter backoff
+    QUERY_RETRIES = 2
+    RETRY_BACKOFF_S = 0.1
+    RETRY_STATUSES = (502, 503, 504)
+
+    def __init__(
+        self,
+        base_url: str,
+        timeout_ms: int = 800,
+        pool_size: int = 4,
+        min_timeout_ms: int = 200,
+        max_timeout_ms: int = 10000,
+        instance: str = "",
+    ):
         self.base_url = (base_url or "").strip().rstrip("/")
+        self.instance = instance  # metrics label
         self.timeout = max(0.1, timeout_ms / 1000.0)
+        self.pool_size = max(1, pool_size)
+        self.session = self._make_session(self.pool_size)
+        self._aclient = None  # httpx.AsyncClient, created on first async call
+        self._aloop: Optional[asyncio.AbstractEventLoop] = None  # the loop it belongs to
+        self.breaker = CircuitBreaker()
+        self.latency = LatencyTracker(self.timeout, floor=min_timeout_ms / 1000.0, ceiling=max_timeout_ms / 1000.0)
 
-    def _get(self, path: str, query: Optional[dict] = None) -> Dict[str, Any]:
-        url = f"{self.base_url}/{path.lstrip('/')}"
+    @staticmethod
+    def _make_session(pool_size: int) -> requests.Session:
+        # Keep-alive connections to the single JD host. Only connection failures are
+        # retried (the request never reached JD), so actions are never sent twice.
+        retry = Retry(total=1, connect=1, read=0, status=0, other=0, backoff_factor=0.05, raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        s = requests.Session()
+        s.mount("http://", adapter)
+        s.mount("https://", adapter)
+        s.headers["Connection"] = "keep-alive"
+        return s
+
+    def close(self) -> None:
+        self.session.close()
+        # The async client belongs to the server's event loop and can only be closed there
+        client, loop = self._aclient, self._aloop
+        self._aclient = self._aloop = None
+        if client is not None and loop is not None and not loop.is_closed():
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+
+    def probe(self) -> Tuple[bool, str]:
+        """One ``/help`` round trip, for the background health prober."""
+        started = time.monotonic()
+        timeout = self.timeout_for("help")
+        ok, msg = probe_help(self.base_url, int(timeout * 1000), session=self.session)
+        # A failed probe is no latency sample: a dead host keeps the timeout it had
+        if ok:
+            self.latency.record("help", time.monotonic() - started)
+        else:
+            self.latency.record_failure("help")
+        return ok, msg
+
+    def timeout_for(self, path: str) -> float:
+        """Current timeout for ``path``, derived from its observed latency."""
+        return self.latency.timeout_for(path.lstrip("/"))
+
+    def _request(self, path: str, params: Dict[str, str], idempotent: bool = False) -> requests.Response:
+        # Fail fast while JD is known to be down instead of blocking for the full timeout
+        if not self.breaker.allow():
+            metrics.upstream_rejected.inc(instance=self.instance)
+            raise CircuitOpenError(f"JDownloader at {self.base_url} is unreachable (circuit open).")
+        endpoint = path.lstrip("/")
+        url = f"{self.base_url}/{endpoint}"
+        attempts = 1 + (self.QUERY_RETRIES if idempotent else 0)
+        timeout = self.latency.timeout_for(endpoint)
+        for attempt in range(attempts):
+            last = attempt == attempts - 1
+            started = time.monotonic()
+            try:
+                r = self.session.get(url, params=params, timeout=timeout)
+            except requests.Timeout:
+                self.latency.record_failure(endpoint)
+                metrics.upstream_seconds.observe(time.monotonic() - started, endpoint=endpoint, status="timeout", instance=self.instance)
+                if last:
+                    self.breaker.record_failure()
+                    raise
+            except requests.RequestException:
+                metrics.upstream_seconds.observe(time.monotonic() - started, endpoint=endpoint, status="error", instance=self.instance)
+                if last:
+                    self.breaker.record_failure()
+                    raise
+            else:
+                elapsed = time.monotonic() - started
+                self.latency.record(endpoint, elapsed)
+                metrics.upstream_seconds.observe(elapsed, endpoint=endpoint, status=str(r.status_code), instance=self.instance)
+                if last or r.status_code not in self.RETRY_STATUSES:
+                    break
+            # Only reached for idempotent queries; writes are never sent twice
+            time.sleep(random.uniform(0, self.RETRY_BACKOFF_S * (2 ** attempt)))
+            timeout = min(timeout * 1.5, self.latency.ceiling)
+        if r.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        r.raise_for_status()
+        return r
+
+    async def _arequest(self, path: str, params: Dict[str, str]) -> "httpx.Response":
+        """Async ``_request`` for idempotent queries: same breaker, adaptive timeout,
+        retries and metrics, without holding a thread while JD answers."""
+        if not self.breaker.allow():
+            metrics.upstream_rejected.inc(instance=self.instance)
+            raise CircuitOpenError(f"JDownloader at {self.base_url} is unreachable (circuit open).")
+        if self._aclient is None:
+            self._aclient = httpx.AsyncClient(limits=httpx.Limits(max_keepalive_connections=self.pool_size))
+            self._aloop = asyncio.get_running_loop()
+        endpoint = path.lstrip("/")
+        url = f"{self.base_url}/{endpoint}"
+        attempts = 1 + self.QUERY_RETRIES
+        timeout = self.latency.timeout_for(endpoint)
+        for attempt in range(attempts):
+            last = attempt == attempts - 1
+            started = time.monotonic()
+            try:
+                r = await self._aclient.get(url, params=params, timeout=timeout)
+            except httpx.TimeoutException:
+                self.latency.record_failure(endpoint)
+                metrics.upstream_seconds.observe(time.monotonic() - started, endpoint=endpoint, status="timeout", instance=self.instance)
+                if last:
+                    self.breaker.record_failure()
+                    raise
+            except httpx.HTTPError:
+                metrics.upstream_seconds.observe(time.monotonic() - started, endpoint=endpoint, status="error", instance=self.instance)
+                if last:
+                    self.breaker.record_failure()
+                    raise
+            else:
+                elapsed = time.monotonic() - started
+                self.latency.record(endpoint, elapsed)
+                metrics.upstream_seconds.observe(elapsed, endpoint=endpoint, status=str(r.status_code), instance=self.instance)
+                if last or r.status_code not in self.RETRY_STATUSES:
+                    break
+            await asyncio.sleep(random.uniform(0, self.RETRY_BACKOFF_S * (2 ** attempt)))
+            timeout = min(timeout * 1.5, self.latency.ceiling)
+        if r.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        r.raise_for_status()
+        return r
+
+    def _get(self, path: str, query: Optional[dict] = None, idempotent: bool = True) -> Dict[str, Any]:
         params = {}
         if query is not None:
             params["query"] = json.dumps(query)
-        r = requests.get(url, params=params, timeout=self.timeout)
-        r.raise_for_status()
+        with timing.span("jd", path.lstrip("/")):
+            r = self._request(path, params, idempotent=idempotent)
         try:
-            return r.json()
+            with timing.span("json"):
+                return r.json()
         except Exception:
             # Some JD endpoints may respond with plain text; wrap it.
             return {"data": r.text}
@@ -29,28 +240,58 @@ class LocalProvider(Provider):
         """Call a JD2 action endpoint that takes named parameters as individual
         JSON-encoded query string values (e.g. removePackages(long[] linkIds, long[] packageIds)).
         Each kwarg value is JSON-encoded regardless of type."""
-        url = f"{self.base_url}/{path.lstrip('/')}"
         params = {k: json.dumps(v) for k, v in kwargs.items()}
-        r = requests.get(url, params=params, timeout=self.timeout)
-        r.raise_for_status()
+        with timing.span("jd", path.lstrip("/")):
+            r = self._request(path, params)
         try:
-            return r.json()
+            with timing.span("json"):
+                return r.json()
         except Exception:
             return {"data": r.text}
 
+    def _chunked_action(self, path: str, list_param: str, ids: List[int], **kwargs: Any) -> Dict[str, Any]:
+        """Like ``_action`` but splits ``ids`` (sent as ``list_param``) over as many calls
+        as needed to keep every URL under MAX_URL_LENGTH."""
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        fixed = len(url) + len(urlencode({k: json.dumps(v) for k, v in kwargs.items()})) + len(list_param) + 16
+        budget = max(256, self.MAX_URL_LENGTH - fixed)
+        chunks: List[List[int]] = []
+        chunk: List[int] = []
+        used = 0
+        for i in ids:
+            cost = len(str(i)) + 4  # digits + url-encoded ", "
+            if chunk and used + cost > budget:
+                chunks.append(chunk)
+                chunk, used = [], 0
+            chunk.append(i)
+            used += cost
+        chunks.append(chunk)
+        results = [self._action(path, **{list_param: c}, **kwargs) for c in chunks]
+        if len(results) == 1:
+            return results[0]
+        return {"data": [r.get("data") for r in results]}
+
     def get_packages(self) -> List[Dict[str, Any]]:
+        data = self._get("downloadsV2/queryPackages", PACKAGE_QUERY)
+        return data.get("data", []) if isinstance(data, dict) else []
+
+    def get_package_links(self, package_id: int, start: int = 0, limit: int = 50) -> List[Dict[str, Any]]:
+        # Paged with startAt/maxResults so huge packages never come down in one response
         q = {
-            "name": True,
-            "uuid": True,
-            "bytesTotal": True,
-            "bytesLoaded": True,
-            "enabled": True,
-            "running": True,
-            "finished": True,
-            "eta": True,
-            "speed": True,
+            "packageUUIDs": [package_id],
+            "startAt": max(0, start),
+            "maxResults": max(1, limit),
+            **PACKAGE_LINK_FIELDS,
         }
-        data = self._get("downloadsV2/queryPackages", q)
+        data = self._get("downloadsV2/queryLinks", q)
+        return data.get("data", []) if isinstance(data, dict) else []
+
+    async def aget_package_links(self, package_id: int, start: int = 0, limit: int = 50) -> List[Dict[str, Any]]:
+        if httpx is None:
+            return await super().aget_package_links(package_id, start, limit)
+        q = {"packageUUIDs": [package_id], "startAt": max(0, start), "maxResults": max(1, limit), **PACKAGE_LINK_FIELDS}
+        r = await self._arequest("downloadsV2/queryLinks", {"query": json.dumps(q)})
+        data = r.json()
         return data.get("data", []) if isinstance(data, dict) else []
 
     def add_links(self, links: str, package: str, dest: Optional[str], autostart: bool) -> Dict[str, Any]:
@@ -62,36 +303,44 @@ class LocalProvider(Provider):
         }
         if dest:
             q["destinationFolder"] = dest
-        return self._get("linkgrabberv2/addLinks", q)
+        # A write: never retried, a timed-out add may still have reached JD
+        return self._get("linkgrabberv2/addLinks", q, idempotent=False)
+
+    def get_crawl_jobs(self, job_ids: List[int]) -> List[Dict[str, Any]]:
+        # Jobs come from addLinks(assignJobID=true); "crawling"/"checking" go false when done
+        data = self._get("linkgrabberv2/queryLinkCrawlerJobs", {"jobIds": job_ids, "collectorInfo": True})
+        return data.get("data", []) if isinstance(data, dict) else []
+
+    def get_download_urls(self) -> List[str]:
+        # Paged like the package file lists, so no single response holds every link
+        urls: List[str] = []
+        start = 0
+        while True:
+            data = self._get("downloadsV2/queryLinks", {"url": True, "startAt": start, "maxResults": DOWNLOAD_URLS_PAGE})
+            rows = data.get("data", []) if isinstance(data, dict) else []
+            urls.extend(l["url"] for l in rows if l.get("url"))
+            if len(rows) < DOWNLOAD_URLS_PAGE:
+                return urls
+            start += len(rows)
 
     def remove_packages(self, package_ids: List[int], link_ids: Optional[List[int]] = None) -> Dict[str, Any]:
-        return self._action("downloadsV2/removeLinks", linkIds=link_ids or [], packageIds=package_ids)
+        return self._chunked_action("downloadsV2/removeLinks", "packageIds", package_ids, linkIds=link_ids or [])
 
     def cleanup_packages(self, package_ids: List[int], link_ids: Optional[List[int]] = None) -> Dict[str, Any]:
-        return self._action(
+        return self._chunked_action(
             "downloadsV2/cleanup",
+            "packageIds",
+            package_ids,
             linkIds=link_ids or [],
-            packageIds=package_ids,
-            action="DELETE_ALL",
-            mode="REMOVE_LINKS_AND_DELETE_FILES",
-            selectionType="SELECTED",
+            **CLEANUP_ARGS,
         )
 
     def get_linkgrabber_links(self) -> List[Dict[str, Any]]:
-        q = {
-            "name": True,
-            "uuid": True,
-            "packageUUID": True,
-            "url": True,
-            "bytesTotal": True,
-            "host": True,
-            "availability": True,
-        }
-        data = self._get("linkgrabberv2/queryLinks", q)
+        data = self._get("linkgrabberv2/queryLinks", LINKGRABBER_QUERY)
         return data.get("data", []) if isinstance(data, dict) else []
 
     def start_linkgrabber_downloads(self, link_ids: List[int], package_ids: Optional[List[int]] = None) -> Dict[str, Any]:
-        return self._action("linkgrabberv2/moveToDownloadlist", linkIds=link_ids, packageIds=package_ids or [])
+        return self._chunked_action("linkgrabberv2/moveToDownloadlist", "linkIds", link_ids, packageIds=package_ids or [])
 
     def remove_linkgrabber_links(self, link_ids: List[int], package_ids: Optional[List[int]] = None) -> Dict[str, Any]:
-        return self._action("linkgrabberv2/removeLinks", linkIds=link_ids, packageIds=package_ids or [])
+        return self._chunked_action("linkgrabberv2/removeLinks", "linkIds", link_ids, packageIds=package_ids or [])
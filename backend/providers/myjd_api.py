@@ -1,20 +1,313 @@
 from __future__ import annotations
 
-from typing import Any, Dict, List, Optional
+import base64
+import hashlib
+import hmac
+import json
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import quote
 
+import requests
+
+try:
+    from Crypto.Cipher import AES
+except ImportError:  # pragma: no cover - pycryptodome is in requirements.txt
+    AES = None
+
+from .. import metrics, timing
+from ..cache import TTLCache
 from .base import Provider
+from .circuit import CircuitBreaker, CircuitOpenError
+from .local_api import CLEANUP_ARGS, DOWNLOAD_URLS_PAGE, LINKGRABBER_QUERY, PACKAGE_LINK_FIELDS, PACKAGE_QUERY, LocalProvider
+
+DEFAULT_API_URL = "https://api.jdownloader.org"
+APP_KEY = "JD-Mobile"
+
+def secret(email: str, password: str, domain: str) -> bytes:
+    return hashlib.sha256(email.lower().encode("utf-8") + password.encode("utf-8") + domain.encode("utf-8")).digest()
+
+def derive(key: bytes, session_token: str) -> bytes:
+    return hashlib.sha256(key + bytes.fromhex(session_token)).digest()
+
+def sign(key: bytes, data: str) -> str:
+    return hmac.new(key, data.encode("utf-8"), hashlib.sha256).hexdigest()
+
+def encrypt(key: bytes, data: str) -> str:
+    # AES-128-CBC: the first half of the 32-byte secret is the IV, the second half the key
+    raw = data.encode("utf-8")
+    pad = 16 - len(raw) % 16
+    cipher = AES.new(key[16:], AES.MODE_CBC, key[:16])
+    return base64.b64encode(cipher.encrypt(raw + bytes([pad]) * pad)).decode("ascii")
+
+def decrypt(key: bytes, data: str) -> str:
+    cipher = AES.new(key[16:], AES.MODE_CBC, key[:16])
+    raw = cipher.decrypt(base64.b64decode(data))
+    return raw[: -raw[-1]].decode("utf-8")
+
+class MyJDError(RuntimeError):
+    """An error reported by the MyJDownloader server or the device (``type`` is e.g. TOKEN_INVALID)."""
+
+    def __init__(self, type_: str, src: str = "MYJD", status: int = 0):
+        super().__init__(f"MyJDownloader {src} error: {type_}")
+        self.type = type_
+        self.src = src
+        self.status = status
 
 class MyJDProvider(Provider):
-    """Stub provider (v0.4 roadmap).
+    """JD2 API over the MyJDownloader cloud relay.
 
-    This exists so the app structure is ready for the fallback provider without refactoring.
+    The session token and the keys derived from it are kept for the life of the
+    provider and renewed with ``/my/reconnect`` shortly before they age out, so a
+    normal call costs one encrypted POST to the device. The device list is cached
+    too; only an unknown or offline device triggers a fresh lookup.
     """
 
-    def __init__(self, *args, **kwargs):
-        raise RuntimeError("MyJDownloader provider is not implemented yet (roadmap v0.4).")
+    # Renew the session this long after it was issued (the server expires it later)
+    TOKEN_REFRESH_S = 20 * 60
+    DEVICE_TTL_S = 300.0
+    # MyJDError types that mean the device can't be reached (or we can't log in)
+    UNAVAILABLE = ("OFFLINE", "DEVICE_NOT_FOUND", "TOKEN_INVALID", "AUTH_FAILED")
+
+    def __init__(
+        self,
+        email: str,
+        password: str,
+        device_name: str = "",
+        api_url: str = DEFAULT_API_URL,
+        timeout_ms: int = 5000,
+        pool_size: int = 4,
+        instance: str = "",
+    ):
+        if AES is None:
+            raise RuntimeError("MyJDownloader provider needs pycryptodome (pip install pycryptodome).")
+        if not email or not password:
+            raise RuntimeError("MyJDownloader email and password are required.")
+        self.email = email
+        self.device_name = device_name or ""
+        self.instance = instance  # metrics label
+        self.base_url = (api_url or DEFAULT_API_URL).strip().rstrip("/")
+        self.timeout = max(0.1, timeout_ms / 1000.0)
+        self.session = LocalProvider._make_session(max(1, pool_size))
+        self.breaker = CircuitBreaker()
+        self._login_secret = secret(email, password, "server")
+        self._device_secret = secret(email, password, "device")
+        self._lock = threading.Lock()
+        self._login_lock = threading.Lock()
+        self._rid = 0
+        self._token: Optional[str] = None
+        self._regain: Optional[str] = None
+        self._server_key: Optional[bytes] = None
+        self._device_key: Optional[bytes] = None
+        self._token_at = 0.0
+        self._devices = TTLCache(ttl=self.DEVICE_TTL_S, max_entries=1, name="myjd_devices")
+
+    def close(self) -> None:
+        with self._lock:
+            token, server_key = self._token, self._server_key
+            self._token = None
+        if token:
+            try:
+                self._server_call("/my/disconnect", [("sessiontoken", token)], server_key)
+            except Exception:
+                pass
+        self.session.close()
+
+    def probe(self) -> Tuple[bool, str]:
+        """Log in if needed and look up the device, for the background health prober."""
+        try:
+            self._device_id()
+            return True, "Connected via MyJDownloader."
+        except Exception as e:
+            return False, str(e)
+
+    def timeout_for(self, path: str) -> float:
+        return self.timeout
+
+    # --- session handling ------------------------------------------------
+
+    def _next_rid(self) -> int:
+        # Request ids must increase; replies echo them back
+        with self._lock:
+            self._rid = max(self._rid + 1, int(time.time() * 1000))
+            return self._rid
+
+    def _server_call(self, path: str, params: List[Tuple[str, str]], key: bytes) -> Dict[str, Any]:
+        rid = self._next_rid()
+        query = path + "?" + "&".join([f"{k}={quote(v)}" for k, v in params] + [f"rid={rid}"])
+        r = self.session.get(f"{self.base_url}{query}&signature={sign(key, query)}", timeout=self.timeout)
+        return self._decode(r, key, rid)
+
+    @staticmethod
+    def _decode(r: requests.Response, key: bytes, rid: int) -> Dict[str, Any]:
+        if r.status_code != 200:
+            try:
+                err = r.json()
+            except ValueError:
+                try:
+                    err = json.loads(decrypt(key, r.text))
+                except Exception:
+                    err = {}
+            raise MyJDError(str(err.get("type") or f"HTTP {r.status_code}"), str(err.get("src") or "MYJD"), r.status_code)
+        data = json.loads(decrypt(key, r.text))
+        if data.get("rid") != rid:
+            raise MyJDError("RID_MISMATCH")
+        return data
+
+    def _set_token(self, data: Dict[str, Any], server_key: bytes) -> None:
+        token = data["sessiontoken"]
+        self._token = token
+        self._regain = data["regaintoken"]
+        self._server_key = derive(server_key, token)
+        self._device_key = derive(self._device_secret, token)
+        self._token_at = time.monotonic()
+
+    def _session(self) -> Tuple[str, bytes]:
+        """A valid (session token, device key); logs in or renews as needed."""
+        with self._login_lock:  # one login/renewal at a time, the others reuse its result
+            with self._lock:
+                token, regain, server_key, token_at = self._token, self._regain, self._server_key, self._token_at
+                if token and time.monotonic() - token_at < self.TOKEN_REFRESH_S:
+                    return token, self._device_key
+            if token:
+                try:
+                    data = self._server_call("/my/reconnect", [("sessiontoken", token), ("regaintoken", regain)], server_key)
+                    with self._lock:
+                        self._set_token(data, server_key)
+                        return self._token, self._device_key
+                except MyJDError:
+                    pass  # regain token no longer accepted; log in again
+            data = self._server_call("/my/connect", [("email", self.email.lower()), ("appkey", APP_KEY)], self._login_secret)
+            with self._lock:
+                self._set_token(data, self._login_secret)
+                return self._token, self._device_key
+
+    def _drop_session(self) -> None:
+        with self._lock:
+            self._token = None
+
+    def _device_id(self) -> str:
+        token, _ = self._session()
+        devices = self._devices.get_or_load(
+            "devices",
+            lambda: self._server_call("/my/listdevices", [("sessiontoken", token)], self._server_key).get("list") or [],
+        )
+        if self.device_name:
+            for d in devices:
+                if (d.get("name") or "").lower() == self.device_name.lower():
+                    return d["id"]
+            self._devices.clear()
+            raise RuntimeError(f"MyJDownloader device '{self.device_name}' not found.")
+        if len(devices) == 1:
+            return devices[0]["id"]
+        self._devices.clear()
+        raise RuntimeError("Set a MyJDownloader device name (account has %d devices)." % len(devices))
+
+    def _call(self, path: str, *params: Any) -> Dict[str, Any]:
+        if not self.breaker.allow():
+            metrics.upstream_rejected.inc(instance=self.instance)
+            raise CircuitOpenError(f"MyJDownloader at {self.base_url} is unreachable (circuit open).")
+        # Every exit resolves the breaker, or a half-open trial would never end
+        failed = True
+        try:
+            try:
+                data = self._device_call(path, list(params))
+            except MyJDError as e:
+                if e.type in ("OFFLINE", "DEVICE_NOT_FOUND"):
+                    self._devices.clear()
+                if e.type not in ("TOKEN_INVALID", "AUTH_FAILED"):
+                    raise
+                # Token expired before we renewed it; one fresh login, then give up
+                self._drop_session()
+                data = self._device_call(path, list(params))
+            failed = False
+        except MyJDError as e:
+            # The relay answered; only errors that mean JD can't be reached count
+            failed = e.type in self.UNAVAILABLE or e.status >= 500
+            raise
+        finally:
+            if failed:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+        return data
+
+    def _device_call(self, path: str, params: List[Any]) -> Dict[str, Any]:
+        device_id = self._device_id()
+        token, device_key = self._session()
+        rid = self._next_rid()
+        # Lists go over as JSON arrays, everything else as a JSON-encoded string
+        body = {"url": path, "params": [p if isinstance(p, list) else json.dumps(p) for p in params], "rid": rid, "apiVer": 1}
+        started = time.monotonic()
+        status = "error"
+        try:
+            r = self.session.post(
+                f"{self.base_url}/t_{token}_{device_id}{path}",
+                data=encrypt(device_key, json.dumps(body)),
+                headers={"Content-Type": "application/aesjson-jd; charset=utf-8"},
+                timeout=self.timeout,
+            )
+            status = str(r.status_code)
+        except requests.Timeout:
+            status = "timeout"
+            raise
+        finally:
+            elapsed = time.monotonic() - started
+            metrics.upstream_seconds.observe(elapsed, endpoint="myjd" + path, status=status, instance=self.instance)
+            timing.record("jd", elapsed, "myjd" + path)
+        with timing.span("json"):
+            return self._decode(r, device_key, rid)
+
+    # --- Provider API ------------------------------------------------------
 
     def get_packages(self) -> List[Dict[str, Any]]:
-        raise RuntimeError("Not implemented")
+        return self._call("/downloadsV2/queryPackages", PACKAGE_QUERY).get("data") or []
+
+    def get_package_links(self, package_id: int, start: int = 0, limit: int = 50) -> List[Dict[str, Any]]:
+        q = {"packageUUIDs": [package_id], "startAt": max(0, start), "maxResults": max(1, limit), **PACKAGE_LINK_FIELDS}
+        return self._call("/downloadsV2/queryLinks", q).get("data") or []
 
     def add_links(self, links: str, package: str, dest: Optional[str], autostart: bool) -> Dict[str, Any]:
-        raise RuntimeError("Not implemented")
+        q: Dict[str, Any] = {"assignJobID": True, "autostart": autostart, "links": links, "packageName": package}
+        if dest:
+            q["destinationFolder"] = dest
+        return self._call("/linkgrabberv2/addLinks", q)
+
+    def get_crawl_jobs(self, job_ids: List[int]) -> List[Dict[str, Any]]:
+        return self._call("/linkgrabberv2/queryLinkCrawlerJobs", {"jobIds": job_ids, "collectorInfo": True}).get("data") or []
+
+    def get_download_urls(self) -> List[str]:
+        urls: List[str] = []
+        start = 0
+        while True:
+            q = {"url": True, "startAt": start, "maxResults": DOWNLOAD_URLS_PAGE}
+            rows = self._call("/downloadsV2/queryLinks", q).get("data") or []
+            urls.extend(l["url"] for l in rows if l.get("url"))
+            if len(rows) < DOWNLOAD_URLS_PAGE:
+                return urls
+            start += len(rows)
+
+    # Id lists travel in the encrypted POST body, so bulk actions are always a single call
+
+    def remove_packages(self, package_ids: List[int], link_ids: Optional[List[int]] = None) -> Dict[str, Any]:
+        return self._call("/downloadsV2/removeLinks", link_ids or [], package_ids)
+
+    def cleanup_packages(self, package_ids: List[int], link_ids: Optional[List[int]] = None) -> Dict[str, Any]:
+        return self._call(
+            "/downloadsV2/cleanup",
+            link_ids or [],
+            package_ids,
+            CLEANUP_ARGS["action"],
+            CLEANUP_ARGS["mode"],
+            CLEANUP_ARGS["selectionType"],
+        )
+
+    def get_linkgrabber_links(self) -> List[Dict[str, Any]]:
+        return self._call("/linkgrabberv2/queryLinks", LINKGRABBER_QUERY).get("data") or []
+
+    def start_linkgrabber_downloads(self, link_ids: List[int], package_ids: Optional[List[int]] = None) -> Dict[str, Any]:
+        return self._call("/linkgrabberv2/moveToDownloadlist", link_ids, package_ids or [])
+
+    def remove_linkgrabber_links(self, link_ids: List[int], package_ids: Optional[List[int]] = None) -> Dict[str, Any]:
+        return self._call("/linkgrabberv2/removeLinks", link_ids, package_ids or [])
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from ..health import HealthProber
+from .base import Provider
+from .failover import FailoverProvider
+from .local_api import LocalProvider
+from .myjd_api import DEFAULT_API_URL, MyJDProvider
+
+class ProviderRegistry:
+    """Process-wide cache of provider instances, one per configured JD instance.
+
+    Providers own a pooled HTTP session, so reusing them across Flask requests keeps
+    connections to JD alive (and MyJDownloader logged in). Each provider also gets a
+    background health prober. An entry is replaced (and its session closed) as soon
+    as the instance's connection settings change.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Tuple[tuple, Provider, HealthProber]] = {}
+
+    @staticmethod
+    def _fallback_key(fallback: Dict[str, Any]) -> tuple:
+        return (
+            fallback.get("email") or "",
+            fallback.get("password") or "",
+            fallback.get("device_name") or "",
+            (fallback.get("api_url") or DEFAULT_API_URL).strip().rstrip("/"),
+            int(fallback.get("timeout_ms") or 5000),
+        )
+
+    @staticmethod
+    def _key(primary: Dict[str, Any], health_interval: float) -> tuple:
+        return (
+            (primary.get("base_url") or "").strip().rstrip("/"),
+            int(primary.get("timeout_ms") or 800),
+            int(primary.get("pool_size") or 4),
+            int(primary.get("min_timeout_ms") or 200),
+            int(primary.get("max_timeout_ms") or 10000),
+            health_interval,
+        )
+
+    def get(self, inst: Dict[str, Any], health_interval: float = 10.0, failover: bool = False) -> Provider:
+        """The instance's provider; wrapped with its MyJDownloader fallback when
+        ``failover`` is on and the fallback is enabled."""
+        inst_id = inst.get("id") or "primary"
+        primary = (inst.get("providers") or {}).get("primary") or {}
+        fallback = (inst.get("providers") or {}).get("fallback") or {}
+        use_fallback = failover and bool(fallback.get("enabled"))
+        key = (self._key(primary, health_interval), self._fallback_key(fallback) if use_fallback else None)
+        with self._lock:
+            entry = self._entries.get(inst_id)
+            if entry is not None and entry[0] == key:
+                return entry[1]
+            base_url, timeout_ms, pool_size, min_timeout_ms, max_timeout_ms, _ = key[0]
+            provider: Provider = LocalProvider(
+                base_url=base_url,
+                timeout_ms=timeout_ms,
+                pool_size=pool_size,
+                min_timeout_ms=min_timeout_ms,
+                max_timeout_ms=max_timeout_ms,
+                instance=inst_id,
+            )
+            if use_fallback:
+                email, password, device_name, api_url, myjd_timeout_ms = key[1]
+                provider = FailoverProvider(
+                    provider,
+                    MyJDProvider(email, password, device_name, api_url=api_url, timeout_ms=myjd_timeout_ms, pool_size=pool_size, instance=inst_id),
+                )
+            self._entries[inst_id] = (key, provider, HealthProber(provider, interval=health_interval))
+        if entry is not None:
+            self._close(entry)
+        return provider
+
+    def prober(self, inst_id: str) -> Optional[HealthProber]:
+        """The health prober of an instance whose provider was already created, else None."""
+        with self._lock:
+            entry = self._entries.get(inst_id)
+        return entry[2] if entry is not None else None
+
+    def invalidate(self) -> None:
+        """Drop every cached provider (call after the config was saved)."""
+        with self._lock:
+            entries, self._entries = self._entries, {}
+        for entry in entries.values():
+            self._close(entry)
+
+    @staticmethod
+    def _close(entry: Tuple[tuple, Provider, HealthProber]) -> None:
+        entry[2].stop()
+        entry[1].close()
@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import fcntl
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from typing import Any, Optional, Tuple
+
+from .snapshot import Snapshot
+
+log = logging.getLogger(__name__)
+
+# File layout: header, then the error text and the JSON data, both UTF-8.
+_HEADER = struct.Struct("<4sqdII")  # magic, version, fetched_at, error length, data length
+_MAGIC = b"JDS1"
+
+class SharedSlot:
+    """One snapshot shared by the worker processes through files in ``directory``.
+
+    The worker holding ``<key>.lock`` (``flock``, released by the kernel if the
+    process dies) is the leader: it fetches from JD and ``publish``es each result by
+    atomically replacing ``<key>.snap``. Every other worker ``read``s that file
+    through a read-only mmap and only decodes the data again when the version
+    changed. ``mark_dirty`` touches ``<key>.dirty`` so the leader refetches after
+    an action taken in another worker.
+    """
+
+    def __init__(self, directory: str, key: str):
+        self.directory = directory
+        self.path = os.path.join(directory, f"{key}.snap")
+        self._lock_path = os.path.join(directory, f"{key}.lock")
+        self._dirty_path = os.path.join(directory, f"{key}.dirty")
+        self._lock_fd: Optional[int] = None
+        self._mutex = threading.Lock()
+        self._seen: Optional[Tuple[int, int]] = None  # (inode, mtime_ns) of the file last read
+        self._cached: Optional[Snapshot] = None
+
+    @property
+    def leader(self) -> bool:
+        return self._lock_fd is not None
+
+    def try_lead(self) -> bool:
+        """Become the leader if nobody else is; never blocks."""
+        with self._mutex:
+            if self._lock_fd is not None:
+                return True
+            fd = os.open(self._lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                return False
+            self._lock_fd = fd
+            return True
+
+    def release(self) -> None:
+        with self._mutex:
+            if self._lock_fd is None:
+                return
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def publish(self, snap: Snapshot) -> None:
+        error = (snap.error or "").encode()
+        data = json.dumps(snap.data, separators=(",", ":")).encode()
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".snap-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(_HEADER.pack(_MAGIC, snap.version, snap.fetched_at, len(error), len(data)))
+                f.write(error)
+                f.write(data)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            log.warning("shared snapshot %s not published: %s", self.path, e)
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+
+    def read(self) -> Optional[Snapshot]:
+        """The last published snapshot (None before the first publish)."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        seen = (st.st_ino, st.st_mtime_ns)
+        with self._mutex:
+            if seen == self._seen:
+                return self._cached
+            try:
+                with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    magic, version, fetched_at, err_len, data_len = _HEADER.unpack_from(mm, 0)
+                    if magic != _MAGIC:
+                        return self._cached
+                    start = _HEADER.size
+                    error = mm[start:start + err_len].decode() or None
+                    prev = self._cached
+                    if prev is not None and prev.version == version:
+                        # Same data, newer fetch: no need to decode it again
+                        data: Any = prev.data
+                    else:
+                        data = json.loads(mm[start + err_len:start + err_len + data_len])
+            except (OSError, ValueError, struct.error) as e:
+                log.warning("shared snapshot %s unreadable: %s", self.path, e)
+                return self._cached
+            self._seen = seen
+            self._cached = Snapshot(data=data, version=version, fetched_at=fetched_at, error=error)
+            return self._cached
+
+    def mark_dirty(self) -> None:
+        try:
+            with open(self._dirty_path, "ab"):
+                pass
+            os.utime(self._dirty_path)
+        except OSError:
+            pass
+
+    def dirty_at(self) -> float:
+        """Wall-clock time of the last ``mark_dirty`` (0 if never)."""
+        try:
+            return os.stat(self._dirty_path).st_mtime
+        except OSError:
+            return 0.0
@@ -0,0 +1,314 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional
+
+from . import metrics
+
+if TYPE_CHECKING:
+    from .shared import SharedSlot
+
+@dataclass(frozen=True)
+class Snapshot:
+    data: Any
+    version: int
+    fetched_at: float        # time.time() of the last successful fetch, 0 if never fetched
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and self.fetched_at > 0
+
+    @property
+    def age(self) -> Optional[float]:
+        if self.fetched_at <= 0:
+            return None
+        return max(0.0, time.time() - self.fetched_at)
+
+
+class SnapshotPoller:
+    """Keeps one shared, periodically refreshed copy of an upstream query.
+
+    A background thread calls ``fetch`` every ``interval`` seconds while somebody
+    is reading the snapshot, and goes to sleep after ``idle_timeout`` seconds
+    without readers. Concurrent refreshes are coalesced onto one in-flight call,
+    so upstream load does not grow with the number of clients.
+    """
+
+    HISTORY = 16  # previous versions kept for delta responses
+    # Shared mode: how often the leader checks for invalidations from other workers,
+    # and how long a follower waits for the leader after invalidating
+    DIRTY_CHECK_S = 0.1
+    FOLLOW_WAIT_S = 5.0
+
+    def __init__(
+        self,
+        fetch: Callable[[], Any],
+        interval: float = 2.0,
+        idle_timeout: float = 60.0,
+        name: str = "snapshot",
+        shared: Optional["SharedSlot"] = None,
+    ):
+        """With ``shared`` (see shared.py), only the worker process leading the slot
+        fetches; the others follow the snapshots it publishes."""
+        self._fetch = fetch
+        self._shared = shared
+        self._lead_attempt = 0.0
+        self._dirty_at = 0.0
+        self.interval = max(0.1, float(interval))
+        self.idle_timeout = max(self.interval, float(idle_timeout))
+        self.name = name
+
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._inflight: Optional[threading.Event] = None
+        # Versions start at the wall clock in ms so they stay unique across poller
+        # (and process) restarts; clients use them as ETags and delta bases.
+        self._snapshot = Snapshot(data=None, version=int(time.time() * 1000), fetched_at=0.0)
+        self._history: "OrderedDict[int, Any]" = OrderedDict()
+        self._last_access = 0.0
+        self._attempted_at = 0.0
+        self._dirty = False
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._listeners: List[Callable[[], None]] = []
+
+    @property
+    def leading(self) -> bool:
+        """Whether this process fetches (always, unless the snapshot is shared)."""
+        return self._shared is None or self._shared.leader
+
+    @property
+    def snapshot(self) -> Snapshot:
+        if self._shared is not None and not self._lead():
+            return self._follow(wait=False)
+        return self._snapshot
+
+    def get(self, max_age: Optional[float] = None) -> Snapshot:
+        """Return the current snapshot, fetching synchronously only when there is none yet
+        (or it is older than ``max_age``). Starts the background poller if it is idle."""
+        if self._shared is not None and not self._lead():
+            return self._follow(wait=True)
+        self._last_access = time.monotonic()
+        self._ensure_thread()
+        snap = self._snapshot
+        limit = self.interval * 2 if max_age is None else max_age
+        stale = snap.age is None or snap.age > limit
+        # Don't hammer a failing upstream: at most one synchronous attempt per interval.
+        if self._dirty or (stale and time.monotonic() - self._attempted_at >= self.interval):
+            metrics.cache_requests.inc(cache=f"snapshot:{self.name}", result="miss")
+            return self.refresh()
+        metrics.cache_requests.inc(cache=f"snapshot:{self.name}", result="hit")
+        return snap
+
+    def invalidate(self) -> None:
+        """Force the next ``get()`` to refetch (e.g. after an action changed upstream state)."""
+        self._dirty = True
+        if self._shared is not None:
+            self._dirty_at = time.time()
+            self._shared.mark_dirty()
+
+    def _lead(self) -> bool:
+        """Whether this process leads the shared slot, trying to take it over at most
+        once per interval (the previous leader died or went idle)."""
+        shared = self._shared
+        if shared.leader:
+            return True
+        now = time.monotonic()
+        if now - self._lead_attempt < self.interval:
+            return False
+        self._lead_attempt = now
+        if not shared.try_lead():
+            return False
+        # Carry on from the published version so clients' ETags and deltas stay valid
+        published = shared.read()
+        if published is not None and published.version >= self._snapshot.version:
+            with self._lock:
+                self._snapshot = published
+                self._history[published.version] = published.data
+        self._dirty = True
+        # A leader has to keep polling (or let go once idle), whoever asked
+        self._last_access = now
+        self._ensure_thread()
+        return True
+
+    def _follow(self, wait: bool) -> Snapshot:
+        """The leader's latest snapshot. With ``wait``, give the leader a moment to
+        publish the first one, or one fetched after our own ``invalidate``."""
+        shared = self._shared
+        snap = shared.read()
+        if wait and (snap is None or (self._dirty and snap.fetched_at < self._dirty_at)):
+            deadline = time.monotonic() + self.FOLLOW_WAIT_S
+            while time.monotonic() < deadline:
+                time.sleep(self.DIRTY_CHECK_S)
+                snap = shared.read()
+                if snap is not None and not (self._dirty and snap.fetched_at < self._dirty_at):
+                    break
+            self._dirty = False
+        if snap is None or snap is self._snapshot:
+            return self._snapshot
+        with self._lock:
+            if snap.version != self._snapshot.version:
+                self._history[snap.version] = snap.data
+                while len(self._history) > self.HISTORY:
+                    self._history.popitem(last=False)
+            self._snapshot = snap
+            self._changed.notify_all()
+            listeners = list(self._listeners)
+        for fn in listeners:
+            fn()
+        return snap
+
+    def refresh(self) -> Snapshot:
+        """Fetch now, or wait for the fetch that is already in flight."""
+        with self._lock:
+            ev = self._inflight
+            leader = ev is None
+            if leader:
+                ev = self._inflight = threading.Event()
+        if not leader:
+            ev.wait()
+            return self._snapshot
+
+        self._attempted_at = time.monotonic()
+        self._dirty = False
+        try:
+            data = self._fetch()
+            prev = self._snapshot
+            version = prev.version if (prev.fetched_at > 0 and data == prev.data) else prev.version + 1
+            self._snapshot = Snapshot(data=data, version=version, fetched_at=time.time())
+            if version != prev.version:
+                with self._lock:
+                    self._history[version] = data
+                    while len(self._history) > self.HISTORY:
+                        self._history.popitem(last=False)
+        except Exception as e:
+            prev = self._snapshot
+            self._snapshot = Snapshot(data=prev.data, version=prev.version, fetched_at=prev.fetched_at, error=str(e))
+        finally:
+            with self._lock:
+                self._inflight = None
+                self._changed.notify_all()
+                listeners = list(self._listeners)
+            if self._shared is not None and self._shared.leader:
+                self._shared.publish(self._snapshot)
+            ev.set()
+            for fn in listeners:
+                fn()
+        return self._snapshot
+
+    def data_at(self, version: int) -> Optional[Any]:
+        """Return the data of a recent version, or None if it is no longer kept."""
+        with self._lock:
+            return self._history.get(version)
+
+    def wait(self, predicate: Callable[[Snapshot], bool], timeout: float) -> Snapshot:
+        """Block until a refresh produces a snapshot matching ``predicate`` or ``timeout``
+        expires. Waiting counts as reading, so it keeps the background poller running."""
+        deadline = time.monotonic() + timeout
+        if self._shared is not None and not self._lead():
+            snap = self._follow(wait=False)
+            while not predicate(snap) and time.monotonic() < deadline:
+                time.sleep(self.DIRTY_CHECK_S)
+                snap = self._follow(wait=False)
+            return snap
+        self._last_access = time.monotonic()
+        self._ensure_thread()
+        with self._lock:
+            while not predicate(self._snapshot):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._changed.wait(remaining)
+                self._last_access = time.monotonic()
+            return self._snapshot
+
+    def subscribe(self, fn: Callable[[], None]) -> Callable[[], None]:
+        """Call ``fn`` after every refresh (on the refreshing thread; keep it short).
+        Subscribers keep the background poller running. Returns the unsubscribe function."""
+        with self._lock:
+            self._listeners.append(fn)
+        self._ensure_thread()
+
+        def unsubscribe() -> None:
+            with self._lock:
+                if fn in self._listeners:
+                    self._listeners.remove(fn)
+        return unsubscribe
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._shared is not None and (self._thread is None or not self._thread.is_alive()):
+            self._shared.release()
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name=f"poller-{self.name}", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        shared = self._shared
+        while not self._stop.is_set():
+            if not self._listeners and time.monotonic() - self._last_access > self.idle_timeout:
+                break
+            if shared is not None and not self._lead():
+                # Follower: pass the leader's snapshots on to our subscribers
+                self._follow(wait=False)
+                self._stop.wait(self.DIRTY_CHECK_S)
+                continue
+            snap = self._snapshot
+            if snap.fetched_at <= 0 or (snap.age or 0) >= self.interval * 0.9:
+                self.refresh()
+            elif shared is not None and shared.dirty_at() > snap.fetched_at:
+                # Another worker changed something upstream
+                self.refresh()
+            self._stop.wait(self.DIRTY_CHECK_S if shared is not None else self.interval)
+        with self._lock:
+            if self._thread is threading.current_thread():
+                self._thread = None
+        if shared is not None:
+            # Idle: let a worker that still has readers take over
+            shared.release()
+
+
+def diff_rows(old: List[Dict[str, Any]], new: List[Dict[str, Any]], key: str = "uuid") -> Dict[str, Any]:
+    """Describe how ``new`` differs from ``old`` by row key.
+
+    ``changed`` entries carry the key plus only the fields that changed; fields
+    that disappeared are sent as None. ``order`` is only included when the row
+    order changed for reasons other than additions/removals.
+    """
+    old_by_key = {r.get(key): r for r in old}
+    new_keys = [r.get(key) for r in new]
+    new_key_set = set(new_keys)
+
+    added: List[Dict[str, Any]] = []
+    changed: List[Dict[str, Any]] = []
+    for row in new:
+        k = row.get(key)
+        prev = old_by_key.get(k)
+        if prev is None:
+            added.append(row)
+            continue
+        if prev == row:
+            continue
+        fields = {f: v for f, v in row.items() if prev.get(f) != v}
+        fields.update({f: None for f in prev if f not in row})
+        fields[key] = k
+        changed.append(fields)
+    removed = [k for k in old_by_key if k not in new_key_set]
+
+    delta: Dict[str, Any] = {"added": added, "removed": removed, "changed": changed}
+    kept_old = [r.get(key) for r in old if r.get(key) in new_key_set]
+    kept_new = [k for k in new_keys if k in old_by_key]
+    if kept_old != kept_new or (added and new_keys[-len(added):] != [r.get(key) for r in added]):
+        delta["order"] = new_keys
+    return delta
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import contextvars
+import cProfile
+import io
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Per-request phase timing for the Server-Timing header and the slow-request log.
+# A timer only exists while a request has timing turned on; everywhere else span()
+# and record() cost one context variable lookup.
+
+_current: contextvars.ContextVar[Optional["RequestTimer"]] = contextvars.ContextVar("jdmobile_timer", default=None)
+
+# cProfile can only run one profile at a time on Python 3.12+
+_profile_lock = threading.Lock()
+PROFILE_LINES = 60
+
+class RequestTimer:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: List[Tuple[str, float, str]] = []
+        self._profiler: Optional[cProfile.Profile] = None
+
+    def add(self, name: str, seconds: float, desc: str = "") -> None:
+        self.spans.append((name, seconds, desc))
+
+    def phases(self) -> List[Tuple[str, float, str]]:
+        """Spans summed by name, in first-seen order; repeated spans get a call count."""
+        totals: Dict[str, List] = {}
+        for name, seconds, desc in self.spans:
+            entry = totals.setdefault(name, [0.0, 0, desc])
+            entry[0] += seconds
+            entry[1] += 1
+        return [(name, s, desc if n == 1 else f"{n} calls") for name, (s, n, desc) in totals.items()]
+
+    def header(self) -> str:
+        parts = []
+        for name, seconds, desc in self.phases():
+            part = f"{name};dur={seconds * 1000:.1f}"
+            if desc:
+                part += ';desc="' + desc.replace("\\", "").replace('"', "") + '"'
+            parts.append(part)
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(parts)
+
+    def summary(self) -> str:
+        return " ".join(f"{name}={seconds * 1000:.0f}ms" for name, seconds, _ in self.phases())
+
+    def start_profile(self) -> bool:
+        """Profile the rest of this request; False if another request is being profiled."""
+        if not _profile_lock.acquire(blocking=False):
+            return False
+        self._profiler = cProfile.Profile()
+        self._profiler.enable()
+        return True
+
+    def stop_profile(self) -> Optional[str]:
+        """The profile so far as text (most cumulative time first), or None if not profiling."""
+        profiler, self._profiler = self._profiler, None
+        if profiler is None:
+            return None
+        profiler.disable()
+        _profile_lock.release()
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(PROFILE_LINES)
+        return out.getvalue()
+
+def start() -> Tuple[RequestTimer, contextvars.Token]:
+    timer = RequestTimer()
+    return timer, _current.set(timer)
+
+def stop(timer: RequestTimer, token: contextvars.Token) -> None:
+    timer.stop_profile()
+    _current.reset(token)
+
+def current() -> Optional[RequestTimer]:
+    return _current.get()
+
+def record(name: str, seconds: float, desc: str = "") -> None:
+    timer = _current.get()
+    if timer is not None:
+        timer.add(name, seconds, desc)
+
+@contextmanager
+def span(name: str, desc: str = "") -> Iterator[None]:
+    timer = _current.get()
+    if timer is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(name, time.perf_counter() - started, desc)
@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+import hashlib
+import heapq
+import hmac
+import itertools
+import json
+import logging
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import requests
+
+from . import metrics
+from .events import Event
+
+log = logging.getLogger(__name__)
+
+_deliveries_total = metrics.Counter(
+    "jdmobile_webhook_deliveries_total",
+    "Webhook delivery attempts by result (delivered, retried or dead).",
+    ("result",),
+)
+
+# Worth another try: the receiver may be restarting or overloaded
+RETRY_STATUSES = (408, 425, 429, 500, 502, 503, 504)
+
+@dataclass(order=True)
+class _Delivery:
+    due: float
+    seq: int
+    url: str = field(compare=False)
+    secret: str = field(compare=False)
+    event: Event = field(compare=False)
+    attempts: int = field(default=0, compare=False)
+
+class WebhookDispatcher:
+    """POSTs events to webhook URLs without ever blocking the code that emits them.
+
+    ``deliver`` puts one delivery per matching hook on a bounded, time-ordered queue.
+    ``workers`` threads send them. A failed delivery (connection error, timeout,
+    5xx, 408 or 429) is retried after an exponential backoff with jitter, or after
+    the receiver's Retry-After. After ``max_attempts`` it is appended to the
+    dead-letter log (JSON lines), as are deliveries refused by a full queue and
+    ones the receiver rejected with another 4xx.
+    """
+
+    DEAD_LETTER_MAX_BYTES = 1024 * 1024  # then rotated once to <path>.1
+
+    def __init__(
+        self,
+        dead_letter_path: str,
+        max_queue: int = 1000,
+        workers: int = 2,
+        max_attempts: int = 6,
+        backoff: float = 1.0,
+        max_backoff: float = 300.0,
+        timeout: float = 5.0,
+    ):
+        self.dead_letter_path = dead_letter_path
+        self.max_queue = max_queue
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._heap: List[_Delivery] = []
+        self._sending = 0
+        self._threads: List[threading.Thread] = []
+        self._dead_lock = threading.Lock()
+        self._session = requests.Session()
+        self._session.headers["User-Agent"] = "JD-Mobile webhooks"
+
+    def deliver(self, event: Event, hooks: Sequence[Mapping[str, Any]]) -> int:
+        """Queue ``event`` for each hook subscribed to its type; returns how many were queued."""
+        queued = 0
+        for hook in hooks:
+            types = hook.get("events") or ()
+            if types and event.type not in types and event.type != "ping":
+                continue
+            d = _Delivery(time.monotonic(), next(self._seq), hook["url"], hook.get("secret") or "", event)
+            with self._cond:
+                full = len(self._heap) + self._sending >= self.max_queue
+                if not full:
+                    heapq.heappush(self._heap, d)
+                    self._ensure_workers()
+                    self._cond.notify()
+            if full:
+                _deliveries_total.inc(result="dead")
+                self._dead(d, "queue full")
+            else:
+                queued += 1
+        return queued
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._heap) + self._sending
+
+    def dead_letters(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """The newest dead-letter records, newest first."""
+        try:
+            with open(self.dead_letter_path, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                f.seek(max(0, f.tell() - 64 * 1024))
+                lines = f.read().splitlines()
+        except OSError:
+            return []
+        out = []
+        for line in reversed(lines):
+            try:
+                out.append(json.loads(line))
+            except ValueError:
+                continue  # the first line may be cut in half
+            if len(out) >= limit:
+                break
+        return out
+
+    def _ensure_workers(self) -> None:
+        self._threads = [t for t in self._threads if t.is_alive()]
+        while len(self._threads) < self.workers:
+            t = threading.Thread(target=self._run, name=f"webhooks-{len(self._threads)}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    if self._heap and self._heap[0].due <= now:
+                        break
+                    self._cond.wait(self._heap[0].due - now if self._heap else None)
+                d = heapq.heappop(self._heap)
+                self._sending += 1
+            try:
+                retry_after, error = self._send(d)
+            finally:
+                with self._cond:
+                    self._sending -= 1
+            if error is None:
+                _deliveries_total.inc(result="delivered")
+                continue
+            d.attempts += 1
+            if retry_after is None or d.attempts >= self.max_attempts:
+                _deliveries_total.inc(result="dead")
+                self._dead(d, error)
+                continue
+            _deliveries_total.inc(result="retried")
+            d.due = time.monotonic() + retry_after
+            with self._cond:
+                heapq.heappush(self._heap, d)
+                self._cond.notify()
+
+    def _send(self, d: _Delivery) -> Tuple[Optional[float], Optional[str]]:
+        """POST one delivery: (None, None) on success, else (seconds until the retry
+        or None for no retry, error text)."""
+        body = json.dumps(d.event.to_dict(), separators=(",", ":")).encode()
+        headers = {
+            "Content-Type": "application/json",
+            "X-JD-Mobile-Event": d.event.type,
+            "X-JD-Mobile-Delivery": d.event.id,
+        }
+        if d.secret:
+            headers["X-JD-Mobile-Signature"] = "sha256=" + hmac.new(d.secret.encode(), body, hashlib.sha256).hexdigest()
+        delay = min(self.max_backoff, self.backoff * 2 ** d.attempts) * random.uniform(0.5, 1.0)
+        try:
+            r = self._session.post(d.url, data=body, headers=headers, timeout=self.timeout)
+        except requests.RequestException as e:
+            return delay, f"{type(e).__name__}: {e}"
+        if 200 <= r.status_code < 300:
+            return None, None
+        error = f"HTTP {r.status_code}"
+        if r.status_code not in RETRY_STATUSES:
+            return None, error
+        retry_after = r.headers.get("Retry-After", "")
+        if retry_after.isdigit():
+            delay = min(self.max_backoff, float(retry_after))
+        return delay, error
+
+    def _dead(self, d: _Delivery, reason: str) -> None:
+        record = {"ts": time.time(), "url": d.url, "attempts": d.attempts, "error": reason, "event": d.event.to_dict()}
+        log.warning("webhook to %s dropped after %d attempt(s): %s", d.url, d.attempts, reason)
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._dead_lock:
+            try:
+                if os.path.exists(self.dead_letter_path) and os.path.getsize(self.dead_letter_path) > self.DEAD_LETTER_MAX_BYTES:
+                    os.replace(self.dead_letter_path, self.dead_letter_path + ".1")
+                with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+                    f.write(line)
+            except OSError as e:
+                log.error("webhook dead-letter log %s not writable: %s", self.dead_letter_path, e)
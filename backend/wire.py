@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import gzip
+from typing import Any, Dict, Iterable, List, Optional
+
+from flask import Response
+
+try:  # optional: pip install brotli
+    import brotli
+except ImportError:  # pragma: no cover - depends on the environment
+    brotli = None
+
+# Row identity is always sent, whatever the projection, so deltas and selections keep working
+ID_FIELDS = ("uuid", "key", "instance")
+
+# Below this a compressed body saves less than the header overhead costs
+COMPRESS_MIN_BYTES = 1024
+COMPRESS_TYPES = ("application/json", "text/html", "text/plain", "text/css", "application/javascript", "text/javascript")
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # close to gzip -6 CPU, noticeably smaller output
+
+def parse_fields(arg: Optional[str]) -> Optional[List[str]]:
+    """``?fields=a,b,c`` -> ["a", "b", "c"] (identity fields added); None means all fields."""
+    if not arg:
+        return None
+    fields = [f.strip() for f in arg.split(",") if f.strip()]
+    return [f for f in ID_FIELDS if f not in fields] + fields if fields else None
+
+def project(rows: Iterable[Dict[str, Any]], fields: Optional[List[str]]) -> List[Dict[str, Any]]:
+    if fields is None:
+        return list(rows)
+    return [{f: r[f] for f in fields if f in r} for r in rows]
+
+def columnar(rows: List[Dict[str, Any]], fields: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Rows as one key list plus a value array per row (missing values are null)."""
+    if fields is None:
+        seen: Dict[str, None] = {}
+        for r in rows:
+            for f in r:
+                seen.setdefault(f, None)
+        fields = list(seen)
+    else:
+        present = {f for r in rows for f in r}
+        fields = [f for f in fields if f in present]
+    return {"fields": fields, "values": [[r.get(f) for f in fields] for r in rows]}
+
+def encode_rows(rows: List[Dict[str, Any]], fields: Optional[List[str]], fmt: str) -> Any:
+    """A row list as sent to the client: projected to ``fields``, columnar when ``fmt`` asks."""
+    rows = project(rows, fields)
+    return columnar(rows, fields) if fmt == "columnar" else rows
+
+def encode_delta(delta: Dict[str, Any], fields: Optional[List[str]], fmt: str) -> Dict[str, Any]:
+    """Project a ``diff_rows`` delta; changes that only touched unrequested fields are dropped."""
+    out = dict(delta)
+    out["added"] = encode_rows(delta["added"], fields, fmt)
+    if fields is not None:
+        changed = project(delta["changed"], fields)
+        out["changed"] = [c for c in changed if any(f not in ID_FIELDS for f in c)]
+    return out
+
+def compress(resp: Response, accept_encodings) -> Response:
+    """Compress a buffered text response with brotli (when installed) or gzip, whichever
+    the client accepts. Streams, files, small bodies and binary types are left alone."""
+    if (
+        resp.direct_passthrough
+        or resp.is_streamed
+        or resp.status_code < 200
+        or resp.status_code in (204, 304)
+        or "Content-Encoding" in resp.headers
+        or resp.mimetype not in COMPRESS_TYPES
+    ):
+        return resp
+    resp.vary.add("Accept-Encoding")
+    if brotli is not None and accept_encodings["br"]:
+        encoding = "br"
+    elif accept_encodings["gzip"]:
+        encoding = "gzip"
+    else:
+        return resp
+    data = resp.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return resp
+    if encoding == "br":
+        data = brotli.compress(data, quality=BROTLI_QUALITY)
+    else:
+        data = gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    resp.set_data(data)
+    resp.headers["Content-Encoding"] = encoding
+    # The bytes differ per encoding, so a strong validator would be wrong
+    tag, weak = resp.get_etag()
+    if tag and not weak:
+        resp.set_etag(tag, weak=True)
+    return resp
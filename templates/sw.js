@@ -0,0 +1,91 @@
+// JD-Mobile service worker (served as /sw.js, see app.py).
+// - /assets/*: fingerprinted, so cache-first forever.
+// - The Downloads page: network first, so redirects after a form post show their
+//   flash messages; the last copy without any is the offline fallback.
+// - /api/packages: network first; the last full list per instance is kept for offline use.
+var CACHE = 'jdmobile-{{ cache_version }}';
+var SHELL_ASSETS = {{ shell_assets | tojson }};
+
+self.addEventListener('install', function(event) {
+  event.waitUntil(
+    caches.open(CACHE)
+      .then(function(cache) { return cache.addAll(SHELL_ASSETS); })
+      .then(function() { return self.skipWaiting(); })
+  );
+});
+
+// A new version of the app brings a new cache name; drop the old ones
+self.addEventListener('activate', function(event) {
+  event.waitUntil(
+    caches.keys()
+      .then(function(keys) {
+        return Promise.all(keys.filter(function(k) {
+          return k.indexOf('jdmobile-') === 0 && k !== CACHE;
+        }).map(function(k) { return caches.delete(k); }));
+      })
+      .then(function() { return self.clients.claim(); })
+  );
+});
+
+function put(key, resp) {
+  return caches.open(CACHE).then(function(cache) { return cache.put(key, resp); });
+}
+
+// Deltas and 304s only make sense on top of a list the page already has, so only
+// complete lists are kept, under one key per instance
+function snapshotKey(url) {
+  return '/api/packages?instance=' + encodeURIComponent(url.searchParams.get('instance') || '');
+}
+
+function fromAssets(req) {
+  return caches.match(req).then(function(hit) {
+    return hit || fetch(req).then(function(resp) {
+      if (resp.ok) { put(req, resp.clone()); }
+      return resp;
+    });
+  });
+}
+
+function fromShell(req) {
+  return fetch(req).then(function(resp) {
+    if (resp.ok && resp.headers.get('X-App-Shell')) { put(req, resp.clone()); }
+    return resp;
+  }).catch(function(err) {
+    return caches.match(req).then(function(hit) {
+      if (hit) { return hit; }
+      throw err;
+    });
+  });
+}
+
+function fromSnapshots(req, url) {
+  return fetch(req).then(function(resp) {
+    if (resp.status === 200) {
+      resp.clone().json().then(function(data) {
+        if (data.ok && data.packages) {
+          put(snapshotKey(url), new Response(JSON.stringify(data), {headers: {'Content-Type': 'application/json'}}));
+        }
+      }).catch(function() {});
+    }
+    return resp;
+  }).catch(function(err) {
+    return caches.match(snapshotKey(url)).then(function(hit) {
+      if (hit) { return hit; }
+      throw err;
+    });
+  });
+}
+
+self.addEventListener('fetch', function(event) {
+  var req = event.request;
+  if (req.method !== 'GET') { return; }
+  var url = new URL(req.url);
+  if (url.origin !== self.location.origin) { return; }
+  if (url.pathname.indexOf('/assets/') === 0) {
+    event.respondWith(fromAssets(req));
+  } else if (req.mode === 'navigate' && url.pathname === '/') {
+    event.respondWith(fromShell(req));
+  } else if (url.pathname === '/api/packages') {
+    event.respondWith(fromSnapshots(req, url));
+  }
+});
@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+from backend.addlinks import dedup, parse_links
+
+def test_mixed_paste_keeps_lines_without_a_url():
+    text = "\n".join([
+        "Season 1: https://example.com/a.mkv, https://example.com/b.mkv.",
+        "www.example.org/file.zip",
+        "rapidgator.net/file/abc123",
+        "",
+        "dlc://container",
+        "https://en.wikipedia.org/wiki/Foo_(bar)",
+    ])
+    entries, plain = parse_links(text)
+    assert entries == [
+        "https://example.com/a.mkv",
+        "https://example.com/b.mkv",
+        "www.example.org/file.zip",
+        "rapidgator.net/file/abc123",
+        "dlc://container",
+        "https://en.wikipedia.org/wiki/Foo_(bar)",
+    ]
+    assert plain == 3
+
+def test_paste_without_urls_is_passed_through():
+    assert parse_links("  some text\n\nmore text ") == (["some text", "more text"], 2)
+
+def test_dedup_keeps_fragments_apart():
+    links = ["https://mega.nz/#!abc!key1", "https://mega.nz/#!def!key2", "HTTPS://MEGA.NZ:443/#!abc!key1"]
+    assert dedup(links, set()) == (links[:2], 1, 0)
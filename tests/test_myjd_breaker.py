@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import pytest
+
+from backend.providers.circuit import CLOSED, HALF_OPEN, OPEN
+from backend.providers.myjd_api import MyJDError, MyJDProvider
+
+def _half_open(p: MyJDProvider) -> None:
+    p.breaker.reset_timeout = 0.0
+    for _ in range(p.breaker.failure_threshold):
+        p.breaker.record_failure()
+    assert p.breaker.state == HALF_OPEN
+
+@pytest.fixture
+def provider() -> MyJDProvider:
+    return MyJDProvider("user@example.com", "secret", device_name="JD", instance="test")
+
+@pytest.mark.parametrize("error", [MyJDError("OFFLINE", "DEVICE", 503), MyJDError("INTERNAL_SERVER_ERROR", status=500)])
+def test_relay_error_in_half_open_trial_reopens_the_circuit(provider, error):
+    _half_open(provider)
+
+    def fail(path, params):
+        raise error
+    provider._device_call = fail
+    with pytest.raises(MyJDError):
+        provider._call("/downloadsV2/queryPackages")
+    assert provider.breaker._state == OPEN
+    # The trial ended: once reset_timeout has passed the next call is let through
+    provider._device_call = lambda path, params: {"data": []}
+    assert provider._call("/downloadsV2/queryPackages") == {"data": []}
+    assert provider.breaker.state == CLOSED
+
+def test_device_lookup_failure_ends_the_trial(provider):
+    _half_open(provider)
+
+    def missing():
+        raise RuntimeError("MyJDownloader device 'JD' not found.")
+    provider._device_id = missing
+    provider._session = lambda: ("token", b"k" * 32)
+    with pytest.raises(RuntimeError):
+        provider._call("/downloadsV2/queryPackages")
+    assert provider.breaker.allow()
+
+def test_device_side_client_error_closes_the_circuit(provider):
+    _half_open(provider)
+
+    def bad(path, params):
+        raise MyJDError("BAD_PARAMETERS", "DEVICE", 400)
+    provider._device_call = bad
+    with pytest.raises(MyJDError):
+        provider._call("/downloadsV2/queryLinks")
+    assert provider.breaker.state == CLOSED
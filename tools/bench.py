@@ -0,0 +1,259 @@
+"""Load benchmark: N simulated phones polling JD-Mobile in front of tools/fake_jd.py.
+
+    python tools/bench.py --clients 50 --duration 20 --packages 2000 --latency-ms 40
+    python tools/bench.py --server gunicorn --json > bench.json
+    python tools/bench.py --baseline bench.json     # exit 1 on a >20% regression
+    python tools/bench.py --server gunicorn --server asgi --streams 200
+    python tools/bench.py --server gunicorn --workers 3   # shared snapshots
+
+Starts the fake JD API and the app (``dev`` = Flask's threaded dev server,
+``gunicorn`` = the Dockerfile's gthread command, ``asgi`` = its
+``JD_MOBILE_SERVER=asgi`` uvicorn command) with a throwaway config, then runs
+the pollers, optionally next to ``--streams`` idle SSE subscribers. Each client behaves like the Downloads page: it requests
+``/api/packages`` every ``--poll-interval`` seconds, sending If-None-Match and
+``?since=`` unless ``--full`` is given. Reports p50/p95/p99 latency, throughput,
+errors and upstream ``queryPackages`` calls per client-second.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_jd import JDState, serve  # noqa: E402
+
+# Same worker models as the Dockerfile CMD (-w comes from --workers)
+GUNICORN_ARGS = ["-k", "gthread", "--threads", "8"]
+SERVERS = ["dev", "gunicorn", "asgi"]
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _wait_up(url: str, timeout: float = 15.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+def _percentile(ordered: List[float], q: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100.0))]
+
+def _write_config(path: str, jd_url: str, poll_interval_ms: int, streams: int = 0) -> None:
+    cfg = {
+        "schema_version": 1,
+        "instances": [{
+            "id": "primary",
+            "name": "Bench",
+            "enabled": True,
+            "providers": {"primary": {"type": "local", "base_url": jd_url, "timeout_ms": 2000}},
+        }],
+        "active_instance_id": "primary",
+        "behavior": {"poll_interval_ms": poll_interval_ms, "stream_updates": streams > 0, "max_streams": streams},
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(cfg, f, indent=2)
+
+def start_app(kind: str, port: int, config_path: str, workers: int = 1) -> subprocess.Popen:
+    env = {**os.environ, "JD_MOBILE_CONFIG_PATH": config_path, "JD_MOBILE_WORKERS": str(workers)}
+    if kind == "gunicorn":
+        if not shutil.which("gunicorn"):
+            raise RuntimeError("gunicorn is not installed (pip install -r backend/requirements.txt)")
+        cmd = ["gunicorn", *GUNICORN_ARGS, "-w", str(workers), "--bind", f"127.0.0.1:{port}", "backend.app:app"]
+    elif kind == "asgi":
+        cmd = [sys.executable, "-m", "uvicorn", "backend.asgi:app", "--port", str(port), "--workers", str(workers), "--log-level", "warning"]
+    else:
+        cmd = [sys.executable, "-m", "flask", "--app", "backend.app", "run", "--port", str(port), "--with-threads"]
+    return subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+class Client(threading.Thread):
+    """One simulated phone."""
+
+    def __init__(self, url: str, interval: float, stop_at: float, conditional: bool):
+        super().__init__(daemon=True)
+        self.url = url
+        self.interval = interval
+        self.stop_at = stop_at
+        self.conditional = conditional
+        self.latencies: List[float] = []
+        self.errors = 0
+        self.not_modified = 0
+
+    def run(self) -> None:
+        s = requests.Session()
+        version: Optional[str] = None
+        while True:
+            started = time.monotonic()
+            if started >= self.stop_at:
+                break
+            headers, params = {}, {}
+            if self.conditional and version:
+                headers["If-None-Match"] = f'"{version}"'
+                params["since"] = version
+            try:
+                r = s.get(self.url, headers=headers, params=params, timeout=10)
+                self.latencies.append(time.monotonic() - started)
+                if r.status_code == 304:
+                    self.not_modified += 1
+                elif r.status_code == 200:
+                    version = str(r.json().get("version") or "") or None
+                else:
+                    self.errors += 1
+            except requests.RequestException:
+                self.errors += 1
+            time.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+class Subscriber(threading.Thread):
+    """One phone holding ``/api/packages/stream`` open until ``stop_at``."""
+
+    def __init__(self, url: str, stop_at: float):
+        super().__init__(daemon=True)
+        self.url = url
+        self.stop_at = stop_at
+        self.connected = False
+
+    def run(self) -> None:
+        try:
+            with requests.get(self.url, stream=True, timeout=(10, 30)) as r:
+                self.connected = r.status_code == 200
+                for _ in r.iter_content(chunk_size=None):
+                    if time.monotonic() >= self.stop_at:
+                        break
+        except requests.RequestException:
+            pass
+
+def run(kind: str, args: argparse.Namespace) -> Dict[str, Any]:
+    jd_port, app_port = _free_port(), _free_port()
+    jd = serve("127.0.0.1", jd_port, JDState(args.packages, args.links), args.latency_ms, args.jitter_ms, args.fail_rate)
+    tmp = tempfile.mkdtemp(prefix="jd-mobile-bench-")
+    config_path = os.path.join(tmp, "config.json")
+    _write_config(config_path, f"http://127.0.0.1:{jd_port}", args.app_poll_ms, args.streams)
+    proc = start_app(kind, app_port, config_path, 1 if kind == "dev" else args.workers)
+    try:
+        base = f"http://127.0.0.1:{app_port}"
+        _wait_up(f"{base}/health")
+        requests.get(f"{base}/api/packages", timeout=10)  # warm up the snapshot
+        requests.get(f"http://127.0.0.1:{jd_port}/calls?reset=1", timeout=5)
+
+        subscribers = [Subscriber(f"{base}/api/packages/stream", time.monotonic() + args.duration + 5) for _ in range(args.streams)]
+        for sub in subscribers:
+            sub.start()
+        time.sleep(1.0 if subscribers else 0.0)
+
+        started = time.monotonic()
+        stop_at = started + args.duration
+        clients = [Client(f"{base}/api/packages", args.poll_interval, stop_at, not args.full) for _ in range(args.clients)]
+        for c in clients:
+            c.start()
+        for c in clients:
+            c.join()
+        elapsed = time.monotonic() - started
+        upstream = requests.get(f"http://127.0.0.1:{jd_port}/calls", timeout=5).json()
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        jd.shutdown()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    latencies = sorted(l for c in clients for l in c.latencies)
+    queries = upstream.get("/downloadsV2/queryPackages", 0)
+    return {
+        "server": kind,
+        "workers": 1 if kind == "dev" else args.workers,
+        "clients": args.clients,
+        "streams": sum(1 for sub in subscribers if sub.connected),
+        "duration_s": round(elapsed, 2),
+        "requests": len(latencies),
+        "errors": sum(c.errors for c in clients),
+        "not_modified": sum(c.not_modified for c in clients),
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(_percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 1),
+        "upstream_calls": queries,
+        "upstream_per_client_s": round(queries / (args.clients * elapsed), 4),
+    }
+
+def _print_table(results: List[Dict[str, Any]]) -> None:
+    cols = ["server", "workers", "clients", "streams", "requests", "errors", "throughput_rps", "p50_ms", "p95_ms", "p99_ms", "upstream_per_client_s"]
+    widths = [max(len(c), *(len(str(r[c])) for r in results)) for c in cols]
+    print("  ".join(c.ljust(w) for c, w in zip(cols, widths)))
+    for r in results:
+        print("  ".join(str(r[c]).ljust(w) for c, w in zip(cols, widths)))
+
+def _regressions(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float) -> List[str]:
+    by_server = {b["server"]: b for b in baseline}
+    found = []
+    for r in results:
+        b = by_server.get(r["server"])
+        if b is None:
+            continue
+        for key in ("p95_ms", "p99_ms", "upstream_per_client_s"):
+            if b[key] and r[key] > b[key] * (1 + tolerance):
+                found.append(f"{r['server']}: {key} {b[key]} -> {r[key]}")
+        if b["throughput_rps"] and r["throughput_rps"] < b["throughput_rps"] * (1 - tolerance):
+            found.append(f"{r['server']}: throughput_rps {b['throughput_rps']} -> {r['throughput_rps']}")
+        if r["errors"] > b["errors"]:
+            found.append(f"{r['server']}: errors {b['errors']} -> {r['errors']}")
+    return found
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--server", choices=SERVERS, action="append", help="repeatable; default: all of them")
+    ap.add_argument("--workers", type=int, default=1, help="worker processes for gunicorn/asgi (JD_MOBILE_WORKERS)")
+    ap.add_argument("--clients", type=int, default=20)
+    ap.add_argument("--duration", type=float, default=10.0, help="seconds of load per server")
+    ap.add_argument("--poll-interval", type=float, default=1.0, help="seconds between polls per client")
+    ap.add_argument("--streams", type=int, default=0, help="idle SSE subscribers held open during the run")
+    ap.add_argument("--full", action="store_true", help="always fetch the full list (no ETag/since)")
+    ap.add_argument("--app-poll-ms", type=int, default=2000, help="behavior.poll_interval_ms for the app")
+    ap.add_argument("--packages", type=int, default=500)
+    ap.add_argument("--links", type=int, default=1000)
+    ap.add_argument("--latency-ms", type=float, default=30.0, help="fake JD latency per call")
+    ap.add_argument("--jitter-ms", type=float, default=10.0)
+    ap.add_argument("--fail-rate", type=float, default=0.0)
+    ap.add_argument("--json", action="store_true", help="print results as JSON")
+    ap.add_argument("--baseline", help="JSON from an earlier --json run; exit 1 on regressions")
+    ap.add_argument("--tolerance", type=float, default=0.2)
+    args = ap.parse_args()
+
+    kinds = args.server or SERVERS
+    results = [run(kind, args) for kind in kinds]
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        _print_table(results)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            found = _regressions(results, json.load(f), args.tolerance)
+        for line in found:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if found else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
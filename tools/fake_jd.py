@@ -0,0 +1,226 @@
+"""Fake JDownloader Local API (port 3128) for development and benchmarks.
+
+    python tools/fake_jd.py --port 3128 --packages 2000 --links 5000 --latency-ms 40 --jitter-ms 20 --fail-rate 0.01
+
+Answers ``/help``, ``downloadsV2/queryPackages``, ``downloadsV2/queryLinks``,
+``linkgrabberv2/queryLinks``, ``linkgrabberv2/addLinks``,
+``linkgrabberv2/queryLinkCrawlerJobs``, ``removeLinks``, ``moveToDownloadlist``
+and ``cleanup`` from an in-memory list. Running packages advance on every query,
+so the UI always has something to update. Added links show up in LinkGrabber
+once their crawl job finishes (``--crawl-ms`` later).
+``GET /calls`` returns per-endpoint call counts; ``GET /calls?reset=1`` also
+zeroes them.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+from urllib.parse import parse_qs, urlparse
+
+class JDState:
+    """In-memory download list and LinkGrabber, answering JD2 API actions.
+
+    ``call`` takes the action's positional parameters, each either a decoded
+    value or its JSON encoding (the Local API and MyJD send them differently).
+    """
+
+    def __init__(self, packages: int = 50, links: int = 200, crawl_s: float = 1.0):
+        self.lock = threading.Lock()
+        self.crawl_s = crawl_s
+        # Crawl jobs: links waiting to land in LinkGrabber, and when each job finishes
+        self.jobs: Dict[int, List[Dict[str, Any]]] = {}
+        self.job_done: Dict[int, float] = {}
+        self.packages = [
+            {
+                "name": f"package-{i:05d}",
+                "uuid": 1000 + i,
+                "bytesTotal": 100_000_000,
+                "bytesLoaded": (i * 7_919_000) % 100_000_000,
+                "enabled": True,
+                "running": i % 3 == 0,
+                "finished": i % 5 == 0,
+                "eta": 60 + i,
+                "speed": 250_000 if i % 3 == 0 else 0,
+            }
+            for i in range(packages)
+        ]
+        self.links = [
+            {
+                "name": f"file-{i:05d}.bin",
+                "uuid": 500_000 + i,
+                "packageUUID": 900_000 + i // 10,
+                "url": f"https://host{i % 4}.example/f/{i}",
+                "bytesTotal": 1_000_000 + i,
+                "host": f"host{i % 4}.example",
+                "availability": "ONLINE",
+            }
+            for i in range(links)
+        ]
+        self.next_job = 1
+        self.next_uuid = 600_000
+
+    def _finish_jobs(self) -> None:
+        now = time.monotonic()
+        for job, at in self.job_done.items():
+            if at <= now and self.jobs.get(job):
+                self.links.extend(self.jobs[job])
+                self.jobs[job] = []
+
+    def call(self, path: str, params: List[Any]) -> Any:
+        def arg(i: int, default: Any = None) -> Any:
+            if i >= len(params) or params[i] is None:
+                return default
+            v = params[i]
+            return json.loads(v) if isinstance(v, str) else v
+
+        with self.lock:
+            self._finish_jobs()
+            if path == "/downloadsV2/queryPackages":
+                for p in self.packages:
+                    if p["running"] and not p["finished"]:
+                        p["bytesLoaded"] = min(p["bytesTotal"], p["bytesLoaded"] + p["speed"])
+                return [dict(p) for p in self.packages]
+            if path == "/downloadsV2/queryLinks":
+                q = arg(0, {})
+                start, limit = q.get("startAt", 0), q.get("maxResults", -1)
+                if not q.get("packageUUIDs"):
+                    # Whole download list (used for duplicate checks)
+                    rows = [{"uuid": p["uuid"] * 1000, "url": f"https://dl.example/{p['name']}.rar"} for p in self.packages]
+                    return rows[start:] if limit < 0 else rows[start:start + limit]
+                pkg = q["packageUUIDs"][0]
+                rows = [
+                    {"uuid": pkg * 1000 + i, "name": f"part{i:03d}.rar", "packageUUID": pkg, "host": "host0.example",
+                     "status": "Finished" if i % 2 else "", "speed": 0, "bytesTotal": 10_000_000, "bytesLoaded": 5_000_000,
+                     "finished": bool(i % 2), "running": False}
+                    for i in range(30)
+                ]
+                return rows[start:] if limit < 0 else rows[start:start + limit]
+            if path == "/linkgrabberv2/queryLinks":
+                return [dict(l) for l in self.links]
+            if path == "/linkgrabberv2/addLinks":
+                q = arg(0, {})
+                job, self.next_job = self.next_job, self.next_job + 1
+                crawled = []
+                for url in (q.get("links") or "").split():
+                    self.next_uuid += 1
+                    host = url.split("/")[2] if url.count("/") >= 2 else "unknown"
+                    crawled.append({"name": url.rstrip("/").rsplit("/", 1)[-1] or url, "uuid": self.next_uuid,
+                                    "packageUUID": 990_000 + job, "url": url, "bytesTotal": 1_000_000,
+                                    "host": host, "availability": "ONLINE"})
+                self.jobs[job] = crawled
+                self.job_done[job] = time.monotonic() + self.crawl_s
+                return {"id": job}
+            if path == "/linkgrabberv2/queryLinkCrawlerJobs":
+                q = arg(0, {})
+                now = time.monotonic()
+                out = []
+                for job in q.get("jobIds") or []:
+                    if job not in self.job_done:
+                        continue
+                    busy = self.job_done[job] > now
+                    out.append({"jobId": job, "crawling": busy, "checking": False,
+                                "crawled": len(self.jobs.get(job) or []) if busy else 0})
+                return out
+            if path in ("/downloadsV2/removeLinks", "/downloadsV2/cleanup"):
+                ids = set(arg(1, []))
+                self.packages = [p for p in self.packages if p["uuid"] not in ids]
+                return None
+            if path in ("/linkgrabberv2/removeLinks", "/linkgrabberv2/moveToDownloadlist"):
+                ids = set(arg(0, []))
+                self.links = [l for l in self.links if l["uuid"] not in ids]
+                return None
+        raise KeyError(path)
+
+# Local API actions take named query parameters; MyJD sends the same ones positionally
+PARAM_NAMES: Dict[str, List[str]] = {
+    "/downloadsV2/removeLinks": ["linkIds", "packageIds"],
+    "/downloadsV2/cleanup": ["linkIds", "packageIds", "action", "mode", "selectionType"],
+    "/linkgrabberv2/moveToDownloadlist": ["linkIds", "packageIds"],
+    "/linkgrabberv2/removeLinks": ["linkIds", "packageIds"],
+}
+
+class Handler(BaseHTTPRequestHandler):
+    server_version = "FakeJD/1.0"
+    state: JDState
+    latency_s = 0.0
+    jitter_s = 0.0
+    fail_rate = 0.0
+    calls: Dict[str, int] = {}
+    calls_lock = threading.Lock()
+
+    def log_message(self, *a: Any) -> None:
+        pass
+
+    def _send(self, status: int, body: str, ctype: str = "application/json; charset=utf-8") -> None:
+        b = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(b)))
+        self.end_headers()
+        self.wfile.write(b)
+
+    def do_GET(self) -> None:
+        u = urlparse(self.path)
+        q = parse_qs(u.query)
+        if u.path == "/calls":
+            with self.calls_lock:
+                body = json.dumps(self.calls)
+                if q.get("reset"):
+                    self.calls.clear()
+            return self._send(200, body)
+        with self.calls_lock:
+            self.calls[u.path] = self.calls.get(u.path, 0) + 1
+        time.sleep(max(0.0, self.latency_s + random.uniform(-self.jitter_s, self.jitter_s)))
+        if random.random() < self.fail_rate:
+            return self._send(503, json.dumps({"type": "UNAVAILABLE"}))
+        if u.path == "/help":
+            return self._send(200, "JDownloader API help: /downloadsV2 /linkgrabberv2", "text/plain; charset=utf-8")
+        names = PARAM_NAMES.get(u.path, ["query"])
+        try:
+            data = self.state.call(u.path, [(q.get(n) or [None])[0] for n in names])
+        except KeyError:
+            return self._send(404, json.dumps({"type": "API_COMMAND_NOT_FOUND"}))
+        self._send(200, json.dumps({"data": data}))
+
+def serve(host: str, port: int, state: JDState, latency_ms: float = 0.0, jitter_ms: float = 0.0, fail_rate: float = 0.0) -> ThreadingHTTPServer:
+    """Start the fake API on a background thread (used by tools/bench.py)."""
+    handler = type("BoundHandler", (Handler,), {
+        "state": state,
+        "latency_s": latency_ms / 1000.0,
+        "jitter_s": jitter_ms / 1000.0,
+        "fail_rate": fail_rate,
+        "calls": {},
+        "calls_lock": threading.Lock(),
+    })
+    srv = ThreadingHTTPServer((host, port), handler)
+    srv.daemon_threads = True
+    threading.Thread(target=srv.serve_forever, name=f"fake-jd-{port}", daemon=True).start()
+    return srv
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=3128)
+    ap.add_argument("--packages", type=int, default=50)
+    ap.add_argument("--links", type=int, default=200)
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--jitter-ms", type=float, default=0.0)
+    ap.add_argument("--fail-rate", type=float, default=0.0, help="fraction of calls answered with 503")
+    ap.add_argument("--crawl-ms", type=float, default=1000.0, help="how long a crawl job runs")
+    args = ap.parse_args()
+
+    srv = serve(args.host, args.port, JDState(args.packages, args.links, args.crawl_ms / 1000.0), args.latency_ms, args.jitter_ms, args.fail_rate)
+    print(f"fake JDownloader Local API on http://{args.host}:{args.port} ({args.packages} packages, {args.links} links)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        srv.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""Local stand-in for the MyJDownloader cloud API (api.jdownloader.org) plus one device.
+
+Speaks the real wire protocol (signed /my/* calls, AES-encrypted replies and
+device calls), so ``MyJDProvider`` can be exercised offline:
+
+    python tools/fake_myjd.py --port 18090 --token-ttl 30 --latency-ms 80
+
+and set the instance's fallback to ``"api_url": "http://127.0.0.1:18090"`` with
+the same email/password/device name. ``GET /calls`` returns per-endpoint call
+counts (logins, renewals, device lookups, device actions) as plain JSON.
+"""
+from __future__ import annotations
+
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import random
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qsl, unquote, urlparse
+
+from Crypto.Cipher import AES
+
+from fake_jd import JDState
+
+def _secret(email: str, password: str, domain: str) -> bytes:
+    return hashlib.sha256(email.lower().encode() + password.encode() + domain.encode()).digest()
+
+def _encrypt(key: bytes, data: str) -> str:
+    raw = data.encode()
+    pad = 16 - len(raw) % 16
+    return base64.b64encode(AES.new(key[16:], AES.MODE_CBC, key[:16]).encrypt(raw + bytes([pad]) * pad)).decode()
+
+def _decrypt(key: bytes, data: str) -> str:
+    raw = AES.new(key[16:], AES.MODE_CBC, key[:16]).decrypt(base64.b64decode(data))
+    return raw[: -raw[-1]].decode()
+
+class FakeMyJD:
+    def __init__(self, email: str, password: str, device: str, token_ttl: float, state: JDState):
+        self.email = email.lower()
+        self.login_secret = _secret(email, password, "server")
+        self.device_secret = _secret(email, password, "device")
+        self.device = {"id": secrets.token_hex(16), "name": device, "type": "jd"}
+        self.token_ttl = token_ttl
+        self.state = state
+        self.lock = threading.Lock()
+        # session token -> (server key, device key, regain token, expires at)
+        self.sessions: Dict[str, Tuple[bytes, bytes, str, float]] = {}
+        self.calls: Dict[str, int] = {}
+
+    def count(self, name: str) -> None:
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def new_session(self, server_key: bytes) -> Dict[str, str]:
+        token, regain = secrets.token_hex(32), secrets.token_hex(32)
+        with self.lock:
+            self.sessions[token] = (
+                hashlib.sha256(server_key + bytes.fromhex(token)).digest(),
+                hashlib.sha256(self.device_secret + bytes.fromhex(token)).digest(),
+                regain,
+                time.time() + self.token_ttl,
+            )
+        return {"sessiontoken": token, "regaintoken": regain}
+
+    def session(self, token: str, allow_expired: bool = False) -> Optional[Tuple[bytes, bytes, str, float]]:
+        with self.lock:
+            s = self.sessions.get(token)
+        if s is None or (s[3] < time.time() and not allow_expired):
+            return None
+        return s
+
+class Handler(BaseHTTPRequestHandler):
+    server_version = "FakeMyJD/1.0"
+    api: FakeMyJD
+    latency_s = 0.0
+    jitter_s = 0.0
+    fail_rate = 0.0
+
+    def log_message(self, *a: Any) -> None:
+        pass
+
+    def _send(self, status: int, body: str, ctype: str = "application/json; charset=utf-8") -> None:
+        b = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(b)))
+        self.end_headers()
+        self.wfile.write(b)
+
+    def _error(self, status: int, type_: str, src: str = "MYJD") -> None:
+        self._send(status, json.dumps({"src": src, "type": type_, "data": None}))
+
+    def _delay(self) -> bool:
+        time.sleep(max(0.0, self.latency_s + random.uniform(-self.jitter_s, self.jitter_s)))
+        if random.random() < self.fail_rate:
+            self._error(503, "MAINTENANCE")
+            return False
+        return True
+
+    def do_GET(self) -> None:
+        u = urlparse(self.path)
+        if u.path == "/calls":
+            return self._send(200, json.dumps(self.api.calls))
+        if not self._delay():
+            return
+        api = self.api
+        signed, _, signature = u.query.rpartition("&signature=")
+        params = dict(parse_qsl(signed))
+        rid = int(params.get("rid") or 0)
+        payload = unquote(u.path) + "?" + signed
+        api.count(u.path)
+
+        def check(key: bytes) -> bool:
+            return hmac.compare_digest(hmac.new(key, payload.encode(), hashlib.sha256).hexdigest(), signature)
+
+        if u.path == "/my/connect":
+            if params.get("email", "").lower() != api.email or not check(api.login_secret):
+                return self._error(403, "AUTH_FAILED")
+            return self._send(200, _encrypt(api.login_secret, json.dumps({**api.new_session(api.login_secret), "rid": rid})))
+
+        token = params.get("sessiontoken", "")
+        if u.path == "/my/reconnect":
+            s = api.session(token, allow_expired=True)
+            if s is None or not check(s[0]) or params.get("regaintoken") != s[2]:
+                return self._error(403, "TOKEN_INVALID")
+            with api.lock:
+                api.sessions.pop(token, None)
+            return self._send(200, _encrypt(s[0], json.dumps({**api.new_session(s[0]), "rid": rid})))
+
+        s = api.session(token)
+        if s is None or not check(s[0]):
+            return self._error(403, "TOKEN_INVALID")
+        if u.path == "/my/listdevices":
+            return self._send(200, _encrypt(s[0], json.dumps({"list": [api.device], "rid": rid})))
+        if u.path == "/my/disconnect":
+            with api.lock:
+                api.sessions.pop(token, None)
+            return self._send(200, _encrypt(s[0], json.dumps({"rid": rid})))
+        self._error(404, "UNKNOWN_ENDPOINT")
+
+    def do_POST(self) -> None:
+        if not self._delay():
+            return
+        api = self.api
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0)).decode()
+        # /t_{sessiontoken}_{deviceid}/namespace/action
+        prefix, _, path = self.path.partition("/")[2].partition("/")
+        parts = prefix.split("_")
+        if len(parts) != 3 or parts[0] != "t":
+            return self._error(404, "UNKNOWN_ENDPOINT")
+        s = api.session(parts[1])
+        if s is None:
+            return self._error(403, "TOKEN_INVALID")
+        if parts[2] != api.device["id"]:
+            return self._error(404, "DEVICE_NOT_FOUND")
+        try:
+            req = json.loads(_decrypt(s[1], body))
+        except Exception:
+            return self._error(403, "AUTH_FAILED")
+        path = "/" + path
+        api.count(path)
+        try:
+            data = api.state.call(path, req.get("params") or [])
+        except KeyError:
+            return self._error(404, "API_COMMAND_NOT_FOUND", src="DEVICE")
+        self._send(200, _encrypt(s[1], json.dumps({"data": data, "rid": req.get("rid")})), "application/aesjson-jd; charset=utf-8")
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=18090)
+    ap.add_argument("--email", default="test@example.com")
+    ap.add_argument("--password", default="secret")
+    ap.add_argument("--device", default="JD-Test")
+    ap.add_argument("--packages", type=int, default=50)
+    ap.add_argument("--links", type=int, default=200)
+    ap.add_argument("--token-ttl", type=float, default=3600.0, help="seconds until a session token expires")
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--jitter-ms", type=float, default=0.0)
+    ap.add_argument("--fail-rate", type=float, default=0.0, help="fraction of calls answered with 503")
+    args = ap.parse_args()
+
+    Handler.api = FakeMyJD(args.email, args.password, args.device, args.token_ttl, JDState(args.packages, args.links))
+    Handler.latency_s = args.latency_ms / 1000.0
+    Handler.jitter_s = args.jitter_ms / 1000.0
+    Handler.fail_rate = args.fail_rate
+    srv = ThreadingHTTPServer((args.host, args.port), Handler)
+    print(f"fake MyJDownloader API on http://{args.host}:{args.port} (device '{args.device}')")
+    srv.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Local webhook receiver: prints every JD-Mobile event it gets, one JSON line each.
+
+    python tools/webhook_receiver.py --port 18099
+    python tools/webhook_receiver.py --secret s3cret --fail-rate 0.5   # exercise retries
+
+Point a webhook at it in config.json (``"webhooks": [{"url": "http://127.0.0.1:18099/hook"}]``)
+and send a test event with ``curl -X POST http://<app>/api/webhooks/test``.
+``--fail-rate`` answers that share of deliveries with 503 so the app retries them.
+With ``--secret`` it checks ``X-JD-Mobile-Signature`` and answers 401 on a mismatch.
+``GET /received`` returns everything received so far as a JSON list.
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import hmac
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+
+class Handler(BaseHTTPRequestHandler):
+    secret = ""
+    fail_rate = 0.0
+    received: List[Dict[str, Any]] = []
+    lock = threading.Lock()
+
+    def log_message(self, *a: Any) -> None:
+        pass
+
+    def _send(self, status: int, body: str = "") -> None:
+        b = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(b)))
+        self.end_headers()
+        self.wfile.write(b)
+
+    def do_GET(self) -> None:
+        if self.path != "/received":
+            return self._send(404)
+        with self.lock:
+            body = json.dumps(self.received)
+        self._send(200, body)
+
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.secret:
+            expected = "sha256=" + hmac.new(self.secret.encode(), body, hashlib.sha256).hexdigest()
+            if not hmac.compare_digest(expected, self.headers.get("X-JD-Mobile-Signature", "")):
+                print(f"bad signature on delivery {self.headers.get('X-JD-Mobile-Delivery')}", file=sys.stderr)
+                return self._send(401)
+        if random.random() < self.fail_rate:
+            return self._send(503)
+        try:
+            event = json.loads(body)
+        except ValueError:
+            return self._send(400)
+        with self.lock:
+            self.received.append(event)
+        print(json.dumps(event), flush=True)
+        self._send(204)
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=18099)
+    ap.add_argument("--secret", default="", help="verify X-JD-Mobile-Signature with this secret")
+    ap.add_argument("--fail-rate", type=float, default=0.0, help="fraction of deliveries answered with 503")
+    args = ap.parse_args()
+
+    handler = type("BoundHandler", (Handler,), {"secret": args.secret, "fail_rate": args.fail_rate, "received": []})
+    srv = ThreadingHTTPServer((args.host, args.port), handler)
+    srv.daemon_threads = True
+    threading.Thread(target=srv.serve_forever, name="webhook-receiver", daemon=True).start()
+    print(f"webhook receiver on http://{args.host}:{args.port}/", file=sys.stderr)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        srv.shutdown()
+
+if __name__ == "__main__":
+    main()